@@ -0,0 +1,4 @@
+"""
+Benchmarks for the Rehab System pose pipeline
+Run from the backend directory, e.g. python -m benchmarks.replay recordings/squat.frames
+"""
@@ -0,0 +1,83 @@
+"""
+Benchmark Helpers
+Replay clock, per-stage timing collection and report formatting shared by the benchmarks
+"""
+
+import json
+import time
+from typing import Dict, Iterable, List, Sequence
+
+import numpy as np
+
+from metrics import LOOP_STAGES, WORKER_STAGES, StageTimer
+
+STAGES = ('parse',) + WORKER_STAGES + LOOP_STAGES[1:]
+
+
+class ReplayClock:
+    """Injectable clock (`clock=replay.time`) that returns the timestamp of the frame being replayed"""
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def time(self) -> float:
+        return self.now
+
+
+class CollectingTimer(StageTimer):
+    """StageTimer that keeps every lap in memory instead of feeding the Prometheus histograms"""
+
+    __slots__ = ('laps', 'frames')
+
+    def __init__(self):
+        super().__init__()
+        self.laps: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        self.frames: List[float] = []
+
+    def mark(self, stage: str):
+        self.laps[stage].append(self.lap())
+
+    def record_inference(self, round_trip: float, worker_timings: Sequence[float]):
+        for stage, seconds in zip(WORKER_STAGES, worker_timings):
+            self.laps[stage].append(seconds)
+        self.laps['transfer'].append(max(0.0, round_trip - sum(worker_timings)))
+
+    def finish(self):
+        self.frames.append(time.perf_counter() - self._start)
+
+
+def percentiles(values: Iterable[float], points=(50, 95, 99)) -> Dict[str, float]:
+    """Summary of a list of seconds, in milliseconds"""
+    arr = np.asarray(list(values), dtype=np.float64) * 1000.0
+    if not arr.size:
+        return {}
+    summary = {'n': int(arr.size), 'mean': float(arr.mean())}
+    for p, v in zip(points, np.percentile(arr, points)):
+        summary[f'p{p}'] = float(v)
+    summary['max'] = float(arr.max())
+    return summary
+
+
+def stage_table(laps: Dict[str, List[float]]) -> Dict[str, Dict[str, float]]:
+    return {stage: percentiles(values) for stage, values in laps.items() if values}
+
+
+def print_report(title: str, report: Dict, as_json: bool = False):
+    """Print a report dict as JSON or as a readable table"""
+    if as_json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    print("=" * 60)
+    print(title)
+    print("=" * 60)
+    for key, value in report.items():
+        if key == 'stages_ms':
+            print(f"\n{'stage (ms)':<14}{'n':>7}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+            for stage, s in value.items():
+                print(f"{stage:<14}{s['n']:>7}{s['mean']:>9.3f}{s['p50']:>9.3f}{s['p95']:>9.3f}{s['p99']:>9.3f}{s['max']:>9.3f}")
+            print()
+        elif isinstance(value, float):
+            print(f"{key:<22}{value:.3f}")
+        else:
+            print(f"{key:<22}{value}")
@@ -0,0 +1,290 @@
+"""
+WebSocket Load Generator
+Opens N concurrent exercise sessions against a running backend, streams frames at a fixed fps and
+ramps N until the p95 round-trip latency SLO (or the drop-rate limit) is broken
+
+Round trip = frame send -> analysis response carrying the same seq (compact encoding). Frames the
+server never answers were dropped by its latest-frame-wins ingest. Server CPU comes from /metrics
+(API process + inference workers). REST history/analytics endpoints are exercised in parallel.
+
+    python -m benchmarks.loadgen --url http://localhost:8000 --recording recordings/squat.frames \\
+        --start 2 --step 2 --max 32 --fps 15 --slo-ms 250 --username patient1 --password patient123
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional
+
+import numpy as np
+import websockets
+
+from pose_engine import read_recording
+from pose_engine.protocol import (
+    ANALYSIS_HEADER, FLAG_HAS_SEQ, FORMAT_JPEG, FRAME_HEADER, MSG_ANALYSIS, encode_binary_frame
+)
+
+from .common import percentiles
+
+REST_ENDPOINTS = ('/api/sessions/my-history', '/api/sessions/error-analytics')
+
+
+# ============= FRAME SOURCES =============
+
+def recorded_images(path: str) -> List[bytes]:
+    """Encoded images of a recording, without their frame headers"""
+    return [frame.message[FRAME_HEADER.size:] for frame in read_recording(path).frames]
+
+
+def synthetic_images(count: int = 30, width: int = 640, height: int = 480, quality: int = 80) -> List[bytes]:
+    """JPEG frames the size and quality the browser client sends (no person in them)"""
+    import cv2
+
+    rng = np.random.default_rng(0)
+    base = np.linspace(0, 255, width, dtype=np.uint8)[None, :, None].repeat(height, 0).repeat(3, 2)
+    images = []
+    for i in range(count):
+        frame = base.copy()
+        cv2.circle(frame, (int(width * (0.2 + 0.6 * i / count)), height // 2), 60, (30, 160, 220), -1)
+        frame = cv2.add(frame, rng.integers(0, 20, frame.shape, dtype=np.uint8))
+        ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        images.append(jpeg.tobytes())
+    return images
+
+
+# ============= HTTP HELPERS =============
+
+def _http(method: str, url: str, body: Optional[dict] = None, token: Optional[str] = None, timeout: float = 10.0):
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(url, data=data, method=method)
+    request.add_header('Content-Type', 'application/json')
+    if token:
+        request.add_header('Authorization', f'Bearer {token}')
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.status, response.read()
+
+
+def login(base_url: str, username: str, password: str) -> str:
+    status, body = _http('POST', f'{base_url}/api/auth/login', {'username': username, 'password': password})
+    return json.loads(body)['token']
+
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})?\s+(\S+)$')
+
+
+def scrape_cpu(base_url: str) -> Optional[float]:
+    """API process CPU seconds + inference worker CPU seconds, from /metrics"""
+    try:
+        _, body = _http('GET', f'{base_url}/metrics', timeout=5.0)
+    except (urllib.error.URLError, OSError):
+        return None
+    total = 0.0
+    for line in body.decode().splitlines():
+        match = _SAMPLE.match(line)
+        if match and match.group(1) in ('process_cpu_seconds_total', 'pose_worker_cpu_seconds'):
+            total += float(match.group(3))
+    return total
+
+
+# ============= CLIENTS =============
+
+class StepStats:
+    """Measurements of one ramp step"""
+
+    def __init__(self):
+        self.rtts: List[float] = []
+        self.sent = 0
+        self.answered = 0
+        self.rejected = 0
+        self.failed = 0
+        self.rest_latencies: List[float] = []
+        self.rest_errors = 0
+        self.measuring = False
+
+
+async def run_client(ws_url: str, images: List[bytes], fps: float, stop: asyncio.Event, stats: StepStats):
+    """One patient session: send frames at fps, match responses by seq"""
+    pending: Dict[int, float] = {}
+    try:
+        async with websockets.connect(ws_url, max_size=None) as ws:
+            async def sender():
+                seq = 0
+                interval = 1.0 / fps
+                next_send = time.perf_counter()
+                while not stop.is_set():
+                    image = images[seq % len(images)]
+                    pending[seq] = time.perf_counter()
+                    await ws.send(encode_binary_frame(seq, time.time() * 1000.0, image, FORMAT_JPEG))
+                    if stats.measuring:
+                        stats.sent += 1
+                    seq += 1
+                    next_send += interval
+                    await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+
+            async def receiver():
+                async for message in ws:
+                    now = time.perf_counter()
+                    if isinstance(message, str):
+                        if json.loads(message).get('type') == 'error':
+                            stats.rejected += 1
+                            return
+                        continue
+                    msg_type, flags, seq = ANALYSIS_HEADER.unpack_from(message)[:3]
+                    if msg_type != MSG_ANALYSIS or not flags & FLAG_HAS_SEQ:
+                        continue
+                    sent_at = pending.pop(seq, None)
+                    # Older frames were dropped by the server (latest-frame-wins)
+                    for old in [s for s in pending if s < seq]:
+                        del pending[old]
+                    if sent_at is not None and stats.measuring:
+                        stats.answered += 1
+                        stats.rtts.append(now - sent_at)
+
+            tasks = [asyncio.create_task(sender()), asyncio.create_task(receiver())]
+            stopper = asyncio.create_task(stop.wait())
+            await asyncio.wait(tasks + [stopper], return_when=asyncio.FIRST_COMPLETED)
+            for task in tasks + [stopper]:
+                task.cancel()
+    except (OSError, websockets.WebSocketException):
+        stats.failed += 1
+
+
+async def run_rest_client(base_url: str, token: str, interval: float, stop: asyncio.Event, stats: StepStats):
+    """Poll the history/analytics endpoints like a dashboard would"""
+    loop = asyncio.get_running_loop()
+    i = 0
+    while not stop.is_set():
+        path = REST_ENDPOINTS[i % len(REST_ENDPOINTS)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            await loop.run_in_executor(None, _http, 'GET', f'{base_url}{path}', None, token)
+            if stats.measuring:
+                stats.rest_latencies.append(time.perf_counter() - start)
+        except (urllib.error.URLError, OSError):
+            if stats.measuring:
+                stats.rest_errors += 1
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_step(args, clients: int, images: List[bytes], token: Optional[str]) -> Dict:
+    """Run `clients` sessions for warmup + duration seconds and summarize the measured window"""
+    base = args.url.rstrip('/')
+    ws_url = base.replace('http', 'ws', 1) + f'/ws/exercise/{args.exercise}?encoding=compact'
+
+    stats = StepStats()
+    stop = asyncio.Event()
+    tasks = [asyncio.create_task(run_client(ws_url, images, args.fps, stop, stats)) for _ in range(clients)]
+    if token:
+        tasks += [asyncio.create_task(run_rest_client(base, token, args.rest_interval, stop, stats))
+                  for _ in range(args.rest_clients)]
+
+    await asyncio.sleep(args.warmup)
+    loop = asyncio.get_running_loop()
+    cpu_start = await loop.run_in_executor(None, scrape_cpu, base)
+    stats.measuring = True
+    t0 = time.perf_counter()
+    await asyncio.sleep(args.duration)
+    stats.measuring = False
+    wall = time.perf_counter() - t0
+    cpu_end = await loop.run_in_executor(None, scrape_cpu, base)
+
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    rtt = percentiles(stats.rtts)
+    rest = percentiles(stats.rest_latencies)
+    return {
+        'clients': clients,
+        'sent': stats.sent,
+        'answered': stats.answered,
+        'answered_fps': stats.answered / wall,
+        'drop_rate': 1.0 - stats.answered / stats.sent if stats.sent else 0.0,
+        'rejected': stats.rejected,
+        'failed': stats.failed,
+        'rtt_p50_ms': rtt.get('p50'),
+        'rtt_p95_ms': rtt.get('p95'),
+        'rtt_p99_ms': rtt.get('p99'),
+        'server_cpu_cores': (cpu_end - cpu_start) / wall if cpu_start is not None and cpu_end is not None else None,
+        'rest_p95_ms': rest.get('p95'),
+        'rest_errors': stats.rest_errors,
+    }
+
+
+def _slo_ok(args, result: Dict) -> bool:
+    return (
+        result['rtt_p95_ms'] is not None
+        and result['rtt_p95_ms'] <= args.slo_ms
+        and result['drop_rate'] <= args.max_drop
+        and not result['rejected']
+        and not result['failed']
+    )
+
+
+def _fmt(value: Optional[float], width: int) -> str:
+    return f"{value:>{width}.1f}" if value is not None else '-'.rjust(width)
+
+
+async def ramp(args) -> List[Dict]:
+    images = recorded_images(args.recording) if args.recording else synthetic_images()
+    token = args.token
+    if not token and args.username:
+        token = login(args.url.rstrip('/'), args.username, args.password)
+
+    print(f"{'clients':>7}{'fps':>8}{'drop':>7}{'p50':>8}{'p95':>8}{'p99':>8}{'cpu':>6}{'rest95':>8}  SLO")
+    results = []
+    clients = args.start
+    while clients <= args.max:
+        result = await run_step(args, clients, images, token)
+        result['slo_ok'] = _slo_ok(args, result)
+        results.append(result)
+        print(f"{clients:>7}{result['answered_fps']:>8.1f}{result['drop_rate']:>7.2f}"
+              f"{_fmt(result['rtt_p50_ms'], 8)}{_fmt(result['rtt_p95_ms'], 8)}{_fmt(result['rtt_p99_ms'], 8)}"
+              f"{_fmt(result['server_cpu_cores'], 6)}{_fmt(result['rest_p95_ms'], 8)}"
+              f"  {'ok' if result['slo_ok'] else 'BROKEN'}", flush=True)
+        if not result['slo_ok']:
+            break
+        clients += args.step
+
+    passing = [r['clients'] for r in results if r['slo_ok']]
+    print(f"\nMax clients within p95 <= {args.slo_ms:.0f} ms and drop <= {args.max_drop:.0%}: "
+          f"{max(passing) if passing else 0}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--exercise', default='squat')
+    parser.add_argument('--recording', help="Frame recording to stream (synthetic JPEGs if omitted)")
+    parser.add_argument('--fps', type=float, default=15.0, help="Frames per second per client")
+    parser.add_argument('--start', type=int, default=1)
+    parser.add_argument('--step', type=int, default=1)
+    parser.add_argument('--max', type=int, default=64)
+    parser.add_argument('--warmup', type=float, default=3.0, help="Seconds before measuring each step")
+    parser.add_argument('--duration', type=float, default=15.0, help="Measured seconds per step")
+    parser.add_argument('--slo-ms', type=float, default=250.0, help="p95 round-trip latency SLO")
+    parser.add_argument('--max-drop', type=float, default=0.5, help="Highest acceptable share of unanswered frames")
+    parser.add_argument('--token', help="JWT for the REST load")
+    parser.add_argument('--username', help="Log in to get a JWT for the REST load")
+    parser.add_argument('--password')
+    parser.add_argument('--rest-clients', type=int, default=2)
+    parser.add_argument('--rest-interval', type=float, default=1.0, help="Seconds between requests per REST client")
+    parser.add_argument('--json', help="Also write the step results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(ramp(args))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Video to Frame Recording
+Converts a video file into a frame recording as the browser client would have sent it (JPEG, 640x480)
+
+    python -m benchmarks.record_video patient_squat.mp4 recordings/squat.frames --exercise squat --fps 15
+"""
+
+import argparse
+
+import cv2
+
+from pose_engine import FrameRecorder
+from pose_engine.protocol import FORMAT_JPEG, encode_binary_frame
+
+
+def record_video(video_path: str, output: str, exercise_type: str, fps: float = 15.0,
+                 width: int = 640, height: int = 480, quality: int = 80) -> int:
+    """
+    Write every video frame at the client's send rate into a recording
+
+    Returns:
+        Number of frames recorded
+    """
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise SystemExit(f"Cannot open video {video_path}")
+
+    source_fps = capture.get(cv2.CAP_PROP_FPS) or fps
+    step = max(1.0, source_fps / fps)  # Skip source frames to match the send rate
+    recorder = FrameRecorder(output, exercise_type)
+    start = 1_700_000_000.0  # Fixed base timestamp keeps recordings reproducible
+
+    index = 0
+    next_frame = 0.0
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            if index >= next_frame:
+                next_frame += step
+                frame = cv2.resize(frame, (width, height))
+                ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+                if ok:
+                    t = index / source_fps
+                    recorder.write(
+                        encode_binary_frame(recorder.frames, (start + t) * 1000.0, jpeg.tobytes(), FORMAT_JPEG),
+                        start + t
+                    )
+            index += 1
+    finally:
+        capture.release()
+        recorder.close()
+
+    return recorder.frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('video')
+    parser.add_argument('output')
+    parser.add_argument('--exercise', required=True)
+    parser.add_argument('--fps', type=float, default=15.0, help="Client send rate to simulate")
+    parser.add_argument('--quality', type=int, default=80, help="JPEG quality (client uses 0.8)")
+    args = parser.parse_args()
+
+    frames = record_video(args.video, args.output, args.exercise, args.fps, quality=args.quality)
+    print(f"Recorded {frames} frames to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
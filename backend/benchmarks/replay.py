@@ -0,0 +1,153 @@
+"""
+Frame Replay Benchmark
+Replays a recorded frame stream through decode -> pose -> AngleCalculator -> RepetitionCounter -> ErrorDetector
+with no network, and reports frames/sec, per-stage percentiles and the final rep/error counts
+
+Record real sessions by starting the server with POSE_RECORD_DIR=recordings, or convert a video
+with benchmarks/record_video.py. Then, from the backend directory:
+
+    python -m benchmarks.replay recordings/squat_20250101-120000_1234-1.frames
+    python -m benchmarks.replay recording.frames --pool --json > before.json
+
+Every recorded frame is analysed (no latest-frame-wins dropping) and the counters run on the
+frames' own timestamps (capture time, else the recorded receive time), exactly as the server does,
+so rep counts and hold/error timings match the original session at any replay speed.
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Dict, Optional
+
+from pose_engine import (
+    ExerciseSession, PoseInferencePool, encode_analysis, frame_timestamp, parse_binary_frame, read_recording
+)
+from pose_engine import inference
+
+from .common import CollectingTimer, ReplayClock, print_report, stage_table
+
+
+class _InProcessPose:
+    """Runs the worker's inference function in this process (no IPC)"""
+
+    def __init__(self, model_complexity: int):
+        inference._init_worker(1, model_complexity, 0.5, 0.5)
+
+    async def process(self, img_data: bytes, offset: int = 0):
+        return inference._run_inference(0, img_data, offset)
+
+    def close(self):
+        pass
+
+
+class _PooledPose:
+    """Goes through a one-worker PoseInferencePool, like the server"""
+
+    def __init__(self, model_complexity: int):
+        self.pool = PoseInferencePool(workers=1, graphs_per_worker=1, model_complexity=model_complexity)
+        self.lease = None
+
+    async def process(self, img_data: bytes, offset: int = 0):
+        if self.lease is None:
+            self.lease = await self.pool.acquire()
+        return await self.lease.process(img_data, offset)
+
+    def close(self):
+        self.pool.shutdown()
+
+
+async def replay(path: str, exercise_type: Optional[str] = None, use_pool: bool = False,
+                 model_complexity: int = 1, repeat: int = 1) -> Dict:
+    """
+    Replay a recording and collect the benchmark report
+
+    Args:
+        path: Recording file
+        exercise_type: Override the exercise stored in the recording
+        use_pool: Run inference in a worker process (includes IPC) instead of in-process
+        model_complexity: MediaPipe model complexity
+        repeat: Replay the stream this many times (fresh session each time)
+    """
+    recording = read_recording(path)
+    exercise_type = exercise_type or recording.exercise_type
+    frames = recording.frames
+    if not frames:
+        raise SystemExit(f"{path}: recording has no frames")
+
+    pose = _PooledPose(model_complexity) if use_pool else _InProcessPose(model_complexity)
+    timer = CollectingTimer()
+    clock = ReplayClock(frames[0].received_at)
+    counts = {'frames': 0, 'undecodable': 0, 'pose_detected': 0}
+
+    try:
+        # Warm-up frame so graph initialisation is not counted
+        first = parse_binary_frame(frames[0].message)
+        await pose.process(first.data, first.offset)
+
+        wall_start = time.perf_counter()
+        for _ in range(repeat):
+            clock.now = frames[0].received_at
+            session = ExerciseSession(exercise_type, clock=clock.time)
+            for frame in frames:
+                clock.now = frame.received_at  # Stands in for the server's receive time
+                timer.start()
+
+                msg = parse_binary_frame(frame.message)
+                timer.mark('parse')
+
+                result = await pose.process(msg.data, msg.offset)
+                timer.record_inference(timer.lap(), result.timings)
+                counts['frames'] += 1
+
+                if not result.frame_ok:
+                    counts['undecodable'] += 1
+                    continue
+
+                response = {'type': 'analysis', 'pose_detected': False}
+                if result.landmarks is not None:
+                    counts['pose_detected'] += 1
+                    response = session.analyze(result.landmarks, timer, frame_timestamp(msg))
+
+                encode_analysis(response, result.landmarks)
+                timer.mark('encode')
+                timer.finish()
+        wall = time.perf_counter() - wall_start
+    finally:
+        pose.close()
+
+    rep_counter = session.rep_counter
+    duration = frames[-1].received_at - frames[0].received_at
+    return {
+        'recording': str(path),
+        'exercise': exercise_type,
+        'inference': 'pool' if use_pool else 'in-process',
+        'frames': counts['frames'],
+        'recorded_fps': (len(frames) - 1) / duration if duration > 0 else 0.0,
+        'replay_fps': counts['frames'] / wall if wall > 0 else 0.0,
+        'wall_seconds': wall,
+        'undecodable': counts['undecodable'],
+        'pose_detected_ratio': counts['pose_detected'] / counts['frames'],
+        'rep_count': rep_counter.rep_count,
+        'error_summary': rep_counter.get_error_summary(),
+        'rep_errors': rep_counter.all_rep_errors,
+        'frame_ms': stage_table({'frame': timer.frames}).get('frame', {}),
+        'stages_ms': stage_table(timer.laps),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('recording', help="Frame recording (.frames)")
+    parser.add_argument('--exercise', help="Override the recorded exercise type")
+    parser.add_argument('--pool', action='store_true', help="Run inference in a worker process like the server")
+    parser.add_argument('--model-complexity', type=int, default=1, choices=(0, 1, 2))
+    parser.add_argument('--repeat', type=int, default=1, help="Replay the stream N times")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(replay(args.recording, args.exercise, args.pool, args.model_complexity, args.repeat))
+    print_report(f"Replay: {report['recording']} ({report['exercise']})", report, args.json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Session Re-scoring Job
+Re-scores stored session tracks with candidate thresholds, in one vectorized batch, and reports
+the recomputed accuracy next to a frame-by-frame replay of the same tracks (timing + equality)
+
+    python -m benchmarks.rescore ~/.rehab_system/session_tracks/*.track --exercise squat --down 150 --up 100
+    python -m benchmarks.rescore ~/.rehab_system/session_tracks/*.track --exercise arm_raise --repeat 100 --json
+"""
+
+import argparse
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from pose_engine import SessionAngles, load_session_angles, rescore_sessions
+
+from .common import print_report
+
+
+def rescore(paths: List[str], exercise_type: str, down_angle: Optional[float] = None,
+            up_angle: Optional[float] = None, repeat: int = 1) -> Dict:
+    """
+    Re-score track files of one exercise
+
+    Args:
+        paths: Track files (<session_id>.track); other exercises are skipped
+        exercise_type: Exercise to re-score
+        down_angle: Candidate down threshold
+        up_angle: Candidate up threshold
+        repeat: Score every track this many times (simulates a larger history)
+    """
+    sessions: List[SessionAngles] = []
+    for path in paths:
+        session = load_session_angles(Path(path).stem, path)
+        if session.exercise_type == exercise_type:
+            sessions.append(session)
+    sessions = sessions * max(1, repeat)
+    frames = sum(len(s.times) for s in sessions)
+
+    t0 = time.perf_counter()
+    result = rescore_sessions(sessions, exercise_type, down_angle, up_angle)
+    vectorized = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    reference = rescore_sessions(sessions, exercise_type, down_angle, up_angle, vectorized=False)
+    per_frame = time.perf_counter() - t0
+
+    return {
+        'exercise': exercise_type,
+        'thresholds': result['thresholds'],
+        'thresholds_applied': result['thresholds_applied'],
+        'sessions': len(sessions),
+        'frames': frames,
+        **{key: value for key, value in result['summary'].items() if key != 'sessions'},
+        'vectorized_seconds': vectorized,
+        'per_frame_seconds': per_frame,
+        'speedup': per_frame / vectorized if vectorized > 0 else 0.0,
+        'matches_per_frame': result['sessions'] == reference['sessions'],
+        'per_session': result['sessions'] if repeat <= 1 else '(omitted with --repeat)',
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('tracks', nargs='+', help="Session track files (.track)")
+    parser.add_argument('--exercise', required=True)
+    parser.add_argument('--down', type=float, help="Candidate down_angle")
+    parser.add_argument('--up', type=float, help="Candidate up_angle")
+    parser.add_argument('--repeat', type=int, default=1, help="Score the tracks N times over")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = rescore(args.tracks, args.exercise, args.down, args.up, args.repeat)
+    print_report(f"Re-score: {report['exercise']} ({report['sessions']} sessions)", report, args.json)
+    if not report['matches_per_frame']:
+        raise SystemExit("Vectorized and per-frame re-scoring disagree")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+"""
+Synthetic Landmark Benchmark
+Drives RepetitionCounter and ErrorDetector with generated landmark trajectories, far faster than
+real time, and checks the rep counts (and expected errors) of every scenario
+
+Scenarios per exercise: sinusoidal reps, noisy holds, partial reps and lost tracking (dropped frames
+and gaps), plus exercise-specific ones. Landmarks are built geometrically so that AngleCalculator
+returns the requested joint angles; angles are computed once up front, so the timed loop measures
+only the state-machine layer (no MediaPipe, no NumPy).
+
+    python -m benchmarks.synthetic
+    python -m benchmarks.synthetic --exercise squat --repeat 50 --json
+"""
+
+import argparse
+import sys
+import time
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
+
+import numpy as np
+
+from pose_engine import AngleCalculator, ErrorDetector, PoseLandmark as L, RepetitionCounter
+
+from .common import ReplayClock, print_report
+
+FPS = 30.0
+
+# Neutral joint angles (degrees) used when a trajectory does not set a joint
+NEUTRAL = {
+    'shoulder': 20.0,
+    'elbow': 175.0,
+    'knee': 178.0,
+    'ankle': 100.0,
+    'leg_behind': 0.0,
+}
+
+
+def _rotate(v: np.ndarray, degrees: float) -> np.ndarray:
+    r = np.radians(degrees)
+    c, s = np.cos(r), np.sin(r)
+    return np.array([c * v[0] - s * v[1], s * v[0] + c * v[1]])
+
+
+def _unit(v: np.ndarray) -> np.ndarray:
+    return v / np.hypot(v[0], v[1])
+
+
+def build_landmarks(joints: Dict[str, float]) -> np.ndarray:
+    """
+    Place a (33, 4) skeleton whose joint angles match `joints`
+
+    Keys are '<side>_<joint>' with joint in shoulder, elbow, knee, ankle (degrees)
+    or leg_behind (knee.z - hip.z); missing joints take NEUTRAL values.
+    """
+    lm = np.zeros((33, 4), dtype=np.float32)
+    lm[:, 3] = 1.0  # visibility
+
+    for side, x, sign in (('left', 0.55, 1.0), ('right', 0.45, -1.0)):
+        def joint(name):
+            return joints.get(f'{side}_{name}', NEUTRAL[name])
+
+        p = {}
+        p['shoulder'] = np.array([x, 0.30])
+        p['hip'] = np.array([x, 0.55])
+        # Arm: angle at the shoulder between the torso (towards the hip) and the upper arm
+        p['elbow'] = p['shoulder'] + 0.15 * _rotate(_unit(p['hip'] - p['shoulder']), sign * joint('shoulder'))
+        p['wrist'] = p['elbow'] + 0.14 * _rotate(_unit(p['shoulder'] - p['elbow']), sign * joint('elbow'))
+        # Leg: thigh straight down, then knee and ankle angles along the chain
+        p['knee'] = p['hip'] + np.array([0.0, 0.20])
+        p['ankle'] = p['knee'] + 0.20 * _rotate(_unit(p['hip'] - p['knee']), sign * joint('knee'))
+        shin = _unit(p['knee'] - p['ankle'])
+        p['foot_index'] = p['ankle'] + 0.07 * _rotate(shin, sign * joint('ankle'))
+        p['heel'] = p['ankle'] - 0.02 * _unit(p['foot_index'] - p['ankle'])
+
+        for name, xy in p.items():
+            lm[L[f'{side.upper()}_{name.upper()}'], :2] = xy
+        lm[L[f'{side.upper()}_KNEE'], 2] = joint('leg_behind')
+
+    return lm
+
+
+# ============= TRAJECTORIES =============
+
+def cycle(rest: float, peak: float, reps: int, move_s: float = 1.0, hold_peak_s: float = 0.3,
+          hold_rest_s: float = 0.5, lead_s: float = 0.5) -> Iterator[float]:
+    """Metric value per frame: rest -> peak (cosine ease) -> hold -> rest -> hold, `reps` times"""
+    move = int(move_s * FPS)
+    ease = 0.5 - 0.5 * np.cos(np.linspace(0.0, np.pi, move))
+    yield from [rest] * int(lead_s * FPS)
+    for _ in range(reps):
+        yield from rest + (peak - rest) * ease
+        yield from [peak] * int(hold_peak_s * FPS)
+        yield from peak + (rest - peak) * ease
+        yield from [rest] * int(hold_rest_s * FPS)
+
+
+def hold_sides(reps: int, hold_s: float = 3.5, knee: float = 40.0, behind: float = 0.10) -> Iterator[Dict[str, float]]:
+    """single_leg_stand: stand, hold left, lower, wait, hold right, lower, wait for the rep pause"""
+    stand = {'left_knee': 178.0, 'right_knee': 178.0, 'left_leg_behind': 0.0, 'right_leg_behind': 0.0}
+    yield from [stand] * int(1.0 * FPS)
+    for _ in range(reps):
+        for side in ('left', 'right'):
+            lifted = dict(stand, **{f'{side}_knee': knee, f'{side}_leg_behind': behind})
+            yield from [lifted] * int(hold_s * FPS)
+            yield from [stand] * int(2.5 * FPS)
+        yield from [stand] * int(1.0 * FPS)  # Together with the last 2.5 s: > 3 s complete pause
+
+
+def _both(left: str, right: str, offset: float, extra: Optional[Dict[str, float]] = None) -> Callable:
+    """Map the counter metric to both sides; the other side is `offset` away on the non-limiting side"""
+    extra = extra or {}
+    return lambda v: {left: v, right: v + offset, **extra}
+
+
+# Counter metric -> joint angles, per exercise
+SQUAT = _both('left_knee', 'right_knee', -2.0)          # Metric is max(knees)
+ARM_RAISE = _both('left_shoulder', 'right_shoulder', 2.0)  # Metric is min(shoulders)
+CALF_RAISE = _both('left_ankle', 'right_ankle', 2.0, {'left_knee': 178.0, 'right_knee': 178.0})
+
+
+class Scenario(NamedTuple):
+    name: str
+    exercise: str
+    frames: List[Optional[Dict[str, float]]]  # None = no pose detected this frame
+    expected_reps: int
+    expected_errors: Dict[str, int] = {}
+
+
+def _frames(values: Iterator, to_joints: Callable = None, noise: float = 0.0,
+            drop: float = 0.0, gap: Optional[tuple] = None, seed: int = 0) -> List[Optional[Dict[str, float]]]:
+    rng = np.random.default_rng(seed)
+    frames: List[Optional[Dict[str, float]]] = []
+    for i, v in enumerate(values):
+        joints = dict(to_joints(float(v))) if to_joints else dict(v)
+        if noise:
+            for k in joints:
+                joints[k] += rng.normal(0.0, noise * (0.005 if k.endswith('behind') else 1.0))
+        if (drop and rng.random() < drop) or (gap and gap[0] <= i < gap[1]):
+            joints = None  # Lost tracking: the server skips the counter for this frame
+        frames.append(joints)
+    return frames
+
+
+def build_scenarios(reps: int = 10) -> List[Scenario]:
+    scenarios = []
+    cycles = {
+        # exercise: (rest, peak, metric -> joints)
+        'squat': (175.0, 80.0, SQUAT),
+        'arm_raise': (20.0, 170.0, ARM_RAISE),
+        'calf_raise': (100.0, 150.0, CALF_RAISE),
+    }
+    for exercise, (rest, peak, joints) in cycles.items():
+        partial_peak = rest + 0.45 * (peak - rest)
+        lost_gap = (int(3.0 * FPS), int(4.5 * FPS))
+        scenarios += [
+            Scenario('reps', exercise, _frames(cycle(rest, peak, reps), joints, noise=1.0), reps),
+            Scenario('noisy_holds', exercise,
+                     _frames(cycle(rest, peak, reps, hold_peak_s=1.5, hold_rest_s=1.5), joints, noise=2.0), reps),
+            Scenario('partial_reps', exercise, _frames(cycle(rest, partial_peak, reps), joints, noise=1.0), 0),
+            Scenario('lost_tracking', exercise,
+                     _frames(cycle(rest, peak, reps, hold_peak_s=2.0), joints, noise=1.0, drop=0.25, gap=lost_gap), reps),
+        ]
+
+    # Bent elbows held at the top for > 3 s: one recorded error per rep
+    bent = _both('left_shoulder', 'right_shoulder', 2.0, {'left_elbow': 140.0, 'right_elbow': 140.0})
+    half = reps // 2
+    scenarios.append(Scenario('bent_elbows', 'arm_raise',
+                              _frames(cycle(20.0, 170.0, half, hold_peak_s=4.0), bent, noise=1.0), half,
+                              {'Tay không thẳng': half}))
+
+    few = max(1, reps // 3)
+    scenarios += [
+        Scenario('holds', 'single_leg_stand', _frames(hold_sides(few)), few),
+        Scenario('noisy_holds', 'single_leg_stand', _frames(hold_sides(few), noise=3.0), few),
+        Scenario('short_holds', 'single_leg_stand', _frames(hold_sides(few, hold_s=2.0)), 0),
+        Scenario('lost_tracking', 'single_leg_stand', _frames(hold_sides(few), drop=0.25, seed=1), few),
+    ]
+    return scenarios
+
+
+# ============= RUNNER =============
+
+def run_scenario(scenario: Scenario, repeat: int) -> Dict:
+    """Check one scenario, then time `repeat` passes of its frames through the counter and detector"""
+    calc = AngleCalculator(scenario.exercise)
+    landmarks = [build_landmarks(j) if j is not None else None for j in scenario.frames]
+
+    t0 = time.perf_counter()
+    angles = [dict(calc.get_angles(lm)) if lm is not None else None for lm in landmarks]
+    angle_seconds = time.perf_counter() - t0
+    detected = [(i, lm, a) for i, (lm, a) in enumerate(zip(landmarks, angles)) if a is not None]
+
+    clock = ReplayClock()
+    updates = 0
+    elapsed = 0.0
+    for _ in range(max(1, repeat)):
+        clock.now = 0.0
+        counter = RepetitionCounter(scenario.exercise, clock=clock.time)
+        detector = ErrorDetector(scenario.exercise, clock=clock.time)
+        prev_rep_count = 0
+
+        t0 = time.perf_counter()
+        for i, lm, a in detected:
+            now = i / FPS
+            rep_count = counter.update(a, now)
+            if rep_count > prev_rep_count:
+                detector.reset_timers()
+                prev_rep_count = rep_count
+            detector.detect_errors(lm, a, counter.get_state(), counter, now)
+        elapsed += time.perf_counter() - t0
+        updates += len(detected)
+
+    errors = counter.get_error_summary()
+    reps_ok = counter.rep_count == scenario.expected_reps
+    errors_ok = all(errors.get(name, 0) == n for name, n in scenario.expected_errors.items())
+
+    return {
+        'exercise': scenario.exercise,
+        'scenario': scenario.name,
+        'frames': len(scenario.frames),
+        'pose_frames': len(detected),
+        'reps': counter.rep_count,
+        'expected_reps': scenario.expected_reps,
+        'errors': errors,
+        'ok': reps_ok and errors_ok,
+        'updates_per_sec': updates / elapsed if elapsed > 0 else 0.0,
+        'angles_per_sec': len(detected) / angle_seconds if angle_seconds > 0 else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--exercise', help="Only run scenarios of this exercise")
+    parser.add_argument('--reps', type=int, default=10, help="Reps per cycle scenario")
+    parser.add_argument('--repeat', type=int, default=20, help="Timed passes per scenario")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args()
+
+    scenarios = [s for s in build_scenarios(args.reps) if not args.exercise or s.exercise == args.exercise]
+    results = [run_scenario(s, args.repeat) for s in scenarios]
+
+    total_updates = sum(r['pose_frames'] for r in results) * args.repeat
+    total_seconds = sum(r['pose_frames'] * args.repeat / r['updates_per_sec'] for r in results if r['updates_per_sec'])
+    failed = [r for r in results if not r['ok']]
+
+    if args.json:
+        print_report('', {'scenarios': results, 'updates_per_sec': total_updates / total_seconds,
+                          'failed': len(failed)}, as_json=True)
+    else:
+        print(f"{'exercise':<18}{'scenario':<15}{'frames':>7}{'reps':>6}{'exp':>5}{'updates/s':>12}{'angles/s':>11}  ok")
+        for r in results:
+            print(f"{r['exercise']:<18}{r['scenario']:<15}{r['frames']:>7}{r['reps']:>6}{r['expected_reps']:>5}"
+                  f"{r['updates_per_sec']:>12.0f}{r['angles_per_sec']:>11.0f}  {'OK' if r['ok'] else 'FAIL'}")
+            if r['errors']:
+                print(f"{'':<33}errors: {r['errors']}")
+        print(f"\nOverall: {total_updates / total_seconds:.0f} updates/s, {len(failed)} failed")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,7 @@
-import mysql.connector
-from mysql.connector import Error
+from db import pool
 
-DB_CONFIG = {
-    "host": "localhost",
-    "user": "root",
-    "password": "123456",
-    "database": "rehab_v3"
-}
-conn = mysql.connector.connect(**DB_CONFIG)
-cursor = conn.cursor(dictionary=True)
+conn = pool.connect()
+cursor = conn.cursor()
 
 cursor.execute('SELECT id, exercise_name, total_reps, correct_reps, accuracy FROM sessions ORDER BY id DESC LIMIT 5')
 print('\n Last 5 sessions in database:')
@@ -18,10 +11,10 @@ for row in cursor.fetchall():
 
 print('\n Checking session errors:')
 cursor.execute('''
-    SELECT s.id, s.exercise_name, s.total_reps, GROUP_CONCAT(se.error_name || '(' || se.count || ')', ', ') as errors
-    FROM sessions s
+    SELECT s.id, s.exercise_name, s.total_reps, GROUP_CONCAT(CONCAT(se.error_name, '(', se.count, ')') SEPARATOR ', ') as errors
+    FROM (SELECT id FROM sessions ORDER BY id DESC LIMIT 3) latest
+    JOIN sessions s ON s.id = latest.id
     LEFT JOIN session_errors se ON s.id = se.session_id
-    WHERE s.id IN (SELECT id FROM sessions ORDER BY id DESC LIMIT 3)
     GROUP BY s.id
     ORDER BY s.id DESC
 ''')
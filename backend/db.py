@@ -0,0 +1,206 @@
+"""
+Database Connection Pool
+Process-wide pool of MySQL connections shared by the API routes, the session writer and the
+management scripts, so a short query does not pay for a TCP connection and handshake
+
+    conn = pool.connect()        # checked out of the pool (opened if none is idle)
+    ...
+    conn.close()                 # rolled back and returned to the pool, not closed
+
+- At most `size` connections exist; connect() waits up to `timeout` seconds for one to be
+  returned, then raises PoolTimeout.
+- A connection idle for longer than `ping_after` seconds is pinged before it is handed out, and
+  replaced if the server dropped it (wait_timeout, restart).
+- A connection older than `recycle` seconds is closed and replaced at checkout.
+- Returned connections are rolled back, so no transaction or snapshot carries over to the next
+  user; a connection that cannot be rolled back is discarded.
+
+Settings come from the environment: DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_RECYCLE and
+DB_POOL_PING_AFTER.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+import mysql.connector
+
+from metrics import Counter, Gauge, Histogram
+
+DB_CONFIG = {
+    "host": "localhost",
+    "user": "root", # use your MySQL username
+    "password": "123456", # use your MySQL password
+    "database": "rehab_v3"
+    }
+
+DB_POOL_IN_USE = Gauge('db_pool_connections_in_use', 'Pooled database connections checked out')
+DB_POOL_IDLE = Gauge('db_pool_connections_idle', 'Pooled database connections waiting to be reused')
+DB_POOL_WAIT_SECONDS = Histogram('db_pool_wait_seconds', 'Time to check a connection out of the pool')
+DB_POOL_OPENED = Counter('db_pool_connections_opened_total', 'Database connections opened by the pool')
+DB_POOL_DISCARDED = Counter(
+    'db_pool_connections_discarded_total', 'Pooled connections closed instead of reused', ('reason',)
+)
+DB_POOL_TIMEOUTS = Counter('db_pool_checkout_timeouts_total', 'Checkouts that gave up waiting for a free connection')
+
+# Pre-created so the metrics are exported before the first checkout
+for _metric in (DB_POOL_IN_USE, DB_POOL_IDLE, DB_POOL_WAIT_SECONDS, DB_POOL_OPENED, DB_POOL_TIMEOUTS):
+    _metric.labels()
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection became free within the pool timeout"""
+
+
+class PooledConnection:
+    """
+    A checked-out connection; behaves like the MySQL connection, except that close() returns
+    it to the pool (also on garbage collection, should a caller forget)
+    """
+
+    def __init__(self, pool: 'ConnectionPool', conn, opened_at: float):
+        self._pool = pool
+        self._conn = conn
+        self._opened_at = opened_at
+
+    def __getattr__(self, name: str) -> Any:
+        conn = self.__dict__.get('_conn')
+        if conn is None:
+            raise mysql.connector.InterfaceError("Connection was returned to the pool")
+        return getattr(conn, name)
+
+    def close(self):
+        """Return the connection to the pool (idempotent)"""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool._release(conn, self._opened_at)
+
+    def __enter__(self) -> 'PooledConnection':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        if self.__dict__.get('_conn') is not None:
+            self.close()
+
+
+class ConnectionPool:
+    """Bounded LIFO pool of MySQL connections, thread-safe"""
+
+    def __init__(self, config: Dict[str, Any], size: int = 10, timeout: float = 5.0,
+                 recycle: float = 1800.0, ping_after: float = 30.0):
+        """
+        Args:
+            config: mysql.connector.connect() arguments
+            size: Most connections open at the same time (idle + checked out)
+            timeout: Seconds connect() waits for a free connection
+            recycle: Seconds after which a connection is replaced (0 = never)
+            ping_after: Seconds of idleness after which a connection is pinged before reuse
+        """
+        self.config = config
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+        self._idle: List[Tuple[Any, float, float]] = []  # (connection, opened at, returned at), newest last
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._in_use = 0
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def connect(self) -> PooledConnection:
+        """
+        Check out a connection, waiting up to `timeout` seconds for one
+
+        Raises:
+            PoolTimeout: All `size` connections stayed checked out
+            mysql.connector.Error: A new connection could not be opened
+        """
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            DB_POOL_TIMEOUTS.inc()
+            raise PoolTimeout(f"No free database connection after {self.timeout}s")
+        try:
+            conn, opened_at = self._checkout()
+        except BaseException:
+            self._slots.release()
+            raise
+        DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - start)
+        with self._lock:
+            self._in_use += 1
+        self._update_gauges()
+        return PooledConnection(self, conn, opened_at)
+
+    def _checkout(self) -> Tuple[Any, float]:
+        """An idle connection that passes the health checks, or a new one (called holding a slot)"""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, opened_at, returned_at = self._idle.pop()
+            now = time.monotonic()
+            if self.recycle and now - opened_at > self.recycle:
+                self._discard(conn, 'recycled')
+                continue
+            if now - returned_at > self.ping_after:
+                try:
+                    conn.ping(reconnect=False)
+                except Exception:
+                    self._discard(conn, 'unhealthy')
+                    continue
+            return conn, opened_at
+        conn = mysql.connector.connect(**self.config)
+        DB_POOL_OPENED.inc()
+        return conn, time.monotonic()
+
+    def _release(self, conn, opened_at: float):
+        try:
+            conn.rollback()  # Also reads any unread result
+        except Exception:
+            self._discard(conn, 'broken')
+            conn = None
+        with self._lock:
+            self._in_use -= 1
+            if conn is not None and not self._closed:
+                self._idle.append((conn, opened_at, time.monotonic()))
+                conn = None
+        if conn is not None:
+            conn.close()  # Pool closed meanwhile
+        self._slots.release()
+        self._update_gauges()
+
+    @staticmethod
+    def _discard(conn, reason: str):
+        DB_POOL_DISCARDED.labels(reason).inc()
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _update_gauges(self):
+        DB_POOL_IDLE.set(len(self._idle))
+        DB_POOL_IN_USE.set(self._in_use)
+
+    def close(self):
+        """Close the idle connections; checked-out ones are closed when they are returned"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn, _, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._update_gauges()
+
+
+pool = ConnectionPool(
+    DB_CONFIG,
+    size=int(os.environ.get("DB_POOL_SIZE", 10)),
+    timeout=float(os.environ.get("DB_POOL_TIMEOUT", 5.0)),
+    recycle=float(os.environ.get("DB_POOL_RECYCLE", 1800.0)),
+    ping_after=float(os.environ.get("DB_POOL_PING_AFTER", 30.0))
+)
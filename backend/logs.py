@@ -0,0 +1,186 @@
+"""
+Structured Logging
+Leveled, structured logging for the pose pipeline with per-session sampling of per-frame events,
+and for the server's own events (EventLogger)
+
+Environment:
+    POSE_DEBUG             1 = DEBUG level, every session and every frame is logged
+    POSE_LOG_LEVEL         Level of the 'pose_engine' logger (default INFO)
+    POSE_LOG_FORMAT        'text' (key=value) or 'json' (one JSON object per line)
+    POSE_LOG_SESSION_RATE  Fraction of sessions whose frames are logged at DEBUG (default 0.05)
+    POSE_LOG_FRAME_EVERY   In a sampled session, log one frame in N (default 30)
+
+Nothing is formatted for per-frame events unless the logger is at DEBUG and the
+session (and frame) were sampled, so production sessions cost one attribute check per frame.
+"""
+
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger('pose_engine')
+
+_TRUE = ('1', 'true', 'yes', 'on')
+
+
+class LogSettings:
+    """Sampling settings shared by all sessions (set by configure_logging)"""
+    debug = False
+    session_rate = 0.05
+    frame_every = 30
+
+
+settings = LogSettings()
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formats the record's event name plus its structured fields as key=value pairs or JSON"""
+
+    def __init__(self, fmt: str = 'text'):
+        super().__init__()
+        self.as_json = fmt == 'json'
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = getattr(record, 'fields', None) or {}
+
+        if self.as_json:
+            payload = {
+                'ts': round(record.created, 3),
+                'level': record.levelname,
+                'logger': record.name,
+                'event': record.getMessage(),
+                **fields
+            }
+            if record.exc_info:
+                payload['exc'] = self.formatException(record.exc_info)
+            return json.dumps(payload, ensure_ascii=False, default=str)
+
+        text = f"{self.formatTime(record)} {record.levelname} {record.name} {record.getMessage()}"
+        if fields:
+            text += ' ' + ' '.join(f"{k}={_format_value(v)}" for k, v in fields.items())
+        if record.exc_info:
+            text += '\n' + self.formatException(record.exc_info)
+        return text
+
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    if isinstance(value, str) and (' ' in value or not value):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None):
+    """
+    Set up the 'pose_engine' logger from the environment (call once at startup)
+
+    Args:
+        level: Overrides POSE_LOG_LEVEL
+        fmt: Overrides POSE_LOG_FORMAT ('text' or 'json')
+    """
+    settings.debug = os.environ.get('POSE_DEBUG', '').lower() in _TRUE
+    settings.session_rate = float(os.environ.get('POSE_LOG_SESSION_RATE', LogSettings.session_rate))
+    settings.frame_every = max(1, int(os.environ.get('POSE_LOG_FRAME_EVERY', LogSettings.frame_every)))
+
+    if level is None:
+        level = 'DEBUG' if settings.debug else os.environ.get('POSE_LOG_LEVEL', 'INFO')
+
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(StructuredFormatter(fmt or os.environ.get('POSE_LOG_FORMAT', 'text')))
+    logger.handlers[:] = [handler]
+    logger.setLevel(level.upper())
+    logger.propagate = False
+
+
+class EventLogger:
+    """
+    Logger for events outside the frame loop (startup, session ends, background writes), with
+    the same structured fields as the pose pipeline; records go to the 'pose_engine.<name>' logger
+    """
+
+    def __init__(self, name: str):
+        self._logger = logger.getChild(name)
+
+    def log(self, level: int, event: str, exc_info: bool = False, **fields):
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, event, exc_info=exc_info, extra={'fields': fields})
+
+    def debug(self, event: str, **fields):
+        self.log(logging.DEBUG, event, **fields)
+
+    def info(self, event: str, **fields):
+        self.log(logging.INFO, event, **fields)
+
+    def warning(self, event: str, **fields):
+        self.log(logging.WARNING, event, **fields)
+
+    def error(self, event: str, **fields):
+        self.log(logging.ERROR, event, **fields)
+
+    def exception(self, event: str, **fields):
+        """Log an ERROR with the current exception's traceback"""
+        self.log(logging.ERROR, event, exc_info=True, **fields)
+
+
+_session_ids = itertools.count(1)
+
+
+class SessionLogger:
+    """
+    Logger bound to one exercise session
+
+    Every record carries the session's fields (session id, exercise, frame number).
+    Whether the session's frames are logged at all is decided once, at creation;
+    begin_frame() then decides per frame and sets `sample_frame`, which the hot
+    path checks before building any per-frame event.
+    """
+
+    def __init__(self, exercise_type: str, session_id: Optional[Any] = None, sampled: Optional[bool] = None):
+        """
+        Args:
+            exercise_type: Exercise of the session
+            session_id: Identifier added to every record (a process-local counter if None)
+            sampled: Force frame sampling on/off (decided from the settings if None)
+        """
+        self.fields: Dict[str, Any] = {
+            'session': session_id if session_id is not None else next(_session_ids),
+            'exercise': exercise_type
+        }
+        if sampled is None:
+            sampled = settings.debug or random.random() < settings.session_rate
+        self.sampled = sampled
+        self.frame_every = 1 if settings.debug else settings.frame_every
+        self.frame = 0
+        self.sample_frame = False
+
+    def begin_frame(self) -> bool:
+        """Advance the frame counter and decide whether this frame's events are logged"""
+        self.frame += 1
+        self.sample_frame = (
+            self.sampled
+            and self.frame % self.frame_every == 0
+            and logger.isEnabledFor(logging.DEBUG)
+        )
+        return self.sample_frame
+
+    def log(self, level: int, event: str, exc_info: bool = False, **fields):
+        if logger.isEnabledFor(level):
+            logger.log(level, event, exc_info=exc_info, extra={'fields': {**self.fields, 'frame': self.frame, **fields}})
+
+    def debug(self, event: str, **fields):
+        self.log(logging.DEBUG, event, **fields)
+
+    def info(self, event: str, **fields):
+        self.log(logging.INFO, event, **fields)
+
+    def warning(self, event: str, **fields):
+        self.log(logging.WARNING, event, **fields)
+
+    def exception(self, event: str, **fields):
+        """Log an ERROR with the current exception's traceback"""
+        self.log(logging.ERROR, event, exc_info=True, **fields)
@@ -3,16 +3,16 @@ AI Rehabilitation System V3 - Complete Backend
 With Authentication, Database, Session Management, AI Personalization
 """
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends
+from fastapi import APIRouter, FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-import cv2
 import mysql.connector
-import mediapipe as mp
 import numpy as np
-import base64
+import asyncio
 import json
 import time
 import sqlite3
@@ -20,23 +20,104 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import jwt
 import hashlib
+import os
 from pathlib import Path
 from enum import Enum
 from collections import deque
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
 import time
 
 # Import AI models
 from ai_models import PersonalizationEngine, BiometricFeatures
+from session_writer import SessionWriter, SessionSummary
+from db import PoolTimeout, pool as db_pool
+from repositories import DataAccess, ErrorRepository, LimitsRepository, SessionRepository, UserRepository
+import metrics
+from logs import EventLogger, SessionLogger, configure_logging
+from pose_engine import (
+    PoseInferencePool, PoolExhausted, LatestFrameSlot, ExerciseSession, open_recorder, parse_binary_frame, parse_json_frame, encode_analysis,
+    frame_timestamp, open_track, load_session_angles, rescore_sessions,
+    SessionRegistry, SessionRecord, ActiveSession, SessionNotFound, open_session_store
+)
 
 # Config
 SECRET_KEY = "your-secret-key-change-in-production"
 ALGORITHM = "HS256"
-DB_CONFIG = {
-    "host": "localhost",
-    "user": "root", # use your MySQL username
-    "password": "123456", # use your MySQL password
-    "database": "rehab_v3"
-    }
+
+# Routes this process serves: 'all', 'api' (REST only; never starts the pose-inference workers)
+# or 'inference' (the exercise WebSocket only). Split tiers share the session store and database,
+# see serve.py --split
+REHAB_SERVICE = os.environ.get("REHAB_SERVICE", "all")
+if REHAB_SERVICE not in ("all", "api", "inference"):
+    raise ValueError(f"Unknown REHAB_SERVICE {REHAB_SERVICE!r} (expected 'all', 'api' or 'inference')")
+SERVES_API = REHAB_SERVICE in ("all", "api")
+SERVES_INFERENCE = REHAB_SERVICE in ("all", "inference")
+
+# Create the tables and default accounts at startup; multi-worker launchers (serve.py) do it once
+# before starting the workers and set REHAB_INIT_DB=0, so the workers only check the connection
+INIT_DB = os.environ.get("REHAB_INIT_DB", "1") != "0"
+
+# Pose-inference worker processes, and pre-warmed Pose graphs (= concurrent sessions) per worker
+POSE_WORKERS = int(os.environ.get("POSE_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+POSE_GRAPHS_PER_WORKER = int(os.environ.get("POSE_GRAPHS_PER_WORKER", 4))
+# Start and warm up the Pose graphs at startup, before reporting ready (POSE_PRELOAD=0 starts them
+# on the first WebSocket instead)
+POSE_PRELOAD = os.environ.get("POSE_PRELOAD", "1") != "0"
+
+# If set, every WebSocket session's frames are recorded here for offline replay (benchmarks/replay.py)
+POSE_RECORD_DIR = os.environ.get("POSE_RECORD_DIR")
+
+# Directory served unauthenticated under /static (music and assets); patient data never goes here
+STATIC_DIR = Path(".").resolve()
+
+# Patient data kept on disk (session tracks, the SQLite session store): outside STATIC_DIR
+REHAB_DATA_DIR = Path(os.environ.get("REHAB_DATA_DIR", Path.home() / ".rehab_system")).resolve()
+
+# Per-session landmark/angle/state tracks (<session_id>.track + .idx, see pose_engine/tracks.py)
+SESSION_TRACK_DIR = REHAB_DATA_DIR / os.environ.get("SESSION_TRACK_DIR", "session_tracks")
+
+# Started sessions and their counter checkpoints, shared by all workers: 'memory' (one worker)
+# or 'sqlite:<path>' (several workers on this machine, relative to REHAB_DATA_DIR; see serve.py
+# and pose_engine/store.py)
+SESSION_STORE = os.environ.get("SESSION_STORE", "memory")
+
+
+def check_private_path(path: Path, setting: str):
+    """
+    Raises:
+        ValueError: path is inside STATIC_DIR, where anyone could download it
+    """
+    path = path.resolve()
+    if path == STATIC_DIR or STATIC_DIR in path.parents:
+        raise ValueError(f"{setting} ({path}) is inside the public /static directory {STATIC_DIR}; "
+                         f"set REHAB_DATA_DIR to a directory outside it")
+
+
+check_private_path(SESSION_TRACK_DIR, "SESSION_TRACK_DIR")
+if POSE_RECORD_DIR:
+    check_private_path(Path(POSE_RECORD_DIR), "POSE_RECORD_DIR")
+if SESSION_STORE.startswith("sqlite:"):
+    check_private_path(REHAB_DATA_DIR / (SESSION_STORE[len("sqlite:"):] or "session_state.db"), "SESSION_STORE")
+
+# Started sessions without a WebSocket connection are ended after this long without activity;
+# until then a reconnect (on any worker) resumes from the session's last checkpoint
+SESSION_IDLE_SECONDS = float(os.environ.get("SESSION_IDLE_SECONDS", 900))
+SESSION_EVICT_INTERVAL = 60.0
+# A connected session saves its checkpoint this often; also how fast a connection that was
+# taken over on another worker stops
+SESSION_CHECKPOINT_SECONDS = float(os.environ.get("SESSION_CHECKPOINT_SECONDS", 2.0))
+# A connection binding to a started session must send its {"type": "auth"} message this soon
+SESSION_AUTH_SECONDS = 10.0
+
+# session_frames rows are written in the background, at most one per session every this many
+# seconds (0 = every analysed frame, negative = none); see session_writer.py
+SESSION_FRAME_INTERVAL = float(os.environ.get("SESSION_FRAME_INTERVAL", 1.0))
+SESSION_WRITE_QUEUE = int(os.environ.get("SESSION_WRITE_QUEUE", 20000))
+
+# Pose pipeline logging (POSE_DEBUG=1 logs every frame, see logs.py)
+configure_logging()
+log = EventLogger('server')
 
 # Initialize AI Personalization Engine
 personalization_engine = PersonalizationEngine()
@@ -79,10 +160,90 @@ def get_vietnamese_error_name(error_name: str) -> str:
     """Convert error name to Vietnamese - handles legacy English error names"""
     return ERROR_NAMES.get(error_name, error_name)
 
-app = FastAPI(title="Rehab System V3")
+def translate_history(sessions: List[Dict]) -> List[Dict]:
+    """Session history rows (SessionRepository.history) with Vietnamese exercise and error names"""
+    return [
+        {
+            **session,
+            'exercise_name': get_vietnamese_exercise_name(session['exercise_name']),
+            'errors': [{'name': get_vietnamese_error_name(e[0]), 'count': e[1], 'severity': e[2]} for e in session['errors']]
+        }
+        for session in sessions
+    ]
+
+def summarize_error_totals(rows: List) -> List[Dict]:
+    """Error analytics by exercise from ErrorRepository.totals rows"""
+    # Organize by exercise type and merge duplicate errors after Vietnamese translation
+    analytics = {}
+    for row in rows:
+        exercise_name = row[0]
+        error_name = row[1]
+        total_count = row[2]
+        session_count = row[3]
+        
+        # Convert to Vietnamese names
+        vietnamese_exercise = get_vietnamese_exercise_name(exercise_name)
+        vietnamese_error = get_vietnamese_error_name(error_name)
+        
+        if vietnamese_exercise not in analytics:
+            analytics[vietnamese_exercise] = {
+                'exercise_name': vietnamese_exercise,
+                'errors': {}  # Use dict to merge duplicates
+            }
+        
+        # Merge errors with same Vietnamese name
+        if vietnamese_error not in analytics[vietnamese_exercise]['errors']:
+            analytics[vietnamese_exercise]['errors'][vietnamese_error] = {
+                'error_name': vietnamese_error,
+                'total_count': 0,
+                'session_count': 0
+            }
+        
+        analytics[vietnamese_exercise]['errors'][vietnamese_error]['total_count'] += total_count
+        analytics[vietnamese_exercise]['errors'][vietnamese_error]['session_count'] += session_count
+    
+    # Convert errors dict to list and calculate averages
+    result = []
+    for exercise in analytics.values():
+        errors_list = []
+        for error in exercise['errors'].values():
+            errors_list.append({
+                'error_name': error['error_name'],
+                'total_count': error['total_count'],
+                'session_count': error['session_count'],
+                'avg_per_session': round(error['total_count'] / error['session_count'], 1) if error['session_count'] > 0 else 0
+            })
+        result.append({
+            'exercise_name': exercise['exercise_name'],
+            'errors': sorted(errors_list, key=lambda x: x['total_count'], reverse=True)
+        })
+    
+    return result
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Resources of this worker: the session writer and eviction run at once, while the database
+    and the Pose graphs are prepared in the background (GET /health/ready reports when done)
+    """
+    session_writer.start()
+    app.state.session_eviction = asyncio.create_task(evict_idle_sessions())
+    app.state.prepare_node = asyncio.create_task(prepare_node())
+    yield
+    app.state.prepare_node.cancel()
+    app.state.session_eviction.cancel()
+    pose_pool.shutdown()
+    # Flush queued frame rows and summaries (idle sessions are not ended on shutdown)
+    session_writer.stop()
+    session_registry.store.close()
+    data_access.shutdown()
+    db_pool.close()
+
+app = FastAPI(title="Rehab System V3", lifespan=lifespan)
 
 # Mount static files directory for music and assets
-app.mount("/static", StaticFiles(directory="."), name="static")
+app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
 app.add_middleware(
     CORSMiddleware,
@@ -94,14 +255,126 @@ app.add_middleware(
 
 security = HTTPBearer()
 
-# MediaPipe
-mp_pose = mp.solutions.pose
-pose = mp_pose.Pose(
+@app.exception_handler(PoolTimeout)
+async def database_busy(request: Request, exc: PoolTimeout):
+    """Every pooled database connection stayed busy: ask the client to retry instead of a 500"""
+    return JSONResponse({"detail": "Máy chủ đang bận, vui lòng thử lại sau"}, status_code=503)
+
+# REST routes and the exercise WebSocket, included according to REHAB_SERVICE (end of file)
+api_router = APIRouter()
+inference_router = APIRouter()
+
+@app.middleware("http")
+async def record_api_latency(request: Request, call_next):
+    """Latency histogram for every /api/* route, labelled with the route template (not the raw path)"""
+    if not request.url.path.startswith("/api/"):
+        return await call_next(request)
+    
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.HTTP_REQUEST_SECONDS.labels(
+            request.method, route.path if route else "unmatched", status
+        ).observe(time.perf_counter() - start)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# MediaPipe (worker processes and graphs are created by pose_pool.start())
+pose_pool = PoseInferencePool(
+    workers=POSE_WORKERS,
+    graphs_per_worker=POSE_GRAPHS_PER_WORKER,
+    model_complexity=1,
     min_detection_confidence=0.5,
-    min_tracking_confidence=0.5,
-    model_complexity=1
+    min_tracking_confidence=0.5
 )
 
+# Startup steps of this worker that have completed
+database_ready = False
+
+
+def database_retry_delays():
+    """Seconds to wait between attempts to reach the database: 1, 2, 4 ... up to 30"""
+    delay = 1.0
+    while True:
+        yield delay
+        delay = min(delay * 2, 30.0)
+
+
+async def prepare_database():
+    """Create the schema (or check the connection), retrying until MySQL is reachable"""
+    global database_ready
+    start = time.perf_counter()
+    for delay in database_retry_delays():
+        try:
+            await run_in_threadpool(init_db if INIT_DB else check_db)
+            break
+        except Exception as e:
+            log.warning('database_unavailable', error=str(e), retry_in=delay)
+            await asyncio.sleep(delay)
+    database_ready = True
+    metrics.STARTUP_SECONDS.labels('database').set(time.perf_counter() - start)
+
+
+async def warm_up_pose_pool():
+    """Start the inference workers and run a dummy frame through every Pose graph"""
+    start = time.perf_counter()
+    await pose_pool.start()
+    metrics.STARTUP_SECONDS.labels('pose_pool').set(time.perf_counter() - start)
+
+
+async def prepare_node():
+    steps = [prepare_database()]
+    if SERVES_INFERENCE and POSE_PRELOAD:
+        steps.append(warm_up_pose_pool())
+    try:
+        await asyncio.gather(*steps)
+    except Exception:
+        log.exception('startup_failed')
+        return
+    metrics.NODE_READY.set(1)
+
+
+@app.get("/health/live")
+async def liveness():
+    """The process is up and serving (it may not be ready yet)"""
+    return {"status": "ok"}
+
+
+@app.get("/health/ready")
+async def readiness():
+    """200 once the database is initialised and the Pose graphs are warmed up, else 503"""
+    checks = {"database": database_ready}
+    if SERVES_INFERENCE and POSE_PRELOAD:
+        checks["pose_models"] = pose_pool.ready
+    ready = all(checks.values())
+    return JSONResponse({"status": "ready" if ready else "starting", "checks": checks},
+                        status_code=200 if ready else 503)
+
+
+def end_idle_sessions():
+    """End sessions whose patient left without ending them (no connection, idle too long)"""
+    session_registry.heartbeat()
+    for active in session_registry.evict_idle():
+        try:
+            session_manager.finish_session(active)
+        except Exception:
+            log.exception('idle_session_end_failed', session=active.session_id)
+
+
+async def evict_idle_sessions():
+    """Run end_idle_sessions every SESSION_EVICT_INTERVAL, off the event loop (store I/O, track writes)"""
+    while True:
+        await asyncio.sleep(SESSION_EVICT_INTERVAL)
+        await run_in_threadpool(end_idle_sessions)
+
 
 # ============= DATABASE =============
 def hash_password(password: str) -> str:
@@ -109,7 +382,7 @@ def hash_password(password: str) -> str:
 
 def init_db():
     """Initialize database with complete schema"""
-    conn = mysql.connector.connect(**DB_CONFIG)
+    conn = db_pool.connect()
     cursor = conn.cursor()
     
     # Users table
@@ -143,7 +416,7 @@ def init_db():
             id INTEGER PRIMARY KEY AUTO_INCREMENT,
             patient_id INTEGER NOT NULL,
             exercise_name TEXT NOT NULL,
-            start_time TEXT NOT NULL,
+            start_time VARCHAR(32) NOT NULL,
             end_time TEXT,
             total_reps INTEGER DEFAULT 0,
             correct_reps INTEGER DEFAULT 0,
@@ -151,7 +424,8 @@ def init_db():
             duration_seconds INTEGER DEFAULT 0,
             avg_heart_rate INTEGER,
             notes TEXT,
-            FOREIGN KEY (patient_id) REFERENCES users(id)
+            FOREIGN KEY (patient_id) REFERENCES users(id),
+            INDEX ix_sessions_patient_start (patient_id, start_time, id)
         )
     """)
     
@@ -227,7 +501,15 @@ def init_db():
     
     conn.close()
 
-init_db()
+def check_db():
+    """Raise if the database cannot be reached"""
+    conn = db_pool.connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+    finally:
+        conn.close()
 
 
 # ============= AUTH MODELS =============
@@ -263,6 +545,12 @@ class UpdateProfileRequest(BaseModel):
 class PersonalizedParamsRequest(BaseModel):
     exercise_type: str
 
+class RescoreRequest(BaseModel):
+    exercise_type: str
+    down_angle: Optional[float] = None  # Candidate thresholds (exercise defaults if omitted)
+    up_angle: Optional[float] = None
+    limit: int = 500  # Most recent sessions to re-score (at most RESCORE_SESSIONS_MAX)
+
 
 # ============= AUTH FUNCTIONS =============
 
@@ -291,930 +579,87 @@ def get_current_user(token_data = Depends(verify_token)):
     return token_data
 
 
-# ============= POSE LOGIC (from V2) =============
-
-class AngleCalculator:
-    @staticmethod
-    def calculate_angle(point1, point2, point3):
-        a = np.array([point1.x, point1.y])
-        b = np.array([point2.x, point2.y])
-        c = np.array([point3.x, point3.y])
-        
-        ba = a - b
-        bc = c - b
-        
-        cosine_angle = np.dot(ba, bc) / (np.linalg.norm(ba) * np.linalg.norm(bc) + 1e-6)
-        angle = np.arccos(np.clip(cosine_angle, -1.0, 1.0))
-        
-        return np.degrees(angle)
-    
-    @staticmethod
-    def get_angles(landmarks, exercise_type):
-        if exercise_type == "squat":
-            return {
-                'left_knee': AngleCalculator.calculate_angle(
-                    landmarks[mp_pose.PoseLandmark.LEFT_HIP],
-                    landmarks[mp_pose.PoseLandmark.LEFT_KNEE],
-                    landmarks[mp_pose.PoseLandmark.LEFT_ANKLE]
-                ),
-                'right_knee': AngleCalculator.calculate_angle(
-                    landmarks[mp_pose.PoseLandmark.RIGHT_HIP],
-                    landmarks[mp_pose.PoseLandmark.RIGHT_KNEE],
-                    landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE]
-                ),
-            }
-        elif exercise_type == "arm_raise":
-            return {
-                'left_shoulder': AngleCalculator.calculate_angle(
-                    landmarks[mp_pose.PoseLandmark.LEFT_HIP],
-                    landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER],
-                    landmarks[mp_pose.PoseLandmark.LEFT_ELBOW]
-                ),
-                'right_shoulder': AngleCalculator.calculate_angle(
-                    landmarks[mp_pose.PoseLandmark.RIGHT_HIP],
-                    landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER],
-                    landmarks[mp_pose.PoseLandmark.RIGHT_ELBOW]
-                ),
-                'left_elbow': AngleCalculator.calculate_angle(
-                    landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER],
-                    landmarks[mp_pose.PoseLandmark.LEFT_ELBOW],
-                    landmarks[mp_pose.PoseLandmark.LEFT_WRIST]
-                ),
-                'right_elbow': AngleCalculator.calculate_angle(
-                    landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER],
-                    landmarks[mp_pose.PoseLandmark.RIGHT_ELBOW],
-                    landmarks[mp_pose.PoseLandmark.RIGHT_WRIST]
-                ),
-            }
-        # THÊM MỚI: single_leg_stand
-        elif exercise_type == "single_leg_stand":
-            # GÓC KNEE FLEXION (gập gối): HIP -> KNEE -> ANKLE
-            left_knee_flexion = AngleCalculator.calculate_angle(
-                landmarks[mp_pose.PoseLandmark.LEFT_HIP],
-                landmarks[mp_pose.PoseLandmark.LEFT_KNEE],
-                landmarks[mp_pose.PoseLandmark.LEFT_ANKLE]
-            )
-            right_knee_flexion = AngleCalculator.calculate_angle(
-                landmarks[mp_pose.PoseLandmark.RIGHT_HIP],
-                landmarks[mp_pose.PoseLandmark.RIGHT_KNEE],
-                landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE]
-            )
-
-            # KIỂM TRA CHÂN RA SAU bằng Z-coordinate (độ sâu)
-            # Nếu knee.z > hip.z => chân ra SAU (gối xa camera hơn hông)
-            left_knee_z = landmarks[mp_pose.PoseLandmark.LEFT_KNEE].z
-            left_hip_z = landmarks[mp_pose.PoseLandmark.LEFT_HIP].z
-            left_leg_behind = left_knee_z - left_hip_z  # Dương = ra sau, Âm = ra trước
-
-            right_knee_z = landmarks[mp_pose.PoseLandmark.RIGHT_KNEE].z
-            right_hip_z = landmarks[mp_pose.PoseLandmark.RIGHT_HIP].z
-            right_leg_behind = right_knee_z - right_hip_z  # Dương = ra sau, Âm = ra trước
-
-            angles = {
-                # Gập gối (knee flexion)
-                'left_knee': left_knee_flexion,
-                'right_knee': right_knee_flexion,
-
-                # Chân ra sau (dùng Z-coordinate thay vì góc)
-                'left_leg_behind': left_leg_behind,
-                'right_leg_behind': right_leg_behind,
-
-                # Keep Y positions for height check
-                'left_knee_y': landmarks[mp_pose.PoseLandmark.LEFT_KNEE].y,
-                'right_knee_y': landmarks[mp_pose.PoseLandmark.RIGHT_KNEE].y,
-                'left_hip_y': landmarks[mp_pose.PoseLandmark.LEFT_HIP].y,
-                'right_hip_y': landmarks[mp_pose.PoseLandmark.RIGHT_HIP].y,
-            }
-
-            # Debug information
-            print(f" Left - Knee Flexion: {left_knee_flexion:.1f}°, Leg Behind: {left_leg_behind:.3f} {'RA SAU' if left_leg_behind > 0.05 else 'RA TRƯỚC'}")
-            print(f" Right - Knee Flexion: {right_knee_flexion:.1f}°, Leg Behind: {right_leg_behind:.3f} {'RA SAU' if right_leg_behind > 0.05 else 'RA TRƯỚC'}")
-
-            return angles
-
-        # THÊM MỚI: calf_raise
-        elif exercise_type == "calf_raise":
-            # Tính góc mắt cá chân (ankle)
-            left_ankle_angle = AngleCalculator.calculate_angle(
-                landmarks[mp_pose.PoseLandmark.LEFT_KNEE],
-                landmarks[mp_pose.PoseLandmark.LEFT_ANKLE],
-                landmarks[mp_pose.PoseLandmark.LEFT_FOOT_INDEX]
-            )
-            right_ankle_angle = AngleCalculator.calculate_angle(
-                landmarks[mp_pose.PoseLandmark.RIGHT_KNEE],
-                landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE],
-                landmarks[mp_pose.PoseLandmark.RIGHT_FOOT_INDEX]
-            )
-            
-            # Tính góc gối (đảm bảo chân thẳng)
-            left_knee_angle = AngleCalculator.calculate_angle(
-                landmarks[mp_pose.PoseLandmark.LEFT_HIP],
-                landmarks[mp_pose.PoseLandmark.LEFT_KNEE],
-                landmarks[mp_pose.PoseLandmark.LEFT_ANKLE]
-            )
-            right_knee_angle = AngleCalculator.calculate_angle(
-                landmarks[mp_pose.PoseLandmark.RIGHT_HIP],
-                landmarks[mp_pose.PoseLandmark.RIGHT_KNEE],
-                landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE]
-            )
-            
-            # Lấy vị trí Y của gót và mũi chân
-            left_heel_y = landmarks[mp_pose.PoseLandmark.LEFT_HEEL].y
-            right_heel_y = landmarks[mp_pose.PoseLandmark.RIGHT_HEEL].y
-            left_foot_index_y = landmarks[mp_pose.PoseLandmark.LEFT_FOOT_INDEX].y
-            right_foot_index_y = landmarks[mp_pose.PoseLandmark.RIGHT_FOOT_INDEX].y
-            
-            angles = {
-                'left_ankle': left_ankle_angle,
-                'right_ankle': right_ankle_angle,
-                'left_knee': left_knee_angle,
-                'right_knee': right_knee_angle,
-                'left_heel_y': left_heel_y,
-                'right_heel_y': right_heel_y,
-                'left_foot_index_y': left_foot_index_y,
-                'right_foot_index_y': right_foot_index_y,
-            }
-            
-            # Debug
-            print(f"Ankle angles - Left: {left_ankle_angle:.1f}°, Right: {right_ankle_angle:.1f}°")
-            print(f"Heel height - Left: {left_heel_y:.3f}, Right: {right_heel_y:.3f}")
-
-            return angles
-
-        return {}
-
-
-class ExerciseState(Enum):
-    DOWN = "down"
-    RAISING = "raising"
-    UP = "up"
-    LOWERING = "lowering"
-    # THÊM MỚI cho single_leg_stand
-    READY = "ready"
-    LIFTING = "lifting"
-    HOLDING = "holding"
-    SWITCH_SIDE = "switch_side"
-    COMPLETE = "complete"
-
-class RepetitionCounter:
-    def __init__(self, exercise_type):
-        self.exercise_type = exercise_type
-        self.rep_count = 0
-
-        # Khởi tạo state dựa trên exercise type
-        if exercise_type == "single_leg_stand":
-            self.state = ExerciseState.READY
-        else:
-            self.state = ExerciseState.DOWN
-
-        self.last_state_change = time.time()
-
-        # REP-BASED ERROR TRACKING
-        self.current_rep_errors = set()  # Lỗi trong rep hiện tại (unique)
-        self.all_rep_errors = []  # Danh sách lỗi của tất cả reps: [[errors_rep1], [errors_rep2], ...]
-        self.rep_completed = False  # Flag để track khi rep hoàn thành
-
-        # For single_leg_stand
-        self.current_side = "left"  # Start with left leg
-        self.hold_start_time = None
-        self.hold_duration = 3.0  # 10 seconds
-        self.left_completed = False
-        self.right_completed = False
-        
-        # Thresholds
-        if exercise_type == "arm_raise":
-            self.down_threshold = 90
-            self.up_threshold = 160
-            self.hysteresis = 5
-        elif exercise_type == "squat":
-            self.down_threshold = 160
-            self.up_threshold = 90
-            self.hysteresis = 5
-        elif exercise_type == "single_leg_stand":
-            self.knee_threshold = 90  # Góc gập gối
-            self.knee_height_threshold = 0.1  # Chân phải nâng cao hơn 0.1 (tỉ lệ)
-            self.hysteresis = 5
-        elif exercise_type == "calf_raise":
-            # Ngưỡng cho nâng gót chân - CHỈ CẦN NÂNG MỘT CHÚT
-            self.down_threshold = 120  # Góc ankle khi gót chạm đất
-            self.up_threshold = 140    # Góc ankle khi nâng gót lên cao
-            self.hysteresis = 5
-    
-    def add_error_to_current_rep(self, error_name: str):
-        """Add error to current rep (will only count once per rep)"""
-        self.current_rep_errors.add(error_name)
-    
-    def get_error_summary(self):
-        """Get total count of each error across all reps"""
-        error_counts = {}
-        for rep_errors in self.all_rep_errors:
-            for error in rep_errors:
-                error_counts[error] = error_counts.get(error, 0) + 1
-        return error_counts
-    
-    def _complete_rep(self):
-        """Called when a rep is completed - save errors for this rep"""
-        self.rep_count += 1
-        self.all_rep_errors.append(list(self.current_rep_errors))
-        print(f" Rep {self.rep_count} completed! Errors in this rep: {list(self.current_rep_errors)}")
-        print(f" Total all_rep_errors so far: {self.all_rep_errors}")
-        self.current_rep_errors.clear()  # Reset for next rep
-        self.rep_completed = True
-    
-    def update(self, angles):
-        """Update state machine and return current rep count"""
-        self.rep_completed = False  # Reset flag
-        
-        if self.exercise_type == "arm_raise":
-            return self._count_arm_raise(angles)
-        elif self.exercise_type == "squat":
-            return self._count_squat(angles)
-        elif self.exercise_type == "single_leg_stand":
-            return self._count_single_leg(angles)
-        elif self.exercise_type == "calf_raise":
-            return self._count_calf_raise(angles)
-        return self.rep_count
-    
-    def _count_single_leg(self, angles):
-        """State machine for single leg stand - CHÂN RA SAU"""
-        current_time = time.time()
-
-        # Lấy các góc theo bên hiện tại
-        if self.current_side == "left":
-            knee_flexion = angles.get('left_knee', 180)
-            leg_behind_value = angles.get('left_leg_behind', 0)
-        else:
-            knee_flexion = angles.get('right_knee', 180)
-            leg_behind_value = angles.get('right_leg_behind', 0)
-
-        # KIỂM TRA TƯ THẾ ĐÚNG (CHÂN RA SAU):
-        # 1. Gối gập sâu < 50° (knee flexion)
-        # 2. Chân ra sau: knee.z > hip.z + 0.05 (gối phía sau hông)
-
-        knee_bent_enough = knee_flexion < 50  # Gối gập sâu
-        leg_behind = leg_behind_value > 0.05  # Chân ra sau (KHÔNG ra trước!)
-
-        # Tư thế đúng khi: gối gập + chân ra sau
-        is_correct_position = knee_bent_enough and leg_behind
-
-        # Debug information
-        print(f" {self.current_side.upper()} side:")
-        print(f"   Knee Flexion: {knee_flexion:.1f}° ({'Right' if knee_bent_enough else 'Wrong'} <50°)")
-        print(f"   Leg Behind: {leg_behind_value:.3f} ({'Right' if leg_behind else 'Wrong'} >0.05)")
-        print(f"   Correct Position: {' YES' if is_correct_position else ' NO'}")
-        
-        # State machine
-        if self.state == ExerciseState.READY:
-            # Waiting to start - đợi người dùng làm tư thế đúng
-            if is_correct_position:
-                self.state = ExerciseState.LIFTING
-                self.last_state_change = current_time
-
-        elif self.state == ExerciseState.LIFTING:
-            # Leg is being lifted - đang nâng chân lên tư thế
-            if is_correct_position:
-                # Đã vào tư thế đúng, bắt đầu giữ
-                self.state = ExerciseState.HOLDING
-                self.hold_start_time = current_time
-                self.last_state_change = current_time
-            elif knee_flexion > 160:  # Chân hạ xuống
-                # Quay về ready
-                self.state = ExerciseState.READY
-                self.last_state_change = current_time
-
-        elif self.state == ExerciseState.HOLDING:
-            # Holding the position - đang giữ tư thế
-            if self.hold_start_time:
-                elapsed = current_time - self.hold_start_time
-
-                # Mất tư thế nếu:
-                # 1. Gối không gập đủ (>70°)
-                # 2. Chân không còn ở phía sau (leg_behind < 0.03)
-                lost_position = (knee_flexion > 70) or (leg_behind_value < 0.03)
-
-                if lost_position:
-                    # Mất tư thế
-                    self.state = ExerciseState.LOWERING
-                    self.hold_start_time = None
-                    self.last_state_change = current_time
-                    print(f" Mất tư thế! Knee: {knee_flexion:.1f}°, Leg Behind: {leg_behind_value:.3f}")
-
-                elif elapsed >= self.hold_duration:
-                    # Giữ đủ 10 giây!
-                    self.state = ExerciseState.LOWERING
-                    self.hold_start_time = None
-                    self.last_state_change = current_time
-
-                    # Mark side as completed
-                    if self.current_side == "left":
-                        self.left_completed = True
-                        print(" Hoàn thành bên TRÁI!")
-                    else:
-                        self.right_completed = True
-                        print(" Hoàn thành bên PHẢI!")
-
-        elif self.state == ExerciseState.LOWERING:
-            # Lowering the leg - đang hạ chân xuống
-            # Chân đã hạ xuống khi knee flexion > 160° (gần duỗi thẳng)
-            if knee_flexion > 160:
-                # Leg is down
-                if self.left_completed and self.right_completed:
-                    # Both sides done - complete!
-                    self.state = ExerciseState.COMPLETE
-                    self._complete_rep()  #  Rep hoàn thành!
-                    self.left_completed = False
-                    self.right_completed = False
-                    self.last_state_change = current_time
-                    print(" Hoàn thành CẢ 2 BÊN! +1 Rep")
-                else:
-                    # Switch to other side
-                    self.state = ExerciseState.SWITCH_SIDE
-                    self.current_side = "right" if self.current_side == "left" else "left"
-                    self.last_state_change = current_time
-                    print(f" Chuyển sang bên {self.current_side.upper()}")
-                    
-        elif self.state == ExerciseState.SWITCH_SIDE:
-            # Wait a moment, then ready for other side
-            if current_time - self.last_state_change > 2.0:  # 2 second pause
-                self.state = ExerciseState.READY
-                self.last_state_change = current_time
-                
-        elif self.state == ExerciseState.COMPLETE:
-            # Wait a moment, then ready for next rep
-            if current_time - self.last_state_change > 3.0:  # 3 second pause
-                self.state = ExerciseState.READY
-                self.current_side = "left"
-                self.last_state_change = current_time
-        
-        return self.rep_count
-    
-    def _count_arm_raise(self, angles):
-        #  YÊU CẦU CẢ 2 TAY - cả 2 tay phải đạt ngưỡng
-        left_shoulder = angles.get('left_shoulder', 0)
-        right_shoulder = angles.get('right_shoulder', 0)
-        # Dùng MIN để đảm bảo CẢ 2 TAY đều đạt ngưỡng (tay thấp nhất phải đủ cao)
-        shoulder_angle = min(left_shoulder, right_shoulder)
-        
-        current_time = time.time()
-        
-        if self.state == ExerciseState.DOWN:
-            if shoulder_angle > self.down_threshold + self.hysteresis:
-                self.state = ExerciseState.RAISING
-                self.last_state_change = current_time
-                
-        elif self.state == ExerciseState.RAISING:
-            if shoulder_angle >= self.up_threshold:
-                self.state = ExerciseState.UP
-                self.last_state_change = current_time
-            elif shoulder_angle < self.down_threshold:
-                self.state = ExerciseState.DOWN
-                self.last_state_change = current_time
-                
-        elif self.state == ExerciseState.UP:
-            if shoulder_angle < self.up_threshold - self.hysteresis:
-                self.state = ExerciseState.LOWERING
-                self.last_state_change = current_time
-                
-        elif self.state == ExerciseState.LOWERING:
-            if shoulder_angle < self.down_threshold:
-                self.state = ExerciseState.DOWN
-                self._complete_rep()  #  Rep hoàn thành!
-                self.last_state_change = current_time
-            elif shoulder_angle > self.up_threshold:
-                self.state = ExerciseState.UP
-                self.last_state_change = current_time
-        
-        return self.rep_count
-    
-    def _count_squat(self, angles):
-        #  YÊU CẦU CẢ 2 CHÂN - cả 2 chân phải đạt ngưỡng
-        left_knee = angles.get('left_knee', 180)
-        right_knee = angles.get('right_knee', 180)
-        # Dùng MAX để đảm bảo CẢ 2 CHÂN đều gập đủ sâu (chân cao nhất phải đủ thấp)
-        knee_angle = max(left_knee, right_knee)
-        
-        current_time = time.time()
-        
-        if self.state == ExerciseState.DOWN:
-            if knee_angle < self.down_threshold - self.hysteresis:
-                self.state = ExerciseState.LOWERING
-                self.last_state_change = current_time
-                
-        elif self.state == ExerciseState.LOWERING:
-            if knee_angle <= self.up_threshold:
-                self.state = ExerciseState.UP
-                self.last_state_change = current_time
-            elif knee_angle > self.down_threshold:
-                self.state = ExerciseState.DOWN
-                self.last_state_change = current_time
-                
-        elif self.state == ExerciseState.UP:
-            if knee_angle > self.up_threshold + self.hysteresis:
-                self.state = ExerciseState.RAISING
-                self.last_state_change = current_time
-                
-        elif self.state == ExerciseState.RAISING:
-            if knee_angle >= self.down_threshold:
-                self.state = ExerciseState.DOWN
-                self._complete_rep()  #  Rep hoàn thành!
-                self.last_state_change = current_time
-            elif knee_angle < self.up_threshold:
-                self.state = ExerciseState.UP
-                self.last_state_change = current_time
-        
-        return self.rep_count
-
-    def _count_calf_raise(self, angles):
-        """State machine for calf raise - YÊU CẦU CẢ 2 CHÂN"""
-        left_ankle = angles.get('left_ankle', 90)
-        right_ankle = angles.get('right_ankle', 90)
-        # Dùng MIN để đảm bảo CẢ 2 CHÂN đều nâng đủ cao (chân thấp nhất phải đủ cao)
-        ankle_angle = min(left_ankle, right_ankle)
-        
-        current_time = time.time()
-        
-        if self.state == ExerciseState.DOWN:
-            if ankle_angle > self.down_threshold + self.hysteresis:
-                self.state = ExerciseState.RAISING
-                self.last_state_change = current_time
-                
-        elif self.state == ExerciseState.RAISING:
-            if ankle_angle >= self.up_threshold:
-                self.state = ExerciseState.UP
-                self.last_state_change = current_time
-            elif ankle_angle < self.down_threshold:
-                self.state = ExerciseState.DOWN
-                self.last_state_change = current_time
-                
-        elif self.state == ExerciseState.UP:
-            if ankle_angle < self.up_threshold - self.hysteresis:
-                self.state = ExerciseState.LOWERING
-                self.last_state_change = current_time
-                
-        elif self.state == ExerciseState.LOWERING:
-            if ankle_angle <= self.down_threshold:
-                self.state = ExerciseState.DOWN
-                self._complete_rep()  #  Rep hoàn thành!
-                self.last_state_change = current_time
-            elif ankle_angle > self.up_threshold:
-                self.state = ExerciseState.UP
-                self.last_state_change = current_time
-        
-        return self.rep_count
-
-    def get_hold_time_remaining(self):
-        """Get remaining hold time for single_leg_stand"""
-        if self.exercise_type != "single_leg_stand":
-            return None
-        if self.state != ExerciseState.HOLDING or not self.hold_start_time:
-            return None
-        
-        elapsed = time.time() - self.hold_start_time
-        remaining = max(0, self.hold_duration - elapsed)
-        return remaining
-    
-    def get_current_side(self):
-        """Get current side for single_leg_stand"""
-        if self.exercise_type != "single_leg_stand":
-            return None
-        return self.current_side
-    
-    def reset(self):
-        self.rep_count = 0
-        self.state = ExerciseState.DOWN if self.exercise_type != "single_leg_stand" else ExerciseState.READY
-        self.last_state_change = time.time()
-        self.hold_start_time = None
-        self.left_completed = False
-        self.right_completed = False
-        self.current_side = "left"
-        #  Reset error tracking
-        self.current_rep_errors.clear()
-        self.all_rep_errors.clear()
-        self.rep_completed = False
-    
-    def get_state(self):
-        return self.state
-
-
-
-class ErrorDetector:
-    def __init__(self, exercise_type):
-        self.exercise_type = exercise_type
-        # Track error timestamps: {error_name: first_detected_time}
-        self.error_timers = {}
-        self.error_threshold = 3  # seconds - only count error if persists for this long
-        
-    def detect_errors(self, landmarks, angles, state: ExerciseState, rep_counter: RepetitionCounter):
-        """
-        Detect errors and add them to the current rep.
-        Only records an error if it persists for error_threshold (3s) continuously.
-        Returns errors for real-time feedback display.
-        """
-        errors = []
-        current_time = time.time()
-        
-        if self.exercise_type == "arm_raise":
-            errors.extend(self._check_arm_raise_errors(landmarks, angles, state, rep_counter, current_time))
-        elif self.exercise_type == "squat":
-            errors.extend(self._check_squat_errors(landmarks, angles, state, rep_counter, current_time))
-        elif self.exercise_type == "single_leg_stand":
-            errors.extend(self._check_single_leg_errors(landmarks, angles, state, rep_counter, current_time))
-        elif self.exercise_type == "calf_raise":
-            errors.extend(self._check_calf_raise_errors(landmarks, angles, state, rep_counter, current_time))
-
-        return errors
-    
-    def _should_record_error(self, error_name: str, current_time: float) -> bool:
-        """
-        Check if error should be recorded based on persistence time.
-        Returns True if error has persisted for >= error_threshold seconds.
-        """
-        if error_name not in self.error_timers:
-            # First time seeing this error, start timer
-            self.error_timers[error_name] = current_time
-            return False
-        
-        # Check if error has persisted long enough
-        elapsed = current_time - self.error_timers[error_name]
-        return elapsed >= self.error_threshold
-    
-    def _clear_error_timer(self, error_name: str):
-        """Clear error timer when error is no longer detected"""
-        if error_name in self.error_timers:
-            del self.error_timers[error_name]
-    
-    def reset_timers(self):
-        """Reset all error timers (called when starting new rep)"""
-        self.error_timers.clear()
-    
-    def _check_single_leg_errors(self, landmarks, angles, state, rep_counter, current_time):
-        errors = []
-
-        # Only check errors during HOLDING state
-        if state != ExerciseState.HOLDING:
-            # Clear timers when not in HOLDING state
-            self._clear_error_timer('Gối chưa gập đủ sâu')
-            self._clear_error_timer('Chân không ra sau')
-            return errors
-
-        # Lấy góc của cả 2 bên
-        left_knee_flexion = angles.get('left_knee', 180)
-        right_knee_flexion = angles.get('right_knee', 180)
-        left_leg_behind = angles.get('left_leg_behind', 0)
-        right_leg_behind = angles.get('right_leg_behind', 0)
-
-        # Xác định bên nào đang nâng (bên có knee flexion nhỏ hơn)
-        if left_knee_flexion < right_knee_flexion:
-            # Left leg is lifted
-            knee_flexion = left_knee_flexion
-            leg_behind_value = left_leg_behind
-            side = "left"
-        else:
-            # Right leg is lifted
-            knee_flexion = right_knee_flexion
-            leg_behind_value = right_leg_behind
-            side = "right"
-
-        # Error 1: Gối không gập đủ sâu (phải < 50°)
-        if knee_flexion > 50:
-            error_name = 'Gối chưa gập đủ sâu'
-            
-            # Only record and show error if it persists for 1.5s
-            if self._should_record_error(error_name, current_time):
-                rep_counter.add_error_to_current_rep(error_name)
-                # Show in real-time feedback only after 1.5s
-                errors.append({
-                    'name': error_name,
-                    'message': f' Gập gối sâu hơn! (hiện tại: {knee_flexion:.0f}°, cần: <50°)',
-                    'severity': 'high'
-                })
-        else:
-            self._clear_error_timer('Gối chưa gập đủ sâu')
-
-        # Error 2: CHÂN KHÔNG RA SAU - ra trước (dùng Z-coordinate)
-        if leg_behind_value < 0.05:
-            error_name = 'Chân không ra sau'
-            
-            # Only record and show error if it persists for 1.5s
-            if self._should_record_error(error_name, current_time):
-                rep_counter.add_error_to_current_rep(error_name)
-                # Show in real-time feedback only after 1.5s
-                errors.append({
-                    'name': error_name,
-                    'message': f' Đưa chân RA SAU, không ra trước! (hiện tại: {leg_behind_value:.3f}, cần: >0.05)',
-                    'severity': 'critical'
-                })
-        else:
-            self._clear_error_timer('Chân không ra sau')
-
-        return errors
-
-    def _check_arm_raise_errors(self, landmarks, angles, state, rep_counter, current_time):
-        errors = []
-        
-        left_shoulder = angles.get('left_shoulder', 0)
-        right_shoulder = angles.get('right_shoulder', 0)
-        left_elbow = angles.get('left_elbow', 180)
-        right_elbow = angles.get('right_elbow', 180)
-        
-        # CHECK CẢ 2 TAY - tay thấp nhất phải đủ cao
-        shoulder_angle = min(left_shoulder, right_shoulder)
-        elbow_angle = min(left_elbow, right_elbow)
-        
-        # CHỈ CHECK LỖI Ở STATE UP (đã nâng xong)
-        if state == ExerciseState.UP:
-            # Error 1: Góc vai không đủ (CẢ 2 TAY phải cao)
-            if shoulder_angle < 160:
-                error_name = 'Góc vai chưa đủ'
-                
-                # Only record and show error if it persists for 1.5s
-                if self._should_record_error(error_name, current_time):
-                    rep_counter.add_error_to_current_rep(error_name)
-                    # Show in real-time feedback only after 1.5s
-                    errors.append({
-                        'name': error_name,
-                        'message': f' Nâng CẢ 2 TAY cao hơn! (thấp nhất: {shoulder_angle:.0f}°)',
-                        'severity': 'high'
-                    })
-            else:
-                self._clear_error_timer('Góc vai chưa đủ')
-            
-            # Error 2: Tay không thẳng (CẢ 2 TAY phải thẳng)
-            if elbow_angle < 160:
-                error_name = 'Tay không thẳng'
-                
-                # Only record and show error if it persists for 1.5s
-                if self._should_record_error(error_name, current_time):
-                    rep_counter.add_error_to_current_rep(error_name)
-                    # Show in real-time feedback only after 1.5s
-                    errors.append({
-                        'name': error_name,
-                        'message': ' Duỗi thẳng CẢ 2 TAY!',
-                        'severity': 'medium'
-                    })
-            else:
-                self._clear_error_timer('Tay không thẳng')
-        else:
-            # Not in UP state, clear UP state error timers
-            self._clear_error_timer('Góc vai chưa đủ')
-            self._clear_error_timer('Tay không thẳng')
-        
-        # CHECK Ở STATE DOWN (đã hạ xong)
-        if state == ExerciseState.DOWN:
-            # Error 3: Chưa hạ hết tay
-            if shoulder_angle > 90:
-                error_name = 'Chưa hạ hết'
-                
-                # Only record and show error if it persists for 1.5s
-                if self._should_record_error(error_name, current_time):
-                    rep_counter.add_error_to_current_rep(error_name)
-                    # Show in real-time feedback only after 1.5s
-                    errors.append({
-                        'name': error_name,
-                        'message': ' Hạ CẢ 2 TAY xuống hẳn!',
-                        'severity': 'medium'
-                    })
-            else:
-                self._clear_error_timer('Chưa hạ hết')
-        else:
-            # Not in DOWN state, clear DOWN state error timers
-            self._clear_error_timer('Chưa hạ hết')
-        
-        return errors
-    
-    def _check_squat_errors(self, landmarks, angles, state, rep_counter, current_time):
-        errors = []
-        
-        left_knee = angles.get('left_knee', 180)
-        right_knee = angles.get('right_knee', 180)
-        #  CHECK CẢ 2 CHÂN - chân cao nhất (góc lớn nhất) phải đủ thấp
-        knee_angle = max(left_knee, right_knee)
-        
-        # Check ở state UP (gập gối xong)
-        if state == ExerciseState.UP:
-            if knee_angle > 90:
-                error_name = 'Gập gối chưa đủ'
-                
-                # Only record and show error if it persists for 1.5s
-                if self._should_record_error(error_name, current_time):
-                    rep_counter.add_error_to_current_rep(error_name)
-                    # Show in real-time feedback only after 1.5s
-                    errors.append({
-                        'name': error_name,
-                        'message': f' Gập CẢ 2 CHÂN sâu hơn! (cao nhất: {knee_angle:.0f}°)',
-                        'severity': 'high'
-                    })
-            else:
-                self._clear_error_timer('Gập gối chưa đủ')
-        else:
-            # Not in UP state, clear UP state error timer
-            self._clear_error_timer('Gập gối chưa đủ')
-        
-        # Check ở state DOWN (đã đứng thẳng)
-        if state == ExerciseState.DOWN:
-            if knee_angle < 160:
-                error_name = 'Chưa đứng thẳng'
-                
-                # Only record and show error if it persists for 1.5s
-                if self._should_record_error(error_name, current_time):
-                    rep_counter.add_error_to_current_rep(error_name)
-                    # Show in real-time feedback only after 1.5s
-                    errors.append({
-                        'name': error_name,
-                        'message': ' Đứng thẳng CẢ 2 CHÂN!',
-                        'severity': 'medium'
-                    })
-            else:
-                self._clear_error_timer('Chưa đứng thẳng')
-        else:
-            # Not in DOWN state, clear DOWN state error timer
-            self._clear_error_timer('Chưa đứng thẳng')
-        
-        return errors
-
-    def _check_calf_raise_errors(self, landmarks, angles, state, rep_counter, current_time):
-        errors = []
-        
-        left_ankle = angles.get('left_ankle', 90)
-        right_ankle = angles.get('right_ankle', 90)
-        left_knee = angles.get('left_knee', 180)
-        right_knee = angles.get('right_knee', 180)
-        
-        # CHECK CẢ 2 CHÂN - chân thấp nhất phải đủ cao
-        ankle_angle = min(left_ankle, right_ankle)
-        knee_angle = min(left_knee, right_knee)
-        
-        # Check ở state UP (đã nâng gót lên)
-        if state == ExerciseState.UP:
-            # Error 1: Chưa nâng đủ cao (CẢ 2 CHÂN)
-            if ankle_angle < 140:
-                error_name = 'Chưa nâng đủ cao'
-                
-                # Only record and show error if it persists for 1.5s
-                if self._should_record_error(error_name, current_time):
-                    rep_counter.add_error_to_current_rep(error_name)
-                    # Show in real-time feedback only after 1.5s
-                    errors.append({
-                        'name': error_name,
-                        'message': f' Nâng CẢ 2 GÓT cao hơn! (thấp nhất: {ankle_angle:.0f}°)',
-                        'severity': 'high'
-                    })
-            else:
-                self._clear_error_timer('Chưa nâng đủ cao')
-            
-            # Error 2: Gập gối (CẢ 2 CHÂN phải thẳng)
-            if knee_angle < 160:
-                error_name = 'Gập gối'
-                
-                # Only record and show error if it persists for 1.5s
-                if self._should_record_error(error_name, current_time):
-                    rep_counter.add_error_to_current_rep(error_name)
-                    # Show in real-time feedback only after 1.5s
-                    errors.append({
-                        'name': error_name,
-                        'message': ' Giữ CẢ 2 CHÂN thẳng!',
-                        'severity': 'medium'
-                    })
-            else:
-                self._clear_error_timer('Gập gối')
-        else:
-            # Not in UP state, clear UP state error timers
-            self._clear_error_timer('Chưa nâng đủ cao')
-            self._clear_error_timer('Gập gối')
-        
-        # Check ở state DOWN (đã hạ gót xuống)
-        if state == ExerciseState.DOWN:
-            # Error 3: Chưa hạ hết
-            if ankle_angle > 105:
-                error_name = 'Chưa hạ hết'
-                
-                # Only record and show error if it persists for 1.5s
-                if self._should_record_error(error_name, current_time):
-                    rep_counter.add_error_to_current_rep(error_name)
-                    # Show in real-time feedback only after 1.5s
-                    errors.append({
-                        'name': error_name,
-                        'message': ' Hạ CẢ 2 GÓT xuống hẳn!',
-                        'severity': 'medium'
-                    })
-            else:
-                self._clear_error_timer('Chưa hạ hết')
-        else:
-            # Not in DOWN state, clear DOWN state error timer
-            self._clear_error_timer('Chưa hạ hết')
-        
-        return errors
-    
-    # Xóa các methods không còn dùng
-    # _should_report_error và _cleanup_timers không còn cần thiết
 # ============= SESSION MANAGER =============
 
 class SessionManager:
-    def __init__(self):
-        self.current_session = None
-        self.frame_data = []
-        self.active_rep_counter: Optional[RepetitionCounter] = None  # Reference to active rep counter
+    """
+    Starts and ends exercise sessions; live session state is kept in the registry and session
+    summaries are written to the database in the background by the writer
+    """
     
-    def start_session(self, patient_id: int, exercise_name: str):
-        conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT INTO sessions (patient_id, exercise_name, start_time)
-            VALUES (%s, %s, %s)
-        """, (patient_id, exercise_name, datetime.now().isoformat()))
-        
-        session_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        
-        self.current_session = {
-            'id': session_id,
-            'patient_id': patient_id,
-            'exercise_name': exercise_name
-        }
-        self.frame_data = []
-        
+    def __init__(self, registry: SessionRegistry, writer: SessionWriter, sessions: SessionRepository):
+        self.registry = registry
+        self.writer = writer
+        self.sessions = sessions
+    
+    async def start_session(self, patient_id: int, exercise_name: str):
+        start_time = datetime.now()
+        session_id = await self.sessions.create(patient_id, exercise_name, start_time)
+        await run_in_threadpool(self.register_session, session_id, patient_id, exercise_name, start_time)
         return session_id
     
-    def log_frame(self, rep_count: int, angles: dict, errors: list):
-        if not self.current_session:
-            return
+    def register_session(self, session_id: int, patient_id: int, exercise_name: str, start_time: datetime):
+        """Create the session's track and store record (blocking file and store I/O)"""
+        # Empty track (replaces one left from a reused id); the connected worker appends to it
+        try:
+            open_track(SESSION_TRACK_DIR, session_id, exercise_name, start_time.timestamp()).close()
+        except OSError as e:
+            log.warning('track_open_failed', session=session_id, error=str(e))
         
-        self.frame_data.append({
-            'timestamp': datetime.now().isoformat(),
-            'rep_count': rep_count,
-            'angles': angles,
-            'errors': errors
-        })
+        self.registry.start(session_id, patient_id, exercise_name, start_time.timestamp())
     
-    def end_session(self):
-        if not self.current_session:
-            return None
+    async def end_session(self, session_id: int, patient_id: int):
+        """
+        Remove the session from the store and summarise it, on worker threads (store I/O, track flush)
         
-        conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor()
+        Raises:
+            SessionNotFound: No live session with this id for this patient
+        """
+        active = await run_in_threadpool(self.registry.pop, session_id, patient_id)
+        return await run_in_threadpool(self.finish_session, active)
+    
+    def finish_session(self, active: ActiveSession):
+        """
+        Close the session's track and compute its summary (ended or evicted sessions)
         
-        # Get session start time
-        cursor.execute("SELECT start_time FROM sessions WHERE id = %s", (self.current_session['id'],))
-        start_time_str = cursor.fetchone()[0]
-        start_time = datetime.fromisoformat(start_time_str)
+        The summary is returned right away; the sessions / session_errors rows are written by
+        the background writer.
+        """
+        active.close()
+        rep_counter = active.analysis.rep_counter
         
+        start_time = datetime.fromtimestamp(active.started_at)
         end_time = datetime.now()
         duration = (end_time - start_time).seconds
         
         # GET ERROR SUMMARY FROM REP COUNTER (instead of counting frames)
         error_counts = {}
-        if self.active_rep_counter:
-            error_summary = self.active_rep_counter.get_error_summary()
-            # Convert to format expected by database
-            for error_name, count in error_summary.items():
-                error_counts[error_name] = {
-                    'count': count,
-                    'severity': 'high'  # Default severity
-                }
+        # Convert to format expected by database
+        for error_name, count in rep_counter.get_error_summary().items():
+            error_counts[error_name] = {
+                'count': count,
+                'severity': 'high'  # Default severity
+            }
         
         # Calculate stats
-        total_reps = self.active_rep_counter.rep_count if self.active_rep_counter else 0
+        total_reps = rep_counter.rep_count
         
         # Calculate accuracy: Count reps with NO errors (empty error list)
-        correct_reps = 0
-        if self.active_rep_counter and self.active_rep_counter.all_rep_errors:
-            # A rep is correct if its error list is EMPTY
-            correct_reps = sum(1 for rep_errors in self.active_rep_counter.all_rep_errors if len(rep_errors) == 0)
-            
-            # Debug log
-            print(f"\n SESSION SUMMARY:")
-            print(f"   Total reps: {total_reps}")
-            print(f"   All rep errors: {self.active_rep_counter.all_rep_errors}")
-            print(f"   Correct reps (no errors): {correct_reps}")
-            for i, rep_errors in enumerate(self.active_rep_counter.all_rep_errors, 1):
-                if len(rep_errors) == 0:
-                    print(f"   Rep {i}: CORRECT (no errors)")
-                else:
-                    print(f"   Rep {i}: ERRORS: {rep_errors}")
-        
+        # A rep is correct if its error list is EMPTY
+        correct_reps = sum(1 for rep_errors in rep_counter.all_rep_errors if len(rep_errors) == 0)
         accuracy = (correct_reps / total_reps * 100) if total_reps > 0 else 0
         
-        # Update session
-        cursor.execute("""
-            UPDATE sessions
-            SET end_time = %s, total_reps = %s, correct_reps = %s, accuracy = %s, duration_seconds = %s
-            WHERE id = %s
-        """, (end_time.isoformat(), total_reps, correct_reps, accuracy, duration, self.current_session['id']))
-        
-        # Save error stats (now per-rep counts, not per-frame!)
-        for error_name, info in error_counts.items():
-            cursor.execute("""
-                INSERT INTO session_errors (session_id, error_name, count, severity)
-                VALUES (%s, %s, %s, %s)
-            """, (self.current_session['id'], error_name, info['count'], info['severity']))
+        log.info('session_ended', session=active.session_id, exercise=active.exercise_type,
+                 reps=total_reps, correct_reps=correct_reps, accuracy=accuracy, duration=duration)
+        log.debug('session_rep_errors', session=active.session_id, rep_errors=rep_counter.all_rep_errors)
         
-        conn.commit()
-        conn.close()
+        # Update session + save error stats (per-rep counts) in one background transaction
+        self.writer.add_summary(SessionSummary(
+            active.session_id, end_time.isoformat(), total_reps, correct_reps, accuracy, duration, error_counts
+        ))
         
         result = {
-            'session_id': self.current_session['id'],
+            'session_id': active.session_id,
             'total_reps': total_reps,
             'correct_reps': correct_reps,
             'accuracy': round(accuracy, 2),
@@ -1222,30 +667,47 @@ class SessionManager:
             'common_errors': error_counts
         }
         
-        self.current_session = None
-        self.frame_data = []
-        self.active_rep_counter = None  # Clear reference
-        
         return result
 
 
-session_manager = SessionManager()
+def open_live_session(record: SessionRecord):
+    """Analysis state and track of a session a connection attaches to on this worker"""
+    track = None
+    try:
+        track = open_track(SESSION_TRACK_DIR, record.session_id, record.exercise_type, record.started_at, append=True)
+    except (OSError, ValueError) as e:
+        log.warning('track_open_failed', session=record.session_id, error=str(e))
+    session_log = SessionLogger(record.exercise_type, session_id=record.session_id)
+    return ExerciseSession(record.exercise_type, log=session_log), track
+
+
+# Data access for the routes: queries run on a thread pool the size of the connection pool, so a
+# slow query never blocks the event loop that drives the exercise WebSockets
+data_access = DataAccess(db_pool)
+user_repo = UserRepository(data_access)
+session_repo = SessionRepository(data_access)
+error_repo = ErrorRepository(data_access)
+limits_repo = LimitsRepository(data_access)
+
+# Started sessions by id; idle ones (no connection) are ended after SESSION_IDLE_SECONDS
+session_registry = SessionRegistry(
+    open_session_store(SESSION_STORE, REHAB_DATA_DIR),
+    idle_timeout=SESSION_IDLE_SECONDS,
+    open_session=open_live_session
+)
+session_writer = SessionWriter(
+    db_pool.connect,
+    frame_interval=SESSION_FRAME_INTERVAL,
+    max_pending_frames=SESSION_WRITE_QUEUE
+)
+session_manager = SessionManager(session_registry, session_writer, session_repo)
 
 
 # ============= API ROUTES =============
 
-@app.post("/api/auth/login")
+@api_router.post("/api/auth/login")
 async def login(request: LoginRequest):
-    conn = mysql.connector.connect(**DB_CONFIG)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT id, username, role, full_name, age, gender, doctor_id
-        FROM users WHERE username = %s AND password_hash = %s
-    """, (request.username, hash_password(request.password)))
-    
-    user = cursor.fetchone()
-    conn.close()
+    user = await user_repo.authenticate(request.username, hash_password(request.password))
     
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
@@ -1282,47 +744,35 @@ async def login(request: LoginRequest):
     }
 
 
-@app.post("/api/auth/register")
+@api_router.post("/api/auth/register")
 async def register(request: RegisterRequest):
-    conn = mysql.connector.connect(**DB_CONFIG)
-    cursor = conn.cursor()
-    
     try:
-        cursor.execute("""
-            INSERT INTO users (username, password_hash, role, full_name, age, gender, created_at, doctor_id)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
+        user_id = await user_repo.create(
             request.username,
             hash_password(request.password),
             request.role,
             request.full_name,
             request.age,
             request.gender,
-            datetime.now().isoformat(),
             request.doctor_id
-        ))
-        
-        user_id = cursor.lastrowid
-        conn.commit()
-        
-        token = create_token(user_id, request.username, request.role)
-        
-        return {
-            'token': token,
-            'user': {
-                'id': user_id,
-                'username': request.username,
-                'role': request.role,
-                'full_name': request.full_name
-            }
-        }
+        )
     except mysql.connector.IntegrityError:
         raise HTTPException(status_code=400, detail="Username already exists")
-    finally:
-        conn.close()
+    
+    token = create_token(user_id, request.username, request.role)
+    
+    return {
+        'token': token,
+        'user': {
+            'id': user_id,
+            'username': request.username,
+            'role': request.role,
+            'full_name': request.full_name
+        }
+    }
 
 
-@app.get("/api/exercises")
+@api_router.get("/api/exercises")
 async def get_exercises(current_user = Depends(get_current_user)):
     return {
         "exercises": [
@@ -1334,289 +784,152 @@ async def get_exercises(current_user = Depends(get_current_user)):
     }
 
 
-@app.post("/api/sessions/start")
+@api_router.post("/api/sessions/start")
 async def start_session(exercise_name: str, current_user = Depends(get_current_user)):
-    session_id = session_manager.start_session(current_user['user_id'], exercise_name)
+    session_id = await session_manager.start_session(current_user['user_id'], exercise_name)
     return {'session_id': session_id}
 
 
-@app.post("/api/sessions/{session_id}/end")
+async def wait_for_release(session_id: int, timeout: float = SESSION_CHECKPOINT_SECONDS):
+    """
+    Wait (briefly) until no other worker runs the session, so its final checkpoint is saved
+
+    The client closes its WebSocket just before ending the session; the worker holding that
+    connection may not have noticed yet.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        record = await run_in_threadpool(session_registry.store.get, session_id)
+        if record is None or record.owner is None or session_registry.connected(session_id):
+            return
+        await asyncio.sleep(0.05)
+
+
+@api_router.post("/api/sessions/{session_id}/end")
 async def end_session(session_id: int, current_user = Depends(get_current_user)):
-    result = session_manager.end_session()
+    await wait_for_release(session_id)
+    try:
+        result = await session_manager.end_session(session_id, current_user['user_id'])
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Không tìm thấy buổi tập đang diễn ra")
     return result
 
 
-@app.get("/api/sessions/my-history")
-async def get_my_history(limit: int = 20, current_user = Depends(get_current_user)):
-    conn = mysql.connector.connect(**DB_CONFIG)
-    cursor = conn.cursor()
+# Most sessions one history page returns; older ones are fetched with the page's next_cursor
+HISTORY_PAGE_MAX = 100
+
+
+async def history_page(patient_id: int, limit: int, before_time: Optional[str], before_id: Optional[int]):
+    """
+    A page of a patient's session history, latest first
+
+    Pass the previous page's next_cursor (before_time, before_id) to get the sessions before it;
+    next_cursor is None on the last page.
+    """
+    if (before_time is None) != (before_id is None):
+        raise HTTPException(status_code=400, detail="before_time và before_id phải đi cùng nhau")
+    limit = min(max(limit, 1), HISTORY_PAGE_MAX)
+    before = (before_time, before_id) if before_time is not None else None
     
-    cursor.execute("""
-        SELECT id, exercise_name, start_time, total_reps, correct_reps, accuracy, duration_seconds
-        FROM sessions
-        WHERE patient_id = %s
-        ORDER BY start_time DESC
-        LIMIT %s
-    """, (current_user['user_id'], limit))
+    sessions = await session_repo.history(patient_id, limit + 1, before)
+    next_cursor = None
+    if len(sessions) > limit:
+        sessions = sessions[:limit]
+        next_cursor = {'before_time': sessions[-1]['start_time'], 'before_id': sessions[-1]['id']}
+    return {'sessions': translate_history(sessions), 'next_cursor': next_cursor}
 
-    sessions = []
-    for row in cursor.fetchall():
-        # Get errors for this session
-        cursor.execute("""
-            SELECT error_name, count, severity
-            FROM session_errors
-            WHERE session_id = %s
-        """, (row[0],))
-
-        errors = [{'name': get_vietnamese_error_name(e[0]), 'count': e[1], 'severity': e[2]} for e in cursor.fetchall()]
-
-        sessions.append({
-            'id': row[0],
-            'exercise_name': get_vietnamese_exercise_name(row[1]),
-            'start_time': row[2],
-            'total_reps': row[3],
-            'correct_reps': row[4],
-            'accuracy': row[5],
-            'duration_seconds': row[6],
-            'errors': errors
-        })
 
-    conn.close()
-    return {'sessions': sessions}
+@api_router.get("/api/sessions/my-history")
+async def get_my_history(limit: int = 20, before_time: Optional[str] = None, before_id: Optional[int] = None,
+                         current_user = Depends(get_current_user)):
+    return await history_page(current_user['user_id'], limit, before_time, before_id)
 
 
-@app.get("/api/sessions/error-analytics")
+@api_router.get("/api/sessions/error-analytics")
 async def get_error_analytics(current_user = Depends(get_current_user)):
     """Get error analytics grouped by exercise type"""
-    conn = mysql.connector.connect(**DB_CONFIG)
-    cursor = conn.cursor()
-    
-    # Get error statistics grouped by exercise type
-    cursor.execute("""
-        SELECT 
-            s.exercise_name,
-            se.error_name,
-            SUM(se.count) as total_count,
-            COUNT(DISTINCT s.id) as session_count
-        FROM session_errors se
-        JOIN sessions s ON se.session_id = s.id
-        WHERE s.patient_id = %s
-        GROUP BY s.exercise_name, se.error_name
-        ORDER BY s.exercise_name, total_count DESC
-    """, (current_user['user_id'],))
-    
-    # Organize by exercise type and merge duplicate errors after Vietnamese translation
-    analytics = {}
-    for row in cursor.fetchall():
-        exercise_name = row[0]
-        error_name = row[1]
-        total_count = row[2]
-        session_count = row[3]
-        
-        # Convert to Vietnamese names
-        vietnamese_exercise = get_vietnamese_exercise_name(exercise_name)
-        vietnamese_error = get_vietnamese_error_name(error_name)
-        
-        if vietnamese_exercise not in analytics:
-            analytics[vietnamese_exercise] = {
-                'exercise_name': vietnamese_exercise,
-                'errors': {}  # Use dict to merge duplicates
-            }
-        
-        # Merge errors with same Vietnamese name
-        if vietnamese_error not in analytics[vietnamese_exercise]['errors']:
-            analytics[vietnamese_exercise]['errors'][vietnamese_error] = {
-                'error_name': vietnamese_error,
-                'total_count': 0,
-                'session_count': 0
-            }
-        
-        analytics[vietnamese_exercise]['errors'][vietnamese_error]['total_count'] += total_count
-        analytics[vietnamese_exercise]['errors'][vietnamese_error]['session_count'] += session_count
-    
-    # Convert errors dict to list and calculate averages
-    result = []
-    for exercise in analytics.values():
-        errors_list = []
-        for error in exercise['errors'].values():
-            errors_list.append({
-                'error_name': error['error_name'],
-                'total_count': error['total_count'],
-                'session_count': error['session_count'],
-                'avg_per_session': round(error['total_count'] / error['session_count'], 1) if error['session_count'] > 0 else 0
-            })
-        result.append({
-            'exercise_name': exercise['exercise_name'],
-            'errors': sorted(errors_list, key=lambda x: x['total_count'], reverse=True)
-        })
-    
-    conn.close()
-    return {'analytics': result}
+    rows = await error_repo.totals(current_user['user_id'])
+    return {'analytics': summarize_error_totals(rows)}
 
 
-@app.get("/api/doctor/patients")
+@api_router.get("/api/doctor/patients")
 async def get_my_patients(current_user = Depends(get_current_user)):
     if current_user['role'] != 'doctor':
         raise HTTPException(status_code=403, detail="Doctors only")
     
-    conn = mysql.connector.connect(**DB_CONFIG)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT id, username, full_name, age, gender, created_at
-        FROM users
-        WHERE role = 'patient' AND doctor_id = %s
-        ORDER BY full_name
-    """, (current_user['user_id'],))
-    
-    patients = []
-    for row in cursor.fetchall():
-        # Get latest session
-        cursor.execute("""
-            SELECT start_time, exercise_name, accuracy
-            FROM sessions
-            WHERE patient_id = %s
-            ORDER BY start_time DESC
-            LIMIT 1
-        """, (row[0],))
-        
-        last_session = cursor.fetchone()
-        
-        patients.append({
-            'id': row[0],
-            'username': row[1],
-            'full_name': row[2],
-            'age': row[3],
-            'gender': row[4],
-            'created_at': row[5],
-            'last_session': {
-                'date': last_session[0] if last_session else None,
-                'exercise': last_session[1] if last_session else None,
-                'accuracy': last_session[2] if last_session else None
-            } if last_session else None
-        })
-    
-    conn.close()
+    patients = await user_repo.patients_of(current_user['user_id'])
     return {'patients': patients}
 
 
-@app.get("/api/doctor/patient/{patient_id}/history")
-async def get_patient_history(patient_id: int, limit: int = 20, current_user = Depends(get_current_user)):
+async def require_own_patient(patient_id: int, current_user):
+    """
+    Raises:
+        HTTPException: 403 unless the caller is a doctor and the patient is assigned to them
+    """
     if current_user['role'] != 'doctor':
         raise HTTPException(status_code=403, detail="Doctors only")
+    if not await user_repo.is_patient_of(patient_id, current_user['user_id']):
+        raise HTTPException(status_code=403, detail="Bệnh nhân không thuộc quyền quản lý của bác sĩ")
+
+
+@api_router.get("/api/doctor/patient/{patient_id}/history")
+async def get_patient_history(patient_id: int, limit: int = 20, before_time: Optional[str] = None,
+                              before_id: Optional[int] = None, current_user = Depends(get_current_user)):
+    await require_own_patient(patient_id, current_user)
     
-    conn = mysql.connector.connect(**DB_CONFIG)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT id, exercise_name, start_time, total_reps, correct_reps, accuracy, duration_seconds
-        FROM sessions
-        WHERE patient_id = %s
-        ORDER BY start_time DESC
-        LIMIT %s
-    """, (patient_id, limit))
-    
-    sessions = []
-    for row in cursor.fetchall():
-        # Get errors
-        cursor.execute("""
-            SELECT error_name, count, severity
-            FROM session_errors
-            WHERE session_id = %s
-        """, (row[0],))
-        
-        errors = [{'name': get_vietnamese_error_name(e[0]), 'count': e[1], 'severity': e[2]} for e in cursor.fetchall()]
-        
-        sessions.append({
-            'id': row[0],
-            'exercise_name': get_vietnamese_exercise_name(row[1]),
-            'start_time': row[2],
-            'total_reps': row[3],
-            'correct_reps': row[4],
-            'accuracy': row[5],
-            'duration_seconds': row[6],
-            'errors': errors
-        })
-    
-    conn.close()
-    return {'sessions': sessions}
+    return await history_page(patient_id, limit, before_time, before_id)
 
 
-@app.get("/api/doctor/patient/{patient_id}/error-analytics")
+@api_router.get("/api/doctor/patient/{patient_id}/error-analytics")
 async def get_patient_error_analytics(patient_id: int, current_user = Depends(get_current_user)):
     """Get error analytics for a specific patient grouped by exercise type"""
-    if current_user['role'] != 'doctor':
-        raise HTTPException(status_code=403, detail="Doctors only")
-    
-    conn = mysql.connector.connect(**DB_CONFIG)
-    cursor = conn.cursor()
+    await require_own_patient(patient_id, current_user)
     
-    # Get error statistics grouped by exercise type
-    cursor.execute("""
-        SELECT 
-            s.exercise_name,
-            se.error_name,
-            SUM(se.count) as total_count,
-            COUNT(DISTINCT s.id) as session_count
-        FROM session_errors se
-        JOIN sessions s ON se.session_id = s.id
-        WHERE s.patient_id = %s
-        GROUP BY s.exercise_name, se.error_name
-        ORDER BY s.exercise_name, total_count DESC
-    """, (patient_id,))
+    rows = await error_repo.totals(patient_id)
+    return {'analytics': summarize_error_totals(rows)}
+
+
+# Most recorded sessions one re-score request decodes
+RESCORE_SESSIONS_MAX = 500
+
+
+def _rescore_tracks(session_ids: List[int], exercise_type: str, down_angle: Optional[float], up_angle: Optional[float]):
+    """Load the stored tracks and re-score them (CPU-bound, runs in the thread pool)"""
+    sessions = []
+    missing = []
+    for session_id in session_ids:
+        path = SESSION_TRACK_DIR / f"{session_id}.track"
+        try:
+            sessions.append(load_session_angles(session_id, path))
+        except (OSError, ValueError):
+            missing.append(session_id)
+    
+    result = rescore_sessions(sessions, exercise_type, down_angle, up_angle)
+    result['missing_sessions'] = missing
+    return result
+
+
+@api_router.post("/api/doctor/patient/{patient_id}/rescore")
+async def rescore_patient_sessions(patient_id: int, request: RescoreRequest, current_user = Depends(get_current_user)):
+    """Re-run rep counting / error detection over a patient's recorded sessions with candidate thresholds"""
+    await require_own_patient(patient_id, current_user)
     
-    # Organize by exercise type and merge duplicate errors after Vietnamese translation
-    analytics = {}
-    for row in cursor.fetchall():
-        exercise_name = row[0]
-        error_name = row[1]
-        total_count = row[2]
-        session_count = row[3]
-        
-        # Convert to Vietnamese names
-        vietnamese_exercise = get_vietnamese_exercise_name(exercise_name)
-        vietnamese_error = get_vietnamese_error_name(error_name)
-        
-        if vietnamese_exercise not in analytics:
-            analytics[vietnamese_exercise] = {
-                'exercise_name': vietnamese_exercise,
-                'errors': {}  # Use dict to merge duplicates
-            }
-        
-        # Merge errors with same Vietnamese name
-        if vietnamese_error not in analytics[vietnamese_exercise]['errors']:
-            analytics[vietnamese_exercise]['errors'][vietnamese_error] = {
-                'error_name': vietnamese_error,
-                'total_count': 0,
-                'session_count': 0
-            }
-        
-        analytics[vietnamese_exercise]['errors'][vietnamese_error]['total_count'] += total_count
-        analytics[vietnamese_exercise]['errors'][vietnamese_error]['session_count'] += session_count
+    limit = min(max(request.limit, 1), RESCORE_SESSIONS_MAX)
+    stored = await session_repo.scores(patient_id, request.exercise_type, limit)
     
-    # Convert errors dict to list and calculate averages
-    result = []
-    for exercise in analytics.values():
-        errors_list = []
-        for error in exercise['errors'].values():
-            errors_list.append({
-                'error_name': error['error_name'],
-                'total_count': error['total_count'],
-                'session_count': error['session_count'],
-                'avg_per_session': round(error['total_count'] / error['session_count'], 1) if error['session_count'] > 0 else 0
-            })
-        result.append({
-            'exercise_name': exercise['exercise_name'],
-            'errors': sorted(errors_list, key=lambda x: x['total_count'], reverse=True)
-        })
+    result = await run_in_threadpool(
+        _rescore_tracks, list(stored), request.exercise_type, request.down_angle, request.up_angle
+    )
     
-    conn.close()
-    return {'analytics': result}
+    # Show the recorded scores next to the re-computed ones
+    for session in result['sessions']:
+        session['stored'] = stored[session['session_id']]
+    return result
 
 
 # ============= AI PERSONALIZATION ENDPOINTS =============
 
-@app.post("/api/profile/update")
+@api_router.post("/api/profile/update")
 async def update_profile(
     request: UpdateProfileRequest,
     credentials: HTTPAuthorizationCredentials = Depends(security)
@@ -1625,57 +938,39 @@ async def update_profile(
     token_data = verify_token(credentials)
     user_id = token_data['user_id']
     
-    conn = mysql.connector.connect(**DB_CONFIG)
-    cursor = conn.cursor()
-    
     # Calculate BMI if height and weight provided
     bmi = None
     if request.height_cm and request.weight_kg:
         bmi = request.weight_kg / ((request.height_cm / 100) ** 2)
     
     # Update user profile
-    update_fields = []
-    update_values = []
+    fields = {}
     
     if request.age is not None:
-        update_fields.append("age = %s")
-        update_values.append(request.age)
+        fields['age'] = request.age
     
     if request.gender:
-        update_fields.append("gender = %s")
-        update_values.append(request.gender)
+        fields['gender'] = request.gender
     
     if request.height_cm is not None:
-        update_fields.append("height_cm = %s")
-        update_values.append(request.height_cm)
+        fields['height_cm'] = request.height_cm
     
     if request.weight_kg is not None:
-        update_fields.append("weight_kg = %s")
-        update_values.append(request.weight_kg)
+        fields['weight_kg'] = request.weight_kg
     
     if bmi is not None:
-        update_fields.append("bmi = %s")
-        update_values.append(bmi)
+        fields['bmi'] = bmi
     
     if request.medical_conditions is not None:
-        update_fields.append("medical_conditions = %s")
-        update_values.append(request.medical_conditions)
+        fields['medical_conditions'] = request.medical_conditions
     
     if request.mobility_level:
-        update_fields.append("mobility_level = %s")
-        update_values.append(request.mobility_level)
+        fields['mobility_level'] = request.mobility_level
     
     if request.pain_level is not None:
-        update_fields.append("pain_level = %s")
-        update_values.append(request.pain_level)
+        fields['pain_level'] = request.pain_level
     
-    if update_fields:
-        update_values.append(user_id)
-        query = f"UPDATE users SET {', '.join(update_fields)} WHERE id = %s"
-        cursor.execute(query, update_values)
-        conn.commit()
-    
-    conn.close()
+    await user_repo.update_profile(user_id, fields)
     
     return {
         'success': True,
@@ -1684,25 +979,13 @@ async def update_profile(
     }
 
 
-@app.get("/api/profile/me")
+@api_router.get("/api/profile/me")
 async def get_my_profile(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Get current user's profile"""
     token_data = verify_token(credentials)
     user_id = token_data['user_id']
     
-    conn = mysql.connector.connect(**DB_CONFIG)
-    cursor = conn.cursor(dictionary=True)
-    
-    cursor.execute("""
-        SELECT id, username, full_name, age, gender, height_cm, weight_kg, bmi,
-               medical_conditions, injury_type, mobility_level, pain_level, 
-               doctor_notes, contraindicated_exercises, role
-        FROM users
-        WHERE id = %s
-    """, (user_id,))
-    
-    user = cursor.fetchone()
-    conn.close()
+    user = await user_repo.profile(user_id)
     
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -1710,7 +993,7 @@ async def get_my_profile(credentials: HTTPAuthorizationCredentials = Depends(sec
     return dict(user)
 
 
-@app.post("/api/personalized-params")
+@api_router.post("/api/personalized-params")
 async def get_personalized_params(
     request: PersonalizedParamsRequest,
     credentials: HTTPAuthorizationCredentials = Depends(security)
@@ -1724,20 +1007,9 @@ async def get_personalized_params(
     user_id = token_data['user_id']
     
     # Get user data
-    conn = mysql.connector.connect(**DB_CONFIG)
-    cursor = conn.cursor(dictionary=True)
-    
-    cursor.execute("""
-        SELECT age, gender, height_cm, weight_kg, bmi, medical_conditions,
-               injury_type, mobility_level, pain_level
-        FROM users
-        WHERE id = %s
-    """, (user_id,))
-    
-    user_row = cursor.fetchone()
+    user_row = await user_repo.biometrics(user_id)
     
     if not user_row:
-        conn.close()
         raise HTTPException(status_code=404, detail="User not found")
     
     user_data = dict(user_row)
@@ -1749,207 +1021,279 @@ async def get_personalized_params(
     )
     
     # Save to database
-    cursor.execute("""
-        INSERT INTO user_exercise_limits
-        (user_id, exercise_type, max_depth_angle, min_raise_angle,
-         max_reps_per_set, recommended_rest_seconds, difficulty_score,
-         injury_risk_score, created_at, updated_at)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ON DUPLICATE KEY UPDATE
-        max_depth_angle = VALUES(max_depth_angle),
-        min_raise_angle = VALUES(min_raise_angle),
-        max_reps_per_set = VALUES(max_reps_per_set),
-        recommended_rest_seconds = VALUES(recommended_rest_seconds),
-        difficulty_score = VALUES(difficulty_score),
-        injury_risk_score = VALUES(injury_risk_score),
-        updated_at = VALUES(updated_at)
-    """, (
-        user_id,
-        request.exercise_type,
-        params.get('down_angle'),
-        params.get('up_angle'),
-        params.get('max_reps'),
-        params.get('rest_seconds'),
-        params.get('difficulty_score'),
-        0.0,  # injury_risk_score - will implement later
-        datetime.now().isoformat(),
-        datetime.now().isoformat()
-    ))
-    
-    conn.commit()
-    conn.close()
+    await limits_repo.save(user_id, request.exercise_type, params)
     
     return params
 
 
-@app.websocket("/ws/exercise/{exercise_type}")
-async def websocket_endpoint(websocket: WebSocket, exercise_type: str):
+async def receive_auth_token(websocket: WebSocket) -> Optional[str]:
+    """
+    Read the JWT from the first message of a session-bound WebSocket connection
+    
+    The token is sent as {"type": "auth", "token": "..."} right after the connection opens rather
+    than in the URL, which ends up in the uvicorn and proxy access logs.
+    
+    Returns:
+        The token, '' when the first message is not a valid auth message, None when the client
+        closed the connection or did not send anything within SESSION_AUTH_SECONDS
+    """
+    try:
+        raw = await asyncio.wait_for(websocket.receive(), timeout=SESSION_AUTH_SECONDS)
+    except asyncio.TimeoutError:
+        return None
+    if raw['type'] == 'websocket.disconnect':
+        return None
+    try:
+        message = json.loads(raw.get('text') or '')
+    except ValueError:
+        return ''
+    if not isinstance(message, dict) or message.get('type') != 'auth':
+        return ''
+    token = message.get('token')
+    return token if isinstance(token, str) else ''
+
+
+@inference_router.websocket("/ws/exercise/{exercise_type}")
+async def websocket_endpoint(websocket: WebSocket, exercise_type: str, encoding: str = 'json',
+                             session_id: Optional[int] = None):
     await websocket.accept()
     
-    angle_calc = AngleCalculator()
-    rep_counter = RepetitionCounter(exercise_type)
-    error_detector = ErrorDetector(exercise_type)
+    # ?encoding=compact -> binary analysis messages with quantized landmarks (see pose_engine.protocol)
+    compact = encoding == 'compact'
+    
+    # ?session_id= plus an auth message -> bind to the patient's started session (recorded and
+    # summarised); without them the connection only analyses (preview, nothing is stored)
+    active = None
+    if session_id is not None:
+        token = await receive_auth_token(websocket)
+        if token is None:
+            try:
+                await websocket.close(code=1008)
+            except Exception:
+                pass  # Client already gone
+            return
+        error = None
+        stale = None
+        try:
+            user = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            record = await run_in_threadpool(session_registry.get, session_id, user['user_id'])
+            if record.exercise_type != exercise_type:
+                error = 'Bài tập không khớp với buổi tập'
+            else:
+                # Resumes from the session's checkpoint (started or last run on any worker); a
+                # reconnect takes over from a connection that has not noticed its client left
+                active, stale = await run_in_threadpool(session_registry.attach, session_id, user['user_id'], websocket)
+        except (jwt.InvalidTokenError, SessionNotFound):
+            error = 'Buổi tập không tồn tại hoặc đã kết thúc'
+        if error:
+            await websocket.send_json({'type': 'error', 'message': error})
+            await websocket.close(code=1008)
+            return
+        if stale is not None:
+            try:
+                await stale.send_json({'type': 'error', 'message': 'Buổi tập đã được mở ở một kết nối khác'})
+                await stale.close(code=1008)
+            except Exception:
+                pass  # Already gone
+    
+    # Each session gets its own Pose graph so tracking state is never shared between patients
+    try:
+        pose_lease = await pose_pool.acquire()
+    except Exception as e:
+        # Busy, or the inference workers could not be started / warmed up (e.g. first lazy start)
+        if isinstance(e, PoolExhausted):
+            message, code = 'Máy chủ đang quá tải, vui lòng thử lại sau', 1013
+        else:
+            log.exception('pose_pool_unavailable', exercise=exercise_type)
+            message, code = 'Không thể khởi động bộ phân tích tư thế, vui lòng thử lại sau', 1011
+        if active:
+            await run_in_threadpool(session_registry.detach, active, websocket)
+        try:
+            await websocket.send_json({'type': 'error', 'message': message})
+            await websocket.close(code=code)
+        except Exception:
+            pass  # Client already gone
+        return
+    
+    metrics.ACTIVE_SESSIONS.inc()
+    resumed = None
+    if active:
+        session = active.analysis  # Counter state lives as long as the started session
+        if active.resumed:
+            metrics.SESSIONS_RESUMED.inc()
+            resumed = {
+                'type': 'resumed',
+                'session_id': active.session_id,
+                'rep_count': session.rep_counter.rep_count,
+                'state': session.rep_counter.get_state().value,
+                **session.rep_counter.get_extras()
+            }
+    else:
+        session = ExerciseSession(exercise_type, log=SessionLogger(exercise_type))
+    session_log = session.log  # Per-frame events only for sampled sessions
+    
+    # Latest-frame-wins: only the newest undecoded frame waits for analysis, older ones are dropped
+    frame_slot = LatestFrameSlot()
     
-    # Store rep_counter reference in session_manager
-    session_manager.active_rep_counter = rep_counter
+    # Per-stage latency histograms (see /metrics)
+    timer = metrics.StageTimer()
     
-    last_process_time = 0
-    prev_rep_count = 0  # Track previous rep count to detect new reps
+    recorder = open_recorder(POSE_RECORD_DIR, exercise_type) if POSE_RECORD_DIR else None
     
-    try:
+    async def receive_loop():
+        """Keep draining the socket so frames never queue up behind a slow analysis"""
         while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            raw = await websocket.receive()
+            if raw['type'] == 'websocket.disconnect':
+                raise WebSocketDisconnect(raw.get('code', 1000))
             
-            # NEW: Handle custom thresholds
-            if message['type'] == 'set_thresholds':
-                thresholds = message.get('thresholds', {})
-                print(f" Received custom thresholds: {thresholds}")
-                
-                # Apply custom thresholds to rep_counter
-                if 'down_angle' in thresholds and thresholds['down_angle']:
-                    if exercise_type == 'squat':
-                        rep_counter.down_threshold = thresholds['down_angle']
-                        print(f"   Squat down_threshold: {rep_counter.down_threshold}°")
-                    elif exercise_type == 'arm_raise':
-                        rep_counter.down_threshold = thresholds['down_angle']
-                        print(f"   Arm raise down_threshold: {rep_counter.down_threshold}°")
-                
-                if 'up_angle' in thresholds and thresholds['up_angle']:
-                    if exercise_type == 'squat':
-                        rep_counter.up_threshold = thresholds['up_angle']
-                        print(f"   Squat up_threshold: {rep_counter.up_threshold}°")
-                    elif exercise_type == 'arm_raise':
-                        rep_counter.up_threshold = thresholds['up_angle']
-                        print(f"   Arm raise up_threshold: {rep_counter.up_threshold}°")
-                
+            # Binary messages are frames (see pose_engine.protocol); text messages are JSON
+            if raw.get('bytes') is not None:
+                frame_slot.put(raw['bytes'])
+                if recorder:
+                    recorder.write(raw['bytes'])
                 continue
             
+            message = json.loads(raw['text'])
+            
             if message['type'] == 'frame':
-                current_time = time.time()
-                if current_time - last_process_time < 0.04:
-                    continue
-                last_process_time = current_time
-                
-                try:
-                    img_data = base64.b64decode(message['data'].split(',')[1])
-                    nparr = np.frombuffer(img_data, np.uint8)
-                    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                    
-                    if frame is None:
-                        continue
-                    
-                    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    results = pose.process(rgb_frame)
-                    
-                    response = {'type': 'analysis', 'pose_detected': False}
-                    
-                    if results.pose_landmarks:
-                        landmarks = results.pose_landmarks.landmark
-                        angles = angle_calc.get_angles(landmarks, exercise_type)
-                        
-                        # GỌI update() thay vì count()
-                        rep_count = rep_counter.update(angles)
-                        
-                        # Reset error timers when new rep starts
-                        if rep_count > prev_rep_count:
-                            error_detector.reset_timers()
-                            prev_rep_count = rep_count
-                        
-                        # Get current state
-                        current_state = rep_counter.get_state()
-                        
-                        # Detect errors with state and rep_counter
-                        errors = error_detector.detect_errors(landmarks, angles, current_state, rep_counter)
-                        
-                        session_manager.log_frame(rep_count, angles, errors)
-                        
-                        pose_landmarks = [
-                            {'x': lm.x, 'y': lm.y, 'z': lm.z, 'visibility': lm.visibility}
-                            for lm in landmarks
-                        ]
-                        
-                        # Feedback based on exercise type and state
-                        if errors:
-                            feedback_msg = errors[0]['message']
-                        else:
-                            if exercise_type == "single_leg_stand":
-                                # Special feedback for single leg stand
-                                if current_state == ExerciseState.READY:
-                                    side_text = "trái" if rep_counter.get_current_side() == "left" else "phải"
-                                    feedback_msg = f' Sẵn sàng - Co chân {side_text} lên'
-                                elif current_state == ExerciseState.LIFTING:
-                                    feedback_msg = ' Đang co chân lên...'
-                                elif current_state == ExerciseState.HOLDING:
-                                    remaining = rep_counter.get_hold_time_remaining()
-                                    if remaining:
-                                        feedback_msg = f' Giữ vững! Còn {int(remaining)}s'
-                                    else:
-                                        feedback_msg = ' Giữ vững!'
-                                elif current_state == ExerciseState.LOWERING:
-                                    feedback_msg = ' Hạ chân từ từ...'
-                                elif current_state == ExerciseState.SWITCH_SIDE:
-                                    feedback_msg = ' Tốt lắm! Đổi bên'
-                                elif current_state == ExerciseState.COMPLETE:
-                                    feedback_msg = ' Hoàn thành 1 rep!'
-                                else:
-                                    feedback_msg = ' Tư thế tốt!'
-                            else:
-                                # Existing feedback for other exercises
-                                if current_state == ExerciseState.RAISING:
-                                    feedback_msg = ' Đang nâng...'
-                                elif current_state == ExerciseState.UP:
-                                    feedback_msg = ' Giữ vững!'
-                                elif current_state == ExerciseState.LOWERING:
-                                    feedback_msg = ' Đang hạ...'
-                                elif current_state == ExerciseState.DOWN:
-                                    feedback_msg = ' Sẵn sàng!'
-                                else:
-                                    feedback_msg = ' Tư thế tốt!'
-                        
-                        # Additional data for single_leg_stand
-                        extra_data = {}
-                        if exercise_type == "single_leg_stand":
-                            extra_data['hold_time_remaining'] = rep_counter.get_hold_time_remaining()
-                            extra_data['current_side'] = rep_counter.get_current_side()
-                        # THÊM MỚI
-                        elif exercise_type == "calf_raise":
-                            if current_state == ExerciseState.DOWN:
-                                feedback_msg = ' Sẵn sàng - Nâng gót lên!'
-                            elif current_state == ExerciseState.RAISING:
-                                feedback_msg = ' Đang nâng gót...'
-                            elif current_state == ExerciseState.UP:
-                                feedback_msg = ' Giữ vững ở trên!'
-                            elif current_state == ExerciseState.LOWERING:
-                                feedback_msg = ' Hạ từ từ...'
-                            else:
-                                feedback_msg = ' Tư thế tốt!'
-                        response = {
-                            'type': 'analysis',
-                            'pose_detected': True,
-                            'landmarks': pose_landmarks,
-                            'angles': {k: round(v, 1) if isinstance(v, (int, float)) else v for k, v in angles.items()},
-                            'rep_count': rep_count,
-                            'errors': errors,
-                            'feedback': feedback_msg,
-                            'state': current_state.value,
-                            **extra_data
-                        }
-                    
-                    await websocket.send_json(response)
-                    
-                except Exception as e:
-                    print(f"Frame error: {e}")
-                    import traceback
-                    traceback.print_exc()  # In full traceback để debug
-                    continue
+                frame_slot.put(message)
+                if recorder:
+                    recorder.write_json_frame(message)
+            
+            # NEW: Handle custom thresholds
+            elif message['type'] == 'set_thresholds':
+                # Apply custom thresholds to rep_counter (only exercises marked tunable accept them)
+                session.set_thresholds(message.get('thresholds', {}))
             
             elif message['type'] == 'reset':
-                rep_counter.reset()
+                session.reset()
                 await websocket.send_json({'type': 'reset_confirmed'})
     
+    async def analysis_loop():
+        """Analyse the freshest frame, one at a time"""
+        nonlocal pose_lease
+        checkpoint_due = time.monotonic() + SESSION_CHECKPOINT_SECONDS
+        while True:
+            frame = await frame_slot.get()
+            if frame is None:
+                return
+            
+            session_log.begin_frame()
+            timer.start()
+            
+            try:
+                if isinstance(frame, bytes):
+                    frame_msg = parse_binary_frame(frame)
+                else:
+                    # Older clients: JSON with a base64 data URL
+                    frame_msg = parse_json_frame(frame)
+                timer.mark('parse')
+                
+                # Decode + pose estimation run in a worker process
+                try:
+                    inference = await pose_lease.process(frame_msg.data, frame_msg.offset)
+                except BrokenProcessPool:
+                    # The graph's worker died (it is being replaced): continue on another graph
+                    session_log.warning('pose_worker_lost')
+                    pose_pool.release(pose_lease)
+                    pose_lease = None
+                    try:
+                        pose_lease = await pose_pool.acquire()
+                    except Exception:  # Busy, or no worker could be started
+                        await websocket.send_json({'type': 'error', 'message': 'Máy chủ đang quá tải, vui lòng thử lại sau'})
+                        await websocket.close(code=1013)
+                        return
+                    continue
+                timer.record_inference(timer.lap(), inference.timings)
+                if active and active.connection is not websocket:
+                    return  # Taken over by a reconnect here: the new connection owns the session state
+                if active and time.monotonic() >= checkpoint_due:
+                    checkpoint_due = time.monotonic() + SESSION_CHECKPOINT_SECONDS
+                    # State snapshot taken here, the store write runs on a worker thread
+                    saved = await run_in_threadpool(session_registry.checkpoint, active, websocket,
+                                                    session.checkpoint())
+                    if not saved:
+                        # Ended, or taken over by a connection on another worker
+                        await websocket.send_json({'type': 'error', 'message': 'Buổi tập đã kết thúc hoặc được mở ở một kết nối khác'})
+                        await websocket.close(code=1008)
+                        return
+                
+                if not inference.frame_ok:
+                    metrics.FRAMES_UNDECODABLE.inc()
+                    continue
+                
+                response = {'type': 'analysis', 'pose_detected': False}
+                
+                if inference.landmarks is not None:
+                    metrics.FRAMES_POSE_DETECTED.inc()
+                    # Counter/error timing follows the client's capture clock (server time for legacy clients)
+                    response = session.analyze(inference.landmarks, timer, frame_timestamp(frame_msg))
+                    if active and not active.ended:
+                        active.log_frame(inference.landmarks, response)
+                        session_writer.add_frame(active.session_id, time.time(), response['rep_count'],
+                                                 session.last_angles, response['errors'])
+                
+                # Echo frame identity so clients can match responses and measure latency
+                if frame_msg.seq is not None:
+                    response['seq'] = frame_msg.seq
+                    response['capture_ts'] = frame_msg.capture_ts
+                response['stats'] = frame_slot.stats()
+                
+                if compact:
+                    payload = encode_analysis(response, inference.landmarks)
+                    timer.mark('encode')
+                    await websocket.send_bytes(payload)
+                else:
+                    if inference.landmarks is not None:
+                        response['landmarks'] = [
+                            {'x': x, 'y': y, 'z': z, 'visibility': v}
+                            for x, y, z, v in inference.landmarks.tolist()
+                        ]
+                    payload = json.dumps(response, separators=(',', ':'), ensure_ascii=False)
+                    timer.mark('encode')
+                    await websocket.send_text(payload)
+                timer.mark('send')
+                timer.finish()
+                
+            except Exception:
+                metrics.FRAME_ERRORS.inc()
+                session_log.exception('frame_error')
+                continue
+            finally:
+                frame_slot.mark_processed()
+    
+    receiver = asyncio.create_task(receive_loop())
+    analyzer = asyncio.create_task(analysis_loop())
+    
+    try:
+        if resumed:
+            await websocket.send_json(resumed)
+        done, _ = await asyncio.wait({receiver, analyzer}, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()  # Re-raise WebSocketDisconnect or any unexpected error
     except WebSocketDisconnect:
-        print("Client disconnected")
+        session_log.info('client_disconnected', **frame_slot.stats())
+    finally:
+        frame_slot.close()
+        receiver.cancel()
+        analyzer.cancel()
+        # Let them stop before the analysis state is saved on a worker thread
+        await asyncio.gather(receiver, analyzer, return_exceptions=True)
+        if pose_lease is not None:
+            pose_pool.release(pose_lease)
+        metrics.ACTIVE_SESSIONS.dec()
+        if active:
+            # Saves the checkpoint to resume from and flushes the track
+            await run_in_threadpool(session_registry.detach, active, websocket)
+        if recorder:
+            recorder.close()
+
+
+if SERVES_API:
+    app.include_router(api_router)
+if SERVES_INFERENCE:
+    app.include_router(inference_router)
 
 
 if __name__ == "__main__":
@@ -9,15 +9,9 @@ from pathlib import Path
 from datetime import datetime
 import os
 import subprocess
-import mysql.connector
 from mysql.connector import Error
 
-DB_CONFIG = {
-    "host": "localhost",
-    "user": "root",
-    "password": "123456",
-    "database": "rehab_v3"
-}
+from db import DB_CONFIG, pool
 def clear_screen():
     os.system('cls' if os.name == 'nt' else 'clear')
 
@@ -28,7 +22,7 @@ def print_header(title):
 
 def connect_db():
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
+        conn = pool.connect()
         return conn
     except Error as e:
         print(f" Cannot connect to MySQL: {e}")
@@ -308,7 +302,7 @@ def backup_database():
     
     host = DB_CONFIG['host']
     user = DB_CONFIG['user']
-    password = DB_CONFIG['ducanh']
+    password = DB_CONFIG['password']
     database = DB_CONFIG['database']
     
     # Try mysqldump
@@ -0,0 +1,307 @@
+"""
+Metrics
+Minimal in-process counters, gauges and histograms rendered in the Prometheus text format (version 0.0.4)
+
+Metrics are module-level objects (like the prometheus_client default registry) so every stage
+of the pose pipeline, the database pool and the background writers can record into them without
+depending on each other; main.py serves REGISTRY.render() on /metrics.
+"""
+
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Seconds; covers sub-millisecond NumPy stages up to slow model inference
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics: List['_Metric'] = []
+
+    def register(self, metric: '_Metric'):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), registry: Optional[Registry] = REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values) -> object:
+        """Child metric for one combination of label values (cache it on hot paths)"""
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _unlabelled(self):
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class _Value:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+
+class _CounterChild(_Value):
+    __slots__ = ()
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class _GaugeChild(_Value):
+    __slots__ = ()
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._unlabelled().inc(amount)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(child.value)}"
+            for key, child in self._children.items()
+        ]
+
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def dec(self, amount: float = 1.0):
+        self._unlabelled().dec(amount)
+
+    def set(self, value: float):
+        self._unlabelled().set(value)
+
+
+class FunctionMetric(_Metric):
+    """Unlabelled metric whose value is computed at scrape time"""
+
+    def __init__(self, name: str, help: str, kind: str, function: Callable[[], float], registry: Optional[Registry] = REGISTRY):
+        super().__init__(name, help, (), registry)
+        self.kind = kind
+        self.function = function
+
+    def samples(self) -> List[str]:
+        return [f"{self.name} {_format_number(self.function())}"]
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+    kind = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        registry: Optional[Registry] = REGISTRY
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._unlabelled().observe(value)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), child.counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_number(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_number(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+# ============= PIPELINE METRICS =============
+
+# Stages measured inside the inference worker (InferenceResult.timings, same order)
+WORKER_STAGES = ('decode', 'convert', 'pose')
+
+# Stages measured on the event loop; 'transfer' is the inference round trip minus the worker stages
+LOOP_STAGES = ('parse', 'transfer', 'angles', 'counting', 'errors', 'encode', 'send')
+
+STAGE_SECONDS = Histogram(
+    'pose_stage_seconds', 'Time spent per frame in each pipeline stage', ('stage',)
+)
+FRAME_SECONDS = Histogram(
+    'pose_frame_seconds', 'Time from taking a frame out of the ingest slot to sending its analysis'
+)
+
+FRAMES_RECEIVED = Counter('pose_frames_received_total', 'Frame messages received from clients')
+FRAMES_PROCESSED = Counter('pose_frames_processed_total', 'Frames taken out of the ingest slot and analysed')
+FRAMES_DROPPED = Counter('pose_frames_dropped_total', 'Frames overwritten by a newer frame before analysis')
+FRAMES_UNDECODABLE = Counter('pose_frames_undecodable_total', 'Frames whose image could not be decoded')
+FRAMES_POSE_DETECTED = Counter('pose_frames_pose_detected_total', 'Analysed frames in which a pose was found')
+FRAME_ERRORS = Counter('pose_frame_errors_total', 'Frames that raised an exception during analysis')
+
+ACTIVE_SESSIONS = Gauge('pose_active_sessions', 'WebSocket exercise sessions holding a Pose graph')
+LIVE_SESSIONS = Gauge('pose_live_sessions', 'Started exercise sessions in the session store')
+SESSIONS_EVICTED = Counter('pose_sessions_evicted_total', 'Sessions removed from the registry after sitting idle')
+CHECKPOINTS_SAVED = Counter('pose_session_checkpoints_total', 'Session state checkpoints saved to the session store')
+SESSIONS_RESUMED = Counter('pose_sessions_resumed_total', 'Reconnects that resumed a session from its checkpoint')
+
+NODE_READY = Gauge('node_ready', '1 once the database is initialised and the pose graphs are warmed up')
+STARTUP_SECONDS = Gauge('startup_step_seconds', 'Time taken by each startup step of this worker', ('step',))
+
+WORKER_CPU_SECONDS = Gauge(
+    'pose_worker_cpu_seconds', 'CPU time used by each inference worker process, as of its last frame', ('worker',)
+)
+
+WORKER_RESTARTS = Counter('pose_worker_restarts_total', 'Inference worker processes replaced after dying')
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Latency of /api/* requests', ('method', 'route', 'status')
+)
+
+
+def _pose_detected_ratio() -> float:
+    processed = FRAMES_PROCESSED._unlabelled().value
+    return FRAMES_POSE_DETECTED._unlabelled().value / processed if processed else 0.0
+
+
+POSE_DETECTED_RATIO = FunctionMetric(
+    'pose_detected_ratio', 'Share of analysed frames in which a pose was found', 'gauge', _pose_detected_ratio
+)
+PROCESS_CPU_SECONDS = FunctionMetric(
+    'process_cpu_seconds_total', 'User and system CPU time of the API process', 'counter', time.process_time
+)
+
+# Pre-created children so the per-frame path does no label lookups
+_STAGE_CHILDREN = {stage: STAGE_SECONDS.labels(stage) for stage in WORKER_STAGES + LOOP_STAGES}
+for _metric in (FRAMES_RECEIVED, FRAMES_PROCESSED, FRAMES_DROPPED, FRAMES_UNDECODABLE,
+                FRAMES_POSE_DETECTED, FRAME_ERRORS, ACTIVE_SESSIONS, LIVE_SESSIONS, SESSIONS_EVICTED,
+                CHECKPOINTS_SAVED, SESSIONS_RESUMED, NODE_READY, FRAME_SECONDS, WORKER_RESTARTS):
+    _metric.labels()
+
+
+class StageTimer:
+    """
+    Records consecutive pipeline stages of one frame into pose_stage_seconds
+
+    start() when a frame is taken, then mark('<stage>') after each stage;
+    each mark records the time since the previous one.
+    """
+
+    __slots__ = ('_start', '_last')
+
+    def __init__(self):
+        self._start = self._last = 0.0
+
+    def start(self):
+        self._start = self._last = time.perf_counter()
+
+    def lap(self) -> float:
+        """Seconds since the previous mark, without recording them"""
+        now = time.perf_counter()
+        elapsed, self._last = now - self._last, now
+        return elapsed
+
+    def mark(self, stage: str):
+        _STAGE_CHILDREN[stage].observe(self.lap())
+
+    def record_inference(self, round_trip: float, worker_timings: Sequence[float]):
+        """Record the worker stages and the remaining queueing/IPC time of one inference call"""
+        for stage, seconds in zip(WORKER_STAGES, worker_timings):
+            _STAGE_CHILDREN[stage].observe(seconds)
+        _STAGE_CHILDREN['transfer'].observe(max(0.0, round_trip - sum(worker_timings)))
+
+    def finish(self):
+        """Record the whole frame into pose_frame_seconds"""
+        FRAME_SECONDS.observe(time.perf_counter() - self._start)
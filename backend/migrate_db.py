@@ -5,19 +5,14 @@ Adds biometric and medical fields to existing users table
 
 import sys
 from datetime import datetime
-import mysql.connector
 from mysql.connector import Error
 
-DB_CONFIG = {
-    "host": "localhost",
-    "user": "root",
-    "password": "123456",
-    "database": "rehab_v3"
-}
+from db import DB_CONFIG, pool
+
 def migrate_database():
     """Add new columns to users table for AI personalization"""
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
+        conn = pool.connect()
         cursor = conn.cursor()
     except Error as e:
         print(f" Cannot connect to MySQL: {e}")
@@ -120,6 +115,33 @@ def migrate_database():
     except Error as e:
         print(f" Failed to create/verify user_exercise_limits table: {e}")
     
+    # Session history pages by (patient_id, start_time, id); TEXT columns cannot be fully indexed
+    cursor.execute("""
+        SELECT DATA_TYPE
+        FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'sessions' AND COLUMN_NAME = 'start_time'
+    """, (DB_CONFIG['database'],))
+    start_time_type = cursor.fetchone()
+    if start_time_type and start_time_type[0].lower() != 'varchar':
+        try:
+            cursor.execute("ALTER TABLE `sessions` MODIFY `start_time` VARCHAR(32) NOT NULL")
+            print(" Changed sessions.start_time to VARCHAR(32)")
+        except Error as e:
+            print(f" Failed to change sessions.start_time: {e}")
+    
+    cursor.execute("""
+        SELECT COUNT(*)
+        FROM INFORMATION_SCHEMA.STATISTICS
+        WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'sessions' AND INDEX_NAME = 'ix_sessions_patient_start'
+    """, (DB_CONFIG['database'],))
+    index_exists = cursor.fetchone()[0] > 0
+    if start_time_type and not index_exists:
+        try:
+            cursor.execute("CREATE INDEX ix_sessions_patient_start ON `sessions` (patient_id, start_time, id)")
+            print(" Created index ix_sessions_patient_start")
+        except Error as e:
+            print(f" Failed to create index ix_sessions_patient_start: {e}")
+    
     conn.commit()
     cursor.close()
     conn.close()
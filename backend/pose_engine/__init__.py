@@ -0,0 +1,39 @@
+"""
+Pose Engine Package for Rehab System
+Contains the MediaPipe inference worker pool, Pose graph leases, declarative exercise definitions,
+batched joint angles, rep counting / error detection, frame ingest, the WebSocket frame protocol,
+frame stream recording, compact session tracks, vectorized re-scoring of stored sessions,
+the session registry and the shared session state store
+"""
+
+from .inference import PoseInferencePool, PoseLease, PoolExhausted, InferenceResult
+from .landmarks import PoseLandmark
+from .exercises import EXERCISE_DEFINITIONS, CompiledExercise, ExerciseState, get_exercise
+from .angles import AngleCalculator
+from .counting import RepetitionCounter, ErrorDetector
+from .session import ExerciseSession
+from .ingest import LatestFrameSlot
+from .recording import FrameRecorder, Recording, open_recorder, read_recording
+from .tracks import Track, TrackFrames, TrackWriter, open_track, read_track
+from .rescoring import SessionAngles, load_session_angles, rescore_sessions
+from .store import MemorySessionStore, SessionRecord, SessionStore, SQLiteSessionStore, open_session_store
+from .registry import ActiveSession, SessionNotFound, SessionRegistry
+from .protocol import (
+    FrameMessage, ProtocolError, parse_binary_frame, parse_json_frame, frame_timestamp, encode_binary_frame,
+    encode_analysis
+)
+
+__all__ = [
+    'PoseInferencePool', 'PoseLease', 'PoolExhausted', 'InferenceResult',
+    'PoseLandmark',
+    'EXERCISE_DEFINITIONS', 'CompiledExercise', 'ExerciseState', 'get_exercise',
+    'AngleCalculator', 'RepetitionCounter', 'ErrorDetector', 'ExerciseSession',
+    'LatestFrameSlot',
+    'FrameRecorder', 'Recording', 'open_recorder', 'read_recording',
+    'Track', 'TrackFrames', 'TrackWriter', 'open_track', 'read_track',
+    'SessionAngles', 'load_session_angles', 'rescore_sessions',
+    'SessionStore', 'SessionRecord', 'MemorySessionStore', 'SQLiteSessionStore', 'open_session_store',
+    'ActiveSession', 'SessionNotFound', 'SessionRegistry',
+    'FrameMessage', 'ProtocolError', 'parse_binary_frame', 'parse_json_frame', 'frame_timestamp',
+    'encode_binary_frame', 'encode_analysis'
+]
@@ -0,0 +1,112 @@
+"""
+Joint Angle Calculation
+Computes every joint angle of an exercise in one batched NumPy pass over a (33, 4) landmark array
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+
+from logs import SessionLogger
+
+from .exercises import get_exercise
+from .landmarks import NUM_LANDMARKS
+
+
+class AngleCalculator:
+    """
+    Batched joint-angle calculator for one exercise session
+
+    The (A, B, C) index table comes from the compiled exercise definition; every frame
+    then computes all angles with a handful of vectorized NumPy calls that
+    write into buffers allocated at construction time.
+    """
+
+    def __init__(self, exercise_type: str, log: Optional[SessionLogger] = None):
+        """
+        Args:
+            exercise_type: Exercise whose angles/features should be computed
+            log: Session logger; sampled frames log their angles at DEBUG
+        """
+        self.exercise_type = exercise_type
+
+        exercise = get_exercise(exercise_type)
+        triplets = exercise.angle_triplets
+        features = exercise.features
+        self.names = [t[0] for t in triplets] + [f[0] for f in features]
+
+        n_angles = len(triplets)
+        n_features = len(features)
+        self._n_angles = n_angles
+
+        self._a = np.array([t[1] for t in triplets], dtype=np.intp)
+        self._b = np.array([t[2] for t in triplets], dtype=np.intp)
+        self._c = np.array([t[3] for t in triplets], dtype=np.intp)
+
+        # Features index the flattened landmark buffer; row NUM_LANDMARKS is all zeros (for "no Q")
+        self._fp = np.array([f[1] * 4 + f[3] for f in features], dtype=np.intp)
+        self._fq = np.array([(NUM_LANDMARKS if f[2] is None else f[2]) * 4 + f[3] for f in features], dtype=np.intp)
+
+        # Reused per-frame buffers
+        self._lm = np.zeros((NUM_LANDMARKS + 1, 4), dtype=np.float64)
+        self._pa = np.empty((n_angles, 2), dtype=np.float64)
+        self._pb = np.empty((n_angles, 2), dtype=np.float64)
+        self._pc = np.empty((n_angles, 2), dtype=np.float64)
+        self._na = np.empty(n_angles, dtype=np.float64)
+        self._nc = np.empty(n_angles, dtype=np.float64)
+        self._fq_buf = np.empty(n_features, dtype=np.float64)
+        self.values = np.empty(n_angles + n_features, dtype=np.float64)
+
+        self.log = log
+
+    def compute(self, landmarks: np.ndarray) -> np.ndarray:
+        """
+        Compute all angles (degrees) and coordinate features for one frame
+
+        Args:
+            landmarks: (33, 4) array of x, y, z, visibility
+
+        Returns:
+            Array aligned with self.names (a view of an internal buffer, overwritten next frame)
+        """
+        lm = self._lm
+        np.copyto(lm[:NUM_LANDMARKS], landmarks)
+        xy = lm[:, :2]
+
+        n = self._n_angles
+        if n:
+            ba, pb, bc = self._pa, self._pb, self._pc
+            np.take(xy, self._a, axis=0, out=ba)
+            np.take(xy, self._b, axis=0, out=pb)
+            np.take(xy, self._c, axis=0, out=bc)
+            np.subtract(ba, pb, out=ba)
+            np.subtract(bc, pb, out=bc)
+
+            angles = self.values[:n]
+            np.einsum('ij,ij->i', ba, bc, out=angles)
+            np.hypot(ba[:, 0], ba[:, 1], out=self._na)
+            np.hypot(bc[:, 0], bc[:, 1], out=self._nc)
+            np.multiply(self._na, self._nc, out=self._na)
+            np.add(self._na, 1e-6, out=self._na)
+            np.divide(angles, self._na, out=angles)
+            np.clip(angles, -1.0, 1.0, out=angles)
+            np.arccos(angles, out=angles)
+            np.degrees(angles, out=angles)
+
+        if len(self._fp):
+            flat = lm.reshape(-1)
+            features = self.values[n:]
+            np.take(flat, self._fp, out=features)
+            np.take(flat, self._fq, out=self._fq_buf)
+            np.subtract(features, self._fq_buf, out=features)
+
+        return self.values
+
+    def get_angles(self, landmarks: np.ndarray) -> Dict[str, float]:
+        """Compute angles/features for one frame as a {name: value} dict"""
+        values = dict(zip(self.names, self.compute(landmarks).tolist()))
+
+        if self.log is not None and self.log.sample_frame:
+            self.log.debug('angles', **values)
+
+        return values
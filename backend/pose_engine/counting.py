@@ -0,0 +1,417 @@
+"""
+Repetition Counting and Error Detection
+Generic state machines driven by the compiled exercise definitions (see exercises.py)
+
+All timing (hold durations, side-switch pauses, error persistence) uses the timestamp passed
+to update()/detect_errors(), falling back to the injected clock, so recorded sessions can be
+re-analysed faster than real time with identical results.
+"""
+
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from logs import SessionLogger
+
+from .exercises import CompiledExercise, ExerciseState, get_exercise
+
+ERROR_PERSIST_SECONDS = 3  # An error is only recorded once it persists this long
+
+
+class RepetitionCounter:
+    """
+    Counts repetitions for one exercise session
+
+    The counter kind ('cycle' or 'hold_sides') and its thresholds come from the
+    exercise definition; update() dispatches to the matching state machine.
+    """
+
+    def __init__(self, exercise_type: str, log: Optional[SessionLogger] = None,
+                 clock: Callable[[], float] = time.time):
+        """
+        Args:
+            exercise_type: Exercise id (unknown exercises never count)
+            log: Session logger (an unsampled one is created if None)
+            clock: Time source (seconds) for calls that do not pass a timestamp
+        """
+        self.exercise_type = exercise_type
+        self.exercise: CompiledExercise = get_exercise(exercise_type)
+        self.log = log if log is not None else SessionLogger(exercise_type, sampled=False)
+        self.clock = clock
+        self.rep_count = 0
+        self.state = self.exercise.initial_state
+        self.now = clock()  # Timestamp of the latest update
+        self.last_state_change = self.now
+
+        # REP-BASED ERROR TRACKING
+        self.current_rep_errors = set()  # Lỗi trong rep hiện tại (unique)
+        self.all_rep_errors = []  # Danh sách lỗi của tất cả reps: [[errors_rep1], [errors_rep2], ...]
+        self.rep_completed = False  # Flag để track khi rep hoàn thành
+
+        config = self.exercise.counter or {}
+        self._config = config
+        self._update = {
+            'cycle': self._count_cycle,
+            'hold_sides': self._count_hold_sides,
+        }.get(self.exercise.counter_kind)
+
+        # Cycle exercises
+        self.down_threshold = config.get('down_threshold')
+        self.up_threshold = config.get('up_threshold')
+        self.hysteresis = config.get('hysteresis', 0)
+        self._sign = -1.0 if config.get('direction') == 'decreasing' else 1.0
+        self._inclusive_complete = config.get('inclusive_complete', False)
+        self._metric = self.exercise.counter_metric
+        if self.exercise.counter_kind == 'cycle':
+            self._rest, self._toward, self._peak, self._back = config['states']
+
+        # Hold exercises (single_leg_stand)
+        self._side_order = list(config.get('sides', {}))
+        self.current_side = self._side_order[0] if self._side_order else None
+        self.hold_start_time = None
+        self.hold_duration = config.get('hold_seconds', 0.0)
+        self.completed_sides = set()
+
+    def add_error_to_current_rep(self, error_name: str):
+        """Add error to current rep (will only count once per rep)"""
+        self.current_rep_errors.add(error_name)
+
+    def get_error_summary(self):
+        """Get total count of each error across all reps"""
+        error_counts = {}
+        for rep_errors in self.all_rep_errors:
+            for error in rep_errors:
+                error_counts[error] = error_counts.get(error, 0) + 1
+        return error_counts
+
+    def _complete_rep(self):
+        """Called when a rep is completed - save errors for this rep"""
+        self.rep_count += 1
+        self.all_rep_errors.append(list(self.current_rep_errors))
+        self.log.info('rep_completed', rep=self.rep_count, errors=list(self.current_rep_errors))
+        self.current_rep_errors.clear()  # Reset for next rep
+        self.rep_completed = True
+
+    def update(self, angles: Dict[str, float], now: Optional[float] = None) -> int:
+        """
+        Update state machine and return current rep count
+
+        Args:
+            angles: Angles/features of the frame
+            now: Frame timestamp in seconds (the clock is read if None)
+        """
+        self.rep_completed = False  # Reset flag
+        self.now = now if now is not None else self.clock()
+
+        if self._update is not None:
+            self._update(angles, self.now)
+        return self.rep_count
+
+    def set_thresholds(self, down_angle: Optional[float] = None, up_angle: Optional[float] = None) -> bool:
+        """
+        Apply personalized thresholds
+
+        Returns:
+            False if the exercise does not allow tuning its thresholds
+        """
+        if not self._config.get('tunable'):
+            return False
+        if down_angle:
+            self.down_threshold = down_angle
+        if up_angle:
+            self.up_threshold = up_angle
+        return True
+
+    def _count_cycle(self, angles, current_time: float):
+        """
+        rest -> toward -> peak -> back -> rest (+1 rep)
+
+        Decreasing exercises (squat) are handled by negating the metric and the thresholds.
+        """
+        sign = self._sign
+        value = sign * self._metric(angles)
+        down = sign * self.down_threshold
+        up = sign * self.up_threshold
+        hysteresis = self.hysteresis
+        state = self.state
+
+        if state is self._rest:
+            if value > down + hysteresis:
+                self.state = self._toward
+                self.last_state_change = current_time
+
+        elif state is self._toward:
+            if value >= up:
+                self.state = self._peak
+                self.last_state_change = current_time
+            elif value < down:
+                self.state = self._rest
+                self.last_state_change = current_time
+
+        elif state is self._peak:
+            if value < up - hysteresis:
+                self.state = self._back
+                self.last_state_change = current_time
+
+        elif state is self._back:
+            if value <= down if self._inclusive_complete else value < down:
+                self.state = self._rest
+                self._complete_rep()  #  Rep hoàn thành!
+                self.last_state_change = current_time
+            elif value > up:
+                self.state = self._peak
+                self.last_state_change = current_time
+
+    def _count_hold_sides(self, angles, current_time: float):
+        """Hold a position on each side in turn; one rep once every side is done"""
+        config = self._config
+
+        side = config['sides'][self.current_side]
+        flexion = angles[side['flexion']]
+        position = angles[side['position']]
+
+        knee_bent_enough = flexion < config['enter_flexion_below']
+        in_position = position > config['enter_position_above']
+        is_correct_position = knee_bent_enough and in_position
+
+        if self.log.sample_frame:
+            self.log.debug('hold_check', side=self.current_side, flexion=flexion, position=position,
+                           flexion_ok=knee_bent_enough, position_ok=in_position)
+
+        state = self.state
+
+        if state is ExerciseState.READY:
+            # Đợi người dùng làm tư thế đúng
+            if is_correct_position:
+                self.state = ExerciseState.LIFTING
+                self.last_state_change = current_time
+
+        elif state is ExerciseState.LIFTING:
+            if is_correct_position:
+                # Đã vào tư thế đúng, bắt đầu giữ
+                self.state = ExerciseState.HOLDING
+                self.hold_start_time = current_time
+                self.last_state_change = current_time
+            elif flexion > config['rest_flexion_above']:
+                # Chân hạ xuống -> quay về ready
+                self.state = ExerciseState.READY
+                self.last_state_change = current_time
+
+        elif state is ExerciseState.HOLDING:
+            if self.hold_start_time is not None:
+                elapsed = current_time - self.hold_start_time
+                lost_position = (flexion > config['lost_flexion_above']) or (position < config['lost_position_below'])
+
+                if lost_position:
+                    self.state = ExerciseState.LOWERING
+                    self.hold_start_time = None
+                    self.last_state_change = current_time
+                    self.log.debug('hold_lost', side=self.current_side, flexion=flexion, position=position)
+
+                elif elapsed >= self.hold_duration:
+                    self.state = ExerciseState.LOWERING
+                    self.hold_start_time = None
+                    self.last_state_change = current_time
+                    self.completed_sides.add(self.current_side)
+                    self.log.debug('side_completed', side=self.current_side)
+
+        elif state is ExerciseState.LOWERING:
+            # Chân đã hạ xuống khi gối gần duỗi thẳng
+            if flexion > config['rest_flexion_above']:
+                if len(self.completed_sides) == len(self._side_order):
+                    self.state = ExerciseState.COMPLETE
+                    self._complete_rep()  #  Rep hoàn thành!
+                    self.completed_sides.clear()
+                    self.last_state_change = current_time
+                else:
+                    self.state = ExerciseState.SWITCH_SIDE
+                    self.current_side = self._next_side()
+                    self.last_state_change = current_time
+                    self.log.debug('side_switched', side=self.current_side)
+
+        elif state is ExerciseState.SWITCH_SIDE:
+            if current_time - self.last_state_change > config['switch_pause']:
+                self.state = ExerciseState.READY
+                self.last_state_change = current_time
+
+        elif state is ExerciseState.COMPLETE:
+            if current_time - self.last_state_change > config['complete_pause']:
+                self.state = ExerciseState.READY
+                self.current_side = self._side_order[0]
+                self.last_state_change = current_time
+
+    def _next_side(self) -> str:
+        index = self._side_order.index(self.current_side)
+        return self._side_order[(index + 1) % len(self._side_order)]
+
+    def get_hold_time_remaining(self):
+        """Get remaining hold time for hold exercises, as of the latest update"""
+        if self.exercise.counter_kind != 'hold_sides':
+            return None
+        if self.state != ExerciseState.HOLDING or self.hold_start_time is None:
+            return None
+
+        elapsed = self.now - self.hold_start_time
+        return max(0, self.hold_duration - elapsed)
+
+    def get_current_side(self):
+        """Get current side for hold exercises"""
+        if self.exercise.counter_kind != 'hold_sides':
+            return None
+        return self.current_side
+
+    def get_feedback(self) -> str:
+        """Feedback message for the current state from the exercise's templates"""
+        context: Dict[str, Any] = {}
+        if self.exercise.counter_kind == 'hold_sides':
+            remaining = self.get_hold_time_remaining()
+            context['side'] = self._config['side_labels'][self.current_side]
+            context['remaining'] = int(remaining) if remaining else None
+        return self.exercise.feedback_message(self.state, context)
+
+    def get_extras(self) -> Dict[str, Any]:
+        """Exercise-specific fields added to the analysis response"""
+        if self.exercise.counter_kind == 'hold_sides':
+            return {
+                'hold_time_remaining': self.get_hold_time_remaining(),
+                'current_side': self.get_current_side()
+            }
+        return {}
+
+    def reset(self):
+        self.rep_count = 0
+        self.state = self.exercise.initial_state
+        self.now = self.clock()
+        self.last_state_change = self.now
+        self.hold_start_time = None
+        self.completed_sides.clear()
+        self.current_side = self._side_order[0] if self._side_order else None
+        #  Reset error tracking
+        self.current_rep_errors.clear()
+        self.all_rep_errors.clear()
+        self.rep_completed = False
+
+    def get_state(self):
+        return self.state
+
+    def checkpoint(self) -> Dict[str, Any]:
+        """Counter state as a JSON-serialisable dict (see restore)"""
+        return {
+            'rep_count': self.rep_count,
+            'state': self.state.value,
+            'now': self.now,
+            'last_state_change': self.last_state_change,
+            'current_rep_errors': sorted(self.current_rep_errors),
+            'all_rep_errors': [list(errors) for errors in self.all_rep_errors],
+            'down_threshold': self.down_threshold,
+            'up_threshold': self.up_threshold,
+            'current_side': self.current_side,
+            'hold_start_time': self.hold_start_time,
+            'completed_sides': sorted(self.completed_sides),
+        }
+
+    def restore(self, state: Dict[str, Any]):
+        """Continue from a checkpoint() of a counter for the same exercise"""
+        self.rep_count = state['rep_count']
+        self.state = ExerciseState(state['state'])
+        self.now = state['now']
+        self.last_state_change = state['last_state_change']
+        self.current_rep_errors = set(state['current_rep_errors'])
+        self.all_rep_errors = [list(errors) for errors in state['all_rep_errors']]
+        self.down_threshold = state['down_threshold']
+        self.up_threshold = state['up_threshold']
+        self.current_side = state['current_side']
+        self.hold_start_time = state['hold_start_time']
+        self.completed_sides = set(state['completed_sides'])
+        self.rep_completed = False
+
+    def shift_time(self, seconds: float):
+        """Move the time anchors forward, so a gap between frames does not count as elapsed time"""
+        self.now += seconds
+        self.last_state_change += seconds
+        if self.hold_start_time is not None:
+            self.hold_start_time += seconds
+
+
+class ErrorDetector:
+    """
+    Evaluates the exercise's error rules every frame
+
+    An error is only recorded (and shown) once it has persisted for
+    error_threshold seconds while the counter stays in the rule's state.
+    """
+
+    def __init__(self, exercise_type: str, clock: Callable[[], float] = time.time):
+        """
+        Args:
+            exercise_type: Exercise id
+            clock: Time source (seconds) for calls that do not pass a timestamp
+        """
+        self.exercise_type = exercise_type
+        self.clock = clock
+        self.rules = get_exercise(exercise_type).error_rules
+        # Track error timestamps: {error_name: first_detected_time}
+        self.error_timers = {}
+        self.error_threshold = ERROR_PERSIST_SECONDS  # seconds - only count error if persists for this long
+
+    def detect_errors(self, landmarks, angles, state: ExerciseState, rep_counter: RepetitionCounter,
+                      now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Detect errors and add them to the current rep.
+        Only records an error if it persists for error_threshold (3s) continuously.
+        Returns errors for real-time feedback display.
+
+        Args:
+            now: Frame timestamp in seconds (the clock is read if None)
+        """
+        errors = []
+        current_time = now if now is not None else self.clock()
+
+        for rule in self.rules:
+            if state is rule.state:
+                value = rule.metric(angles)
+                if rule.test(value, rule.threshold):
+                    if self._should_record_error(rule.name, current_time):
+                        rep_counter.add_error_to_current_rep(rule.name)
+                        errors.append({
+                            'name': rule.name,
+                            'message': rule.message.format(value=value),
+                            'severity': rule.severity
+                        })
+                    continue
+            self._clear_error_timer(rule.name)
+
+        return errors
+
+    def _should_record_error(self, error_name: str, current_time: float) -> bool:
+        """
+        Check if error should be recorded based on persistence time.
+        Returns True if error has persisted for >= error_threshold seconds.
+        """
+        if error_name not in self.error_timers:
+            # First time seeing this error, start timer
+            self.error_timers[error_name] = current_time
+            return False
+
+        elapsed = current_time - self.error_timers[error_name]
+        return elapsed >= self.error_threshold
+
+    def _clear_error_timer(self, error_name: str):
+        """Clear error timer when error is no longer detected"""
+        if error_name in self.error_timers:
+            del self.error_timers[error_name]
+
+    def reset_timers(self):
+        """Reset all error timers (called when starting new rep)"""
+        self.error_timers.clear()
+
+    def checkpoint(self) -> Dict[str, Any]:
+        """Persistence timers as a JSON-serialisable dict (see restore)"""
+        return {'error_timers': dict(self.error_timers)}
+
+    def restore(self, state: Dict[str, Any]):
+        self.error_timers = dict(state['error_timers'])
+
+    def shift_time(self, seconds: float):
+        """Move the timers forward, so a gap between frames does not count as persistence"""
+        for name in self.error_timers:
+            self.error_timers[name] += seconds
@@ -0,0 +1,382 @@
+"""
+Exercise Definitions
+Exercises described as data (joints, thresholds, states, error rules, feedback) and compiled once
+into lookup tables for the generic counter / error detector / feedback engine
+
+Adding an exercise means adding an entry to EXERCISE_DEFINITIONS; the per-frame code in
+counting.py and the WebSocket handler never branch on the exercise name.
+"""
+
+from enum import Enum
+from operator import gt, itemgetter, lt
+from string import Formatter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .landmarks import PoseLandmark, X, Y, Z
+
+
+
+class ExerciseState(Enum):
+    DOWN = "down"
+    RAISING = "raising"
+    UP = "up"
+    LOWERING = "lowering"
+    # single_leg_stand
+    READY = "ready"
+    LIFTING = "lifting"
+    HOLDING = "holding"
+    SWITCH_SIDE = "switch_side"
+    COMPLETE = "complete"
+
+
+_COLUMNS = {'x': X, 'y': Y, 'z': Z}
+
+# Feedback when an exercise does not define a message for the current state
+DEFAULT_FEEDBACK = {
+    'raising': ' Đang nâng...',
+    'up': ' Giữ vững!',
+    'lowering': ' Đang hạ...',
+    'down': ' Sẵn sàng!',
+}
+FALLBACK_FEEDBACK = ' Tư thế tốt!'
+
+
+# ============= DEFINITIONS =============
+#
+# angles:   (name, A, B, C) -> angle at B between B->A and B->C, in degrees
+# features: (name, P, Q or None, axis) -> P.axis - Q.axis (or P.axis)
+# metrics:  named values derived from angles/features each frame
+#             {'agg': 'min'|'max', 'of': [...]}             both sides must reach the threshold
+#             {'agg': 'select_min_by', 'of': [...], 'by': [...]}  value of the side with the smallest 'by'
+# counter:  'cycle'      rest -> toward -> peak -> back -> rest (+1 rep) with hysteresis
+#           'hold_sides' hold a position for hold_seconds on each side (+1 rep after both)
+# errors:   checked in order; only while the counter is in 'state', recorded after persisting
+# feedback: state -> message template, or a list of templates (first one whose fields are available)
+
+EXERCISE_DEFINITIONS: Dict[str, Dict[str, Any]] = {
+    'squat': {
+        'angles': [
+            ('left_knee', 'LEFT_HIP', 'LEFT_KNEE', 'LEFT_ANKLE'),
+            ('right_knee', 'RIGHT_HIP', 'RIGHT_KNEE', 'RIGHT_ANKLE'),
+        ],
+        'metrics': {
+            # Both legs must bend: the straighter knee (largest angle) decides
+            'knee': {'agg': 'max', 'of': ['left_knee', 'right_knee']},
+        },
+        'counter': {
+            'kind': 'cycle',
+            'metric': 'knee',
+            'direction': 'decreasing',  # Knee angle falls from standing (down) to squatting (up)
+            'down_threshold': 160,
+            'up_threshold': 90,
+            'hysteresis': 5,
+            'inclusive_complete': True,
+            'states': ('down', 'lowering', 'up', 'raising'),
+            'tunable': True,
+        },
+        'errors': [
+            {'name': 'Gập gối chưa đủ', 'state': 'up', 'metric': 'knee', 'op': '>', 'threshold': 90,
+             'message': ' Gập CẢ 2 CHÂN sâu hơn! (cao nhất: {value:.0f}°)', 'severity': 'high'},
+            {'name': 'Chưa đứng thẳng', 'state': 'down', 'metric': 'knee', 'op': '<', 'threshold': 160,
+             'message': ' Đứng thẳng CẢ 2 CHÂN!', 'severity': 'medium'},
+        ],
+    },
+
+    'arm_raise': {
+        'angles': [
+            ('left_shoulder', 'LEFT_HIP', 'LEFT_SHOULDER', 'LEFT_ELBOW'),
+            ('right_shoulder', 'RIGHT_HIP', 'RIGHT_SHOULDER', 'RIGHT_ELBOW'),
+            ('left_elbow', 'LEFT_SHOULDER', 'LEFT_ELBOW', 'LEFT_WRIST'),
+            ('right_elbow', 'RIGHT_SHOULDER', 'RIGHT_ELBOW', 'RIGHT_WRIST'),
+        ],
+        'metrics': {
+            # Both arms must reach the threshold: the lower arm decides
+            'shoulder': {'agg': 'min', 'of': ['left_shoulder', 'right_shoulder']},
+            'elbow': {'agg': 'min', 'of': ['left_elbow', 'right_elbow']},
+        },
+        'counter': {
+            'kind': 'cycle',
+            'metric': 'shoulder',
+            'direction': 'increasing',
+            'down_threshold': 90,
+            'up_threshold': 160,
+            'hysteresis': 5,
+            'inclusive_complete': False,
+            'states': ('down', 'raising', 'up', 'lowering'),
+            'tunable': True,
+        },
+        'errors': [
+            {'name': 'Góc vai chưa đủ', 'state': 'up', 'metric': 'shoulder', 'op': '<', 'threshold': 160,
+             'message': ' Nâng CẢ 2 TAY cao hơn! (thấp nhất: {value:.0f}°)', 'severity': 'high'},
+            {'name': 'Tay không thẳng', 'state': 'up', 'metric': 'elbow', 'op': '<', 'threshold': 160,
+             'message': ' Duỗi thẳng CẢ 2 TAY!', 'severity': 'medium'},
+            {'name': 'Chưa hạ hết', 'state': 'down', 'metric': 'shoulder', 'op': '>', 'threshold': 90,
+             'message': ' Hạ CẢ 2 TAY xuống hẳn!', 'severity': 'medium'},
+        ],
+    },
+
+    'single_leg_stand': {
+        'angles': [
+            # Knee flexion: HIP -> KNEE -> ANKLE
+            ('left_knee', 'LEFT_HIP', 'LEFT_KNEE', 'LEFT_ANKLE'),
+            ('right_knee', 'RIGHT_HIP', 'RIGHT_KNEE', 'RIGHT_ANKLE'),
+        ],
+        'features': [
+            # Leg behind via depth: knee.z > hip.z means the knee is behind the hip (positive = behind)
+            ('left_leg_behind', 'LEFT_KNEE', 'LEFT_HIP', 'z'),
+            ('right_leg_behind', 'RIGHT_KNEE', 'RIGHT_HIP', 'z'),
+            # Y positions for height check
+            ('left_knee_y', 'LEFT_KNEE', None, 'y'),
+            ('right_knee_y', 'RIGHT_KNEE', None, 'y'),
+            ('left_hip_y', 'LEFT_HIP', None, 'y'),
+            ('right_hip_y', 'RIGHT_HIP', None, 'y'),
+        ],
+        'metrics': {
+            # The lifted leg is the one with the smaller knee flexion
+            'lifted_knee': {'agg': 'select_min_by', 'of': ['left_knee', 'right_knee'], 'by': ['left_knee', 'right_knee']},
+            'lifted_behind': {'agg': 'select_min_by', 'of': ['left_leg_behind', 'right_leg_behind'], 'by': ['left_knee', 'right_knee']},
+        },
+        'counter': {
+            'kind': 'hold_sides',
+            'sides': {
+                'left': {'flexion': 'left_knee', 'position': 'left_leg_behind'},
+                'right': {'flexion': 'right_knee', 'position': 'right_leg_behind'},
+            },
+            'side_labels': {'left': 'trái', 'right': 'phải'},
+            'hold_seconds': 3.0,
+            # Correct position: knee bent deep and leg behind the hip
+            'enter_flexion_below': 50,
+            'enter_position_above': 0.05,
+            # Position lost while holding
+            'lost_flexion_above': 70,
+            'lost_position_below': 0.03,
+            # Leg counts as lowered once the knee is almost straight
+            'rest_flexion_above': 160,
+            'switch_pause': 2.0,
+            'complete_pause': 3.0,
+        },
+        'errors': [
+            {'name': 'Gối chưa gập đủ sâu', 'state': 'holding', 'metric': 'lifted_knee', 'op': '>', 'threshold': 50,
+             'message': ' Gập gối sâu hơn! (hiện tại: {value:.0f}°, cần: <50°)', 'severity': 'high'},
+            {'name': 'Chân không ra sau', 'state': 'holding', 'metric': 'lifted_behind', 'op': '<', 'threshold': 0.05,
+             'message': ' Đưa chân RA SAU, không ra trước! (hiện tại: {value:.3f}, cần: >0.05)', 'severity': 'critical'},
+        ],
+        'feedback': {
+            'ready': ' Sẵn sàng - Co chân {side} lên',
+            'lifting': ' Đang co chân lên...',
+            'holding': [' Giữ vững! Còn {remaining}s', ' Giữ vững!'],
+            'lowering': ' Hạ chân từ từ...',
+            'switch_side': ' Tốt lắm! Đổi bên',
+            'complete': ' Hoàn thành 1 rep!',
+        },
+    },
+
+    'calf_raise': {
+        'angles': [
+            ('left_ankle', 'LEFT_KNEE', 'LEFT_ANKLE', 'LEFT_FOOT_INDEX'),
+            ('right_ankle', 'RIGHT_KNEE', 'RIGHT_ANKLE', 'RIGHT_FOOT_INDEX'),
+            # Knee angle (legs must stay straight)
+            ('left_knee', 'LEFT_HIP', 'LEFT_KNEE', 'LEFT_ANKLE'),
+            ('right_knee', 'RIGHT_HIP', 'RIGHT_KNEE', 'RIGHT_ANKLE'),
+        ],
+        'features': [
+            ('left_heel_y', 'LEFT_HEEL', None, 'y'),
+            ('right_heel_y', 'RIGHT_HEEL', None, 'y'),
+            ('left_foot_index_y', 'LEFT_FOOT_INDEX', None, 'y'),
+            ('right_foot_index_y', 'RIGHT_FOOT_INDEX', None, 'y'),
+        ],
+        'metrics': {
+            # Both heels must rise: the lower one decides
+            'ankle': {'agg': 'min', 'of': ['left_ankle', 'right_ankle']},
+            'knee': {'agg': 'min', 'of': ['left_knee', 'right_knee']},
+        },
+        'counter': {
+            'kind': 'cycle',
+            'metric': 'ankle',
+            'direction': 'increasing',
+            'down_threshold': 120,  # Ankle angle with heels on the ground
+            'up_threshold': 140,    # Ankle angle with heels raised
+            'hysteresis': 5,
+            'inclusive_complete': True,
+            'states': ('down', 'raising', 'up', 'lowering'),
+            'tunable': False,
+        },
+        'errors': [
+            {'name': 'Chưa nâng đủ cao', 'state': 'up', 'metric': 'ankle', 'op': '<', 'threshold': 140,
+             'message': ' Nâng CẢ 2 GÓT cao hơn! (thấp nhất: {value:.0f}°)', 'severity': 'high'},
+            {'name': 'Gập gối', 'state': 'up', 'metric': 'knee', 'op': '<', 'threshold': 160,
+             'message': ' Giữ CẢ 2 CHÂN thẳng!', 'severity': 'medium'},
+            {'name': 'Chưa hạ hết', 'state': 'down', 'metric': 'ankle', 'op': '>', 'threshold': 105,
+             'message': ' Hạ CẢ 2 GÓT xuống hẳn!', 'severity': 'medium'},
+        ],
+        'feedback': {
+            'down': ' Sẵn sàng - Nâng gót lên!',
+            'raising': ' Đang nâng gót...',
+            'up': ' Giữ vững ở trên!',
+            'lowering': ' Hạ từ từ...',
+        },
+    },
+}
+
+
+# ============= COMPILATION =============
+
+_OPS: Dict[str, Callable[[float, float], bool]] = {
+    '<': lt,
+    '>': gt,
+}
+
+
+def _compile_metric(spec: Dict[str, Any]) -> Callable[[Dict[str, float]], float]:
+    """Turn a metric spec into a function of the per-frame angles dict"""
+    agg = spec['agg']
+    keys = spec['of']
+
+    if agg in ('min', 'max'):
+        if len(keys) == 1:
+            return itemgetter(keys[0])
+        fn = min if agg == 'min' else max
+        getter = itemgetter(*keys)
+        return lambda angles: fn(getter(angles))
+
+    if agg == 'select_min_by':
+        by = spec['by']
+
+        def select(angles):
+            # Last side wins ties (left only if strictly smaller)
+            best = 0
+            for i in range(1, len(by)):
+                if angles[by[i]] <= angles[by[best]]:
+                    best = i
+            return angles[keys[best]]
+        return select
+
+    raise ValueError(f"Unknown metric aggregation '{agg}'")
+
+
+def _compile_array_metric(spec: Dict[str, Any]) -> Callable[[Dict[str, np.ndarray]], np.ndarray]:
+    """Same as _compile_metric, over whole {name: array} columns (offline re-scoring)"""
+    agg = spec['agg']
+    keys = spec['of']
+
+    if agg in ('min', 'max'):
+        fn = np.minimum if agg == 'min' else np.maximum
+        return lambda columns: fn.reduce([columns[k] for k in keys]) if len(keys) > 1 else columns[keys[0]]
+
+    if agg == 'select_min_by':
+        by = spec['by']
+
+        def select(columns):
+            best = np.zeros(len(columns[by[0]]), dtype=np.intp)
+            best_by = columns[by[0]]
+            for i in range(1, len(by)):
+                take = columns[by[i]] <= best_by
+                best = np.where(take, i, best)
+                best_by = np.where(take, columns[by[i]], best_by)
+            return np.choose(best, [columns[k] for k in keys])
+        return select
+
+    raise ValueError(f"Unknown metric aggregation '{agg}'")
+
+
+class ErrorRule:
+    """One compiled error rule"""
+    __slots__ = ('name', 'state', 'metric_name', 'metric', 'test', 'threshold', 'message', 'severity')
+
+    def __init__(self, spec: Dict[str, Any], metrics: Dict[str, Callable]):
+        self.name = spec['name']
+        self.state = ExerciseState(spec['state'])
+        self.metric_name = spec['metric']
+        self.metric = metrics[spec['metric']]
+        self.test = _OPS[spec['op']]
+        self.threshold = float(spec['threshold'])
+        self.message = spec['message']
+        self.severity = spec['severity']
+
+
+class FeedbackTemplate:
+    """A feedback message with the context fields it needs"""
+    __slots__ = ('template', 'fields')
+
+    def __init__(self, template: str):
+        self.template = template
+        self.fields = tuple(f for _, f, _, _ in Formatter().parse(template) if f)
+
+
+class CompiledExercise:
+    """
+    An exercise definition compiled into lookup tables
+
+    Attributes:
+        name: Exercise id
+        angle_triplets: [(name, A, B, C)] landmark indices
+        features: [(name, P, Q or None, column)] landmark indices
+        counter: Counter config dict ('states' resolved to ExerciseState members)
+        initial_state: ExerciseState a new counter starts in
+        metrics: {name: fn(angles) -> float}
+        array_metrics: {name: fn({name: array}) -> array}, the vectorized metrics
+        counter_metric: Metric driving a 'cycle' counter
+        error_rules: [ErrorRule] in evaluation order
+        feedback: {ExerciseState: [FeedbackTemplate]}
+    """
+
+    def __init__(self, name: str, definition: Dict[str, Any]):
+        self.name = name
+
+        self.angle_triplets: List[Tuple[str, int, int, int]] = [
+            (n, PoseLandmark[a], PoseLandmark[b], PoseLandmark[c])
+            for n, a, b, c in definition.get('angles', [])
+        ]
+        self.features: List[Tuple[str, int, Optional[int], int]] = [
+            (n, PoseLandmark[p], PoseLandmark[q] if q else None, _COLUMNS[axis])
+            for n, p, q, axis in definition.get('features', [])
+        ]
+
+        self.metrics = {k: _compile_metric(v) for k, v in definition.get('metrics', {}).items()}
+        self.array_metrics = {k: _compile_array_metric(v) for k, v in definition.get('metrics', {}).items()}
+
+        self.counter: Optional[Dict[str, Any]] = dict(definition['counter']) if 'counter' in definition else None
+        self.counter_kind = self.counter['kind'] if self.counter else None
+        self.counter_metric = None
+        if self.counter_kind == 'cycle':
+            self.counter['states'] = tuple(ExerciseState(s) for s in self.counter['states'])
+            self.counter_metric = self.metrics[self.counter['metric']]
+            self.initial_state = self.counter['states'][0]
+        elif self.counter_kind == 'hold_sides':
+            self.initial_state = ExerciseState.READY
+        else:
+            self.initial_state = ExerciseState.DOWN
+
+        self.error_rules = [ErrorRule(spec, self.metrics) for spec in definition.get('errors', [])]
+
+        feedback = dict(DEFAULT_FEEDBACK)
+        feedback.update(definition.get('feedback', {}))
+        self.feedback = {
+            ExerciseState(state): [FeedbackTemplate(t) for t in ([templates] if isinstance(templates, str) else templates)]
+            for state, templates in feedback.items()
+        }
+
+    def feedback_message(self, state: ExerciseState, context: Dict[str, Any]) -> str:
+        """Pick the first template for the state whose context fields are all available"""
+        for template in self.feedback.get(state, ()):
+            if all(context.get(f) is not None for f in template.fields):
+                return template.template.format(**context)
+        return FALLBACK_FEEDBACK
+
+
+def compile_exercises(definitions: Dict[str, Dict[str, Any]]) -> Dict[str, CompiledExercise]:
+    """Compile every exercise definition (done once at import)"""
+    return {name: CompiledExercise(name, definition) for name, definition in definitions.items()}
+
+
+EXERCISES = compile_exercises(EXERCISE_DEFINITIONS)
+
+# Unknown exercise types get no angles, no counter and no error rules
+_UNKNOWN = CompiledExercise('unknown', {})
+
+
+def get_exercise(exercise_type: str) -> CompiledExercise:
+    """Compiled definition for an exercise type"""
+    return EXERCISES.get(exercise_type, _UNKNOWN)
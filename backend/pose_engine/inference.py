@@ -0,0 +1,333 @@
+"""
+Pose Inference Worker Pool
+Runs MediaPipe pose estimation in worker processes so the event loop stays free
+
+OpenCV and MediaPipe are imported by the worker processes only, so importing this module (and
+the API app) stays fast.
+"""
+
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from logs import EventLogger
+from metrics import WORKER_CPU_SECONDS, WORKER_RESTARTS
+
+log = EventLogger('inference')
+
+
+class InferenceResult(NamedTuple):
+    """
+    Result of one frame handed to the pool
+
+    frame_ok is False when the image could not be decoded.
+    landmarks is a (33, 4) float32 array of x, y, z, visibility or None if no pose was found.
+    timings are the worker-side seconds for decode, convert and pose (metrics.WORKER_STAGES).
+    cpu_seconds is the worker process's total CPU time after this frame.
+    """
+    frame_ok: bool
+    landmarks: Optional[np.ndarray]
+    timings: Tuple[float, ...] = ()
+    cpu_seconds: float = 0.0
+
+
+# ============= WORKER PROCESS SIDE =============
+
+# MediaPipe graphs owned by this worker process, one per lease slot (created by _init_worker)
+_graphs: list = []
+
+# OpenCV, imported by _init_worker
+cv2 = None
+
+# Blank frame used to warm up a graph before it is handed to a session
+_WARMUP_SHAPE = (480, 640, 3)
+
+
+def _warm_up(graph):
+    graph.process(np.zeros(_WARMUP_SHAPE, dtype=np.uint8))
+
+
+def _init_worker(graphs: int, model_complexity: int, min_detection_confidence: float, min_tracking_confidence: float):
+    """Build and warm up this worker's Pose graphs once per process"""
+    global _graphs, cv2
+    import cv2
+    import mediapipe as mp
+
+    _graphs = [
+        mp.solutions.pose.Pose(
+            min_detection_confidence=min_detection_confidence,
+            min_tracking_confidence=min_tracking_confidence,
+            model_complexity=model_complexity
+        )
+        for _ in range(graphs)
+    ]
+    for graph in _graphs:
+        _warm_up(graph)
+
+
+def _warm_up_pipeline() -> float:
+    """
+    Run a blank JPEG through decode, convert and pose on every graph of this worker, so the
+    first patient frame does not pay for lazy initialisation (waits for _init_worker too)
+
+    Returns:
+        Seconds taken
+    """
+    start = time.perf_counter()
+    _, encoded = cv2.imencode('.jpg', np.zeros(_WARMUP_SHAPE, dtype=np.uint8))
+    for slot in range(len(_graphs)):
+        _run_inference(slot, encoded.tobytes())
+        _graphs[slot].reset()
+    return time.perf_counter() - start
+
+
+def _reset_graph(slot: int):
+    """Drop tracking state left by the previous session and warm the graph up again"""
+    graph = _graphs[slot]
+    graph.reset()
+    _warm_up(graph)
+
+
+def _run_inference(slot: int, img_data: bytes, offset: int = 0) -> InferenceResult:
+    """Decode an encoded frame starting at img_data[offset] and run pose estimation on it (runs inside a worker)"""
+    t0 = time.perf_counter()
+    nparr = np.frombuffer(img_data, np.uint8, offset=offset)
+    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    t1 = time.perf_counter()
+
+    if frame is None:
+        return InferenceResult(False, None, (t1 - t0,), time.process_time())
+
+    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    t2 = time.perf_counter()
+    results = _graphs[slot].process(rgb_frame)
+
+    landmarks = None
+    if results.pose_landmarks:
+        landmarks = np.array(
+            [(lm.x, lm.y, lm.z, lm.visibility) for lm in results.pose_landmarks.landmark],
+            dtype=np.float32
+        )
+    t3 = time.perf_counter()
+
+    return InferenceResult(True, landmarks, (t1 - t0, t2 - t1, t3 - t2), time.process_time())
+
+
+# ============= EVENT LOOP SIDE =============
+
+class PoolExhausted(Exception):
+    """Raised when no Pose graph became free within the lease timeout"""
+
+
+class PoseLease:
+    """
+    Exclusive use of one Pose graph for the duration of an exercise session
+
+    Every frame of the session goes to the same graph, so MediaPipe keeps
+    tracking the patient's ROI instead of re-running person detection.
+    """
+
+    def __init__(self, pool: 'PoseInferencePool', worker: int, slot: int, generation: int = 0):
+        self.pool = pool
+        self.worker = worker
+        self.slot = slot
+        self.generation = generation  # Worker process the lease was issued for (see _restart_worker)
+        self._cpu_gauge = WORKER_CPU_SECONDS.labels(worker)
+
+    async def process(self, img_data: bytes, offset: int = 0) -> InferenceResult:
+        """
+        Run decode + pose estimation for the encoded frame at img_data[offset:] on this lease's graph
+
+        Raises:
+            BrokenProcessPool: The lease's worker process died (it is being replaced)
+        """
+        executor = self.pool._executor_of(self)
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                executor, _run_inference, self.slot, img_data, offset
+            )
+        except BrokenProcessPool:
+            self.pool._worker_broken(self.worker, executor)
+            raise
+        self._cpu_gauge.set(result.cpu_seconds)
+        return result
+
+
+class PoseInferencePool:
+    """
+    Pool of worker processes holding pre-warmed MediaPipe Pose graphs
+
+    Each worker process owns `graphs_per_worker` graphs. A WebSocket session
+    leases one graph with `await pool.acquire()` and returns it with
+    `pool.release(lease)`; decoding and inference happen in the worker so the
+    event loop keeps serving REST routes and other clients meanwhile.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        graphs_per_worker: int = 4,
+        model_complexity: int = 1,
+        min_detection_confidence: float = 0.5,
+        min_tracking_confidence: float = 0.5,
+        lease_timeout: float = 10.0,
+        start_method: Optional[str] = None
+    ):
+        """
+        Args:
+            workers: Number of worker processes
+            graphs_per_worker: Pose graphs per worker, i.e. concurrent sessions per worker
+            model_complexity: MediaPipe model complexity (0, 1 or 2)
+            min_detection_confidence: Minimum confidence for person detection
+            min_tracking_confidence: Minimum confidence for landmark tracking
+            lease_timeout: Seconds to wait for a free graph before giving up
+            start_method: multiprocessing start method override (default 'spawn': the server
+                already runs threads when the workers start, and a forked child could inherit
+                a lock one of them holds, e.g. logging's or the connection pool's, and deadlock)
+        """
+        self.workers = max(1, workers)
+        self.graphs_per_worker = max(1, graphs_per_worker)
+        self.lease_timeout = lease_timeout
+        self._init_args = (self.graphs_per_worker, model_complexity, min_detection_confidence, min_tracking_confidence)
+        self._start_method = start_method or 'spawn'
+        self._executors: List[ProcessPoolExecutor] = []
+        self._generations: List[int] = []  # Bumped when a worker's process is replaced
+        self._restarting: Dict[int, asyncio.Task] = {}  # Broken workers being replaced
+        self._free: Optional[asyncio.Queue] = None
+        self._started: Optional[asyncio.Future] = None
+        self._recycling: set = set()
+
+    @property
+    def capacity(self) -> int:
+        """Total number of sessions that can hold a graph at the same time"""
+        return self.workers * self.graphs_per_worker
+
+    @property
+    def ready(self) -> bool:
+        """True once every graph is warmed up and can be leased, and no worker is being replaced"""
+        return self._free is not None and not self._restarting
+
+    async def start(self):
+        """
+        Start the worker processes and wait until every graph is warmed up
+
+        If starting fails, the workers are shut down and the next call starts new ones.
+        """
+        if self._started is None:
+            self._started = asyncio.ensure_future(self._start())
+        started = self._started
+        try:
+            await started
+        except Exception:
+            if self._started is started:
+                self.shutdown()
+            raise
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context(self._start_method),
+            initializer=_init_worker,
+            initargs=self._init_args
+        )
+
+    async def _start(self):
+        self._executors = [self._new_executor() for _ in range(self.workers)]
+        self._generations = [0] * self.workers
+
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(ex, _warm_up_pipeline) for ex in self._executors])
+
+        # Slot-major order so consecutive sessions land on different processes
+        self._free = asyncio.Queue()
+        for slot in range(self.graphs_per_worker):
+            for worker in range(self.workers):
+                self._free.put_nowait(PoseLease(self, worker, slot))
+
+    def _stale(self, lease: PoseLease) -> bool:
+        """The lease's worker died (or is being replaced) since the lease was issued"""
+        return lease.worker in self._restarting or lease.generation != self._generations[lease.worker]
+
+    def _executor_of(self, lease: PoseLease) -> ProcessPoolExecutor:
+        if not self._executors or self._stale(lease):
+            raise BrokenProcessPool(f"Pose worker {lease.worker} was restarted")
+        return self._executors[lease.worker]
+
+    async def acquire(self) -> PoseLease:
+        """Lease a warmed-up Pose graph, raising PoolExhausted after lease_timeout"""
+        await self.start()
+        deadline = time.monotonic() + self.lease_timeout
+        try:
+            while True:
+                lease = await asyncio.wait_for(self._free.get(), timeout=max(0.0, deadline - time.monotonic()))
+                if not self._stale(lease):
+                    return lease
+                # Leases of a dead worker are dropped; its replacement issues new ones
+        except asyncio.TimeoutError:
+            raise PoolExhausted(f"No free pose graph after {self.lease_timeout}s")
+
+    def release(self, lease: PoseLease):
+        """Return a lease; its graph is reset and re-warmed before being reused"""
+        task = asyncio.get_running_loop().create_task(self._recycle(lease))
+        self._recycling.add(task)
+        task.add_done_callback(self._recycling.discard)
+
+    async def _recycle(self, lease: PoseLease):
+        if not self._executors or self._stale(lease):
+            return  # Pool was shut down, or the worker was replaced (with new leases)
+        executor = self._executors[lease.worker]
+        try:
+            await asyncio.get_running_loop().run_in_executor(executor, _reset_graph, lease.slot)
+        except BrokenProcessPool:
+            self._worker_broken(lease.worker, executor)
+            return
+        except Exception:
+            log.exception('graph_reset_failed', worker=lease.worker, slot=lease.slot)
+        if self._free is not None and not self._stale(lease):
+            self._free.put_nowait(lease)
+
+    def _worker_broken(self, worker: int, executor: ProcessPoolExecutor):
+        """Replace a worker whose process died (OOM, crash in MediaPipe), unless already done"""
+        if worker in self._restarting or not self._executors or self._executors[worker] is not executor:
+            return
+        log.error('worker_died', worker=worker)
+        task = asyncio.get_running_loop().create_task(self._restart_worker(worker))
+        self._restarting[worker] = task
+        task.add_done_callback(lambda _: self._restarting.pop(worker, None))
+
+    async def _restart_worker(self, worker: int):
+        """Start and warm up a new process for the worker, then issue leases for its graphs"""
+        self._executors[worker].shutdown(wait=False, cancel_futures=True)
+        delay = 1.0
+        while True:
+            executor = self._new_executor()
+            self._executors[worker] = executor
+            try:
+                await asyncio.get_running_loop().run_in_executor(executor, _warm_up_pipeline)
+                break
+            except Exception:
+                log.exception('worker_restart_failed', worker=worker, retry_in=delay)
+                executor.shutdown(wait=False, cancel_futures=True)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+        self._generations[worker] += 1
+        WORKER_RESTARTS.inc()
+        log.info('worker_restarted', worker=worker)
+        for slot in range(self.graphs_per_worker):
+            self._free.put_nowait(PoseLease(self, worker, slot, self._generations[worker]))
+
+    def shutdown(self):
+        """Stop all worker processes"""
+        for task in list(self._restarting.values()):
+            task.cancel()
+        self._restarting.clear()
+        for executor in self._executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._executors = []
+        self._free = None
+        self._started = None
@@ -0,0 +1,65 @@
+"""
+Frame Ingest
+Latest-frame-wins mailbox between the WebSocket receiver and the analysis stage
+"""
+
+import asyncio
+from typing import Any, Dict, Optional
+
+from metrics import FRAMES_DROPPED, FRAMES_PROCESSED, FRAMES_RECEIVED
+
+
+class LatestFrameSlot:
+    """
+    Single-slot mailbox that only keeps the newest undecoded frame
+
+    The receiver calls put() for every frame message as soon as it arrives, so
+    nothing queues up inside the socket. The analysis stage awaits get() and
+    always works on the freshest frame; anything it did not get to in time is
+    overwritten and counted as dropped.
+    """
+
+    def __init__(self):
+        self._frame: Optional[Any] = None
+        self._ready = asyncio.Event()
+        self._closed = False
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+
+    def put(self, frame: Any):
+        """Store a frame, replacing (and dropping) any frame still waiting"""
+        self.received += 1
+        FRAMES_RECEIVED.inc()
+        if self._frame is not None:
+            self.dropped += 1
+            FRAMES_DROPPED.inc()
+        self._frame = frame
+        self._ready.set()
+
+    async def get(self) -> Optional[Any]:
+        """Wait for the next frame; returns None once the slot is closed"""
+        while self._frame is None:
+            if self._closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+
+        frame, self._frame = self._frame, None
+        return frame
+
+    def mark_processed(self):
+        self.processed += 1
+        FRAMES_PROCESSED.inc()
+
+    def close(self):
+        """Wake up the analysis stage so it can exit"""
+        self._closed = True
+        self._ready.set()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'received': self.received,
+            'processed': self.processed,
+            'dropped': self.dropped
+        }
@@ -0,0 +1,178 @@
+"""
+WebSocket Frame Protocol
+Binary frame messages for /ws/exercise/{exercise_type}
+
+Binary message layout (little-endian):
+
+    offset  size  field
+    0       1     message type (MSG_FRAME = 1)
+    1       4     sequence number (uint32)
+    5       8     capture timestamp, ms since epoch (float64)
+    13      1     image format (FORMAT_JPEG = 1, FORMAT_WEBP = 2)
+    14      ...   encoded image bytes
+
+Text messages keep the original JSON format ({"type": "frame", "data": "data:image/jpeg;base64,..."}).
+
+Compact analysis responses (opt-in with ?encoding=compact), little-endian:
+
+    offset  size  field
+    0       1     message type (MSG_ANALYSIS = 2)
+    1       1     flags (FLAG_POSE_DETECTED, FLAG_HAS_SEQ)
+    2       4     sequence number of the analysed frame (uint32)
+    6       8     capture timestamp of the analysed frame, ms (float64)
+    14      2     rep count (uint16)
+    16      1     state code (index into STATE_NAMES, 255 = none)
+    17      1     landmark count N (33 or 0)
+    18      2     meta length M (uint16, always even)
+    20      M     meta JSON: angles, errors, feedback, stats, exercise extras
+    20+M    8*N   landmarks as int16 x, y, z, visibility scaled by LANDMARK_SCALE
+"""
+
+import base64
+import json
+import struct
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+MSG_FRAME = 1
+MSG_ANALYSIS = 2
+
+FORMAT_JPEG = 1
+FORMAT_WEBP = 2
+SUPPORTED_FORMATS = (FORMAT_JPEG, FORMAT_WEBP)
+
+FRAME_HEADER = struct.Struct('<BIdB')
+ANALYSIS_HEADER = struct.Struct('<BBIdHBBH')
+
+FLAG_POSE_DETECTED = 0x01
+FLAG_HAS_SEQ = 0x02
+
+# Quantization of normalized landmark coordinates: int16 / 8192 covers [-4, 4)
+LANDMARK_SCALE = 8192.0
+
+# State codes for the compact header (ExerciseState values)
+STATE_NAMES = (
+    'down', 'raising', 'up', 'lowering',
+    'ready', 'lifting', 'holding', 'switch_side', 'complete'
+)
+STATE_CODES = {name: code for code, name in enumerate(STATE_NAMES)}
+NO_STATE = 255
+
+# Response keys carried in the header (or the landmark block) rather than in the meta JSON
+_HEADER_KEYS = {'type', 'pose_detected', 'seq', 'capture_ts', 'rep_count', 'state', 'landmarks'}
+
+
+class ProtocolError(ValueError):
+    """Raised when a binary message cannot be parsed"""
+
+
+class FrameMessage(NamedTuple):
+    """
+    A received frame, pointing into the original message buffer
+
+    The image bytes are data[offset:]; they are not sliced out so the buffer
+    can be handed to np.frombuffer(data, offset=offset) without a copy.
+    """
+    seq: Optional[int]
+    capture_ts: Optional[float]
+    image_format: int
+    data: bytes
+    offset: int
+
+
+def parse_binary_frame(data: bytes) -> FrameMessage:
+    """
+    Parse a binary frame message
+
+    Args:
+        data: Raw WebSocket binary payload
+
+    Returns:
+        FrameMessage referencing the image bytes inside data
+
+    Raises:
+        ProtocolError: If the header is truncated or the message is not a supported frame
+    """
+    if len(data) <= FRAME_HEADER.size:
+        raise ProtocolError(f"Binary message too short ({len(data)} bytes)")
+
+    msg_type, seq, capture_ts, image_format = FRAME_HEADER.unpack_from(data)
+
+    if msg_type != MSG_FRAME:
+        raise ProtocolError(f"Unknown binary message type {msg_type}")
+    if image_format not in SUPPORTED_FORMATS:
+        raise ProtocolError(f"Unsupported image format {image_format}")
+
+    return FrameMessage(seq, capture_ts, image_format, data, FRAME_HEADER.size)
+
+
+def parse_json_frame(message: dict) -> FrameMessage:
+    """
+    Parse a legacy JSON frame message carrying a base64 data URL
+
+    Args:
+        message: Decoded JSON message ({"type": "frame", "data": "data:image/jpeg;base64,..."})
+
+    Returns:
+        FrameMessage with the decoded image bytes (seq and capture_ts only if the client sent them)
+    """
+    img_data = base64.b64decode(message['data'].split(',')[1])
+    return FrameMessage(message.get('seq'), message.get('capture_ts'), FORMAT_JPEG, img_data, 0)
+
+
+def frame_timestamp(frame: FrameMessage) -> Optional[float]:
+    """Capture time of a frame in seconds since epoch, or None if the client did not send one"""
+    if not frame.capture_ts:
+        return None
+    return frame.capture_ts / 1000.0
+
+
+def encode_binary_frame(seq: int, capture_ts: float, image: bytes, image_format: int = FORMAT_JPEG) -> bytes:
+    """Build a binary frame message (used by clients, tools and tests)"""
+    return FRAME_HEADER.pack(MSG_FRAME, seq & 0xFFFFFFFF, capture_ts, image_format) + image
+
+
+def quantize_landmarks(landmarks: np.ndarray) -> bytes:
+    """Pack a (33, 4) landmark array as little-endian int16 (264 bytes)"""
+    scaled = np.rint(landmarks * LANDMARK_SCALE)
+    return np.clip(scaled, -32768, 32767).astype('<i2').tobytes()
+
+
+def encode_analysis(response: dict, landmarks: Optional[np.ndarray]) -> bytes:
+    """
+    Encode an analysis response in the compact binary format
+
+    Args:
+        response: The analysis response dict as it would be sent with send_json
+            (a 'landmarks' entry, if any, is ignored)
+        landmarks: (33, 4) landmark array from the inference result, or None
+
+    Returns:
+        Binary message bytes
+    """
+    flags = 0
+    if response.get('pose_detected'):
+        flags |= FLAG_POSE_DETECTED
+    seq = response.get('seq')
+    if seq is not None:
+        flags |= FLAG_HAS_SEQ
+
+    meta = {k: v for k, v in response.items() if k not in _HEADER_KEYS}
+    meta_bytes = json.dumps(meta, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    if len(meta_bytes) % 2:
+        meta_bytes += b' '  # Keep the int16 landmark block 2-byte aligned
+
+    landmark_bytes = quantize_landmarks(landmarks) if landmarks is not None else b''
+
+    header = ANALYSIS_HEADER.pack(
+        MSG_ANALYSIS,
+        flags,
+        (seq or 0) & 0xFFFFFFFF,
+        response.get('capture_ts') or 0.0,
+        min(response.get('rep_count') or 0, 0xFFFF),
+        STATE_CODES.get(response.get('state'), NO_STATE),
+        len(landmark_bytes) // 8,
+        len(meta_bytes)
+    )
+    return header + meta_bytes + landmark_bytes
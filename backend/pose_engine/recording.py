@@ -0,0 +1,129 @@
+"""
+Frame Stream Recording
+Records the frame messages a client sends to /ws/exercise/{exercise_type} so they can be replayed offline
+
+File layout (little-endian):
+
+    header   4    magic b'RHFR'
+             1    version (1)
+             8    recording start, seconds since epoch (float64)
+             1    exercise name length E
+             E    exercise name (utf-8)
+    record   8    receive time, seconds since epoch (float64)
+             4    message length N (uint32)
+             N    binary frame message (see protocol.py)
+
+JSON frames are stored as binary frame messages, so a recording only ever
+contains the encoded images plus their headers.
+"""
+
+import os
+import struct
+import time
+from itertools import count
+from pathlib import Path
+from typing import BinaryIO, Iterator, NamedTuple, Optional, Union
+
+from .protocol import FORMAT_JPEG, encode_binary_frame, parse_json_frame
+
+MAGIC = b'RHFR'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sBdB')
+_RECORD = struct.Struct('<dI')
+
+_recording_ids = count(1)
+
+
+class RecordedFrame(NamedTuple):
+    received_at: float
+    message: bytes
+
+
+class FrameRecorder:
+    """Appends every received frame message of one session to a recording file"""
+
+    def __init__(self, path: Union[str, Path], exercise_type: str):
+        """
+        Args:
+            path: Output file (overwritten)
+            exercise_type: Exercise of the session, stored in the header
+        """
+        self.path = Path(path)
+        self.frames = 0
+        name = exercise_type.encode('utf-8')[:255]
+        self._file: Optional[BinaryIO] = open(self.path, 'wb')
+        self._file.write(_HEADER.pack(MAGIC, VERSION, time.time(), len(name)) + name)
+
+    def write(self, message: bytes, received_at: Optional[float] = None):
+        """Record a binary frame message"""
+        if self._file is None:
+            return
+        self._file.write(_RECORD.pack(received_at or time.time(), len(message)))
+        self._file.write(message)
+        self.frames += 1
+
+    def write_json_frame(self, message: dict, received_at: Optional[float] = None):
+        """Record a legacy JSON frame as the equivalent binary frame message"""
+        frame = parse_json_frame(message)
+        self.write(
+            encode_binary_frame(frame.seq or self.frames, frame.capture_ts or 0.0, frame.data, FORMAT_JPEG),
+            received_at
+        )
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def open_recorder(directory: Union[str, Path], exercise_type: str) -> FrameRecorder:
+    """Start a recording named <exercise>_<timestamp>_<pid>-<n>.frames inside directory"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    name = f"{exercise_type}_{stamp}_{os.getpid()}-{next(_recording_ids)}.frames"
+    return FrameRecorder(directory / name, exercise_type)
+
+
+class Recording(NamedTuple):
+    exercise_type: str
+    started_at: float
+    frames: list
+
+
+def read_recording(path: Union[str, Path]) -> Recording:
+    """
+    Load a recording file
+
+    Raises:
+        ValueError: If the file is not a frame recording
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    return Recording(*_parse(data))
+
+
+def _parse(data: bytes):
+    if len(data) < _HEADER.size:
+        raise ValueError("Not a frame recording (file too short)")
+    magic, version, started_at, name_len = _HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Not a frame recording (magic {magic!r}, version {version})")
+
+    offset = _HEADER.size
+    exercise_type = data[offset:offset + name_len].decode('utf-8')
+    offset += name_len
+
+    return exercise_type, started_at, list(_iter_records(data, offset))
+
+
+def _iter_records(data: bytes, offset: int) -> Iterator[RecordedFrame]:
+    view = memoryview(data)
+    while offset + _RECORD.size <= len(data):
+        received_at, length = _RECORD.unpack_from(data, offset)
+        offset += _RECORD.size
+        if offset + length > len(data):
+            break  # Truncated last record (server stopped mid-write)
+        yield RecordedFrame(received_at, bytes(view[offset:offset + length]))
+        offset += length
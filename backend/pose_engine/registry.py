@@ -0,0 +1,259 @@
+"""
+Exercise Session Registry
+Started exercise sessions, bound to their patient and (at most one) WebSocket connection
+
+The session records live in a SessionStore shared by all workers (see store.py); the registry
+adds the sessions running on this process's connections, with their live analysis state and
+track. A connection attaching to a session resumes it from its last checkpoint, on whichever
+worker it lands, and saves a checkpoint while it runs and when it closes. Sessions are removed
+when ended or after sitting idle longer than the idle timeout. Lookups and mutations take a
+short lock, so request handlers, the WebSocket loops and worker threads can all use the same
+registry.
+"""
+
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import metrics
+
+from .session import ExerciseSession
+from .store import SessionRecord, SessionStore
+from .tracks import TrackWriter
+
+
+class SessionNotFound(LookupError):
+    """No live session with this id for this user"""
+
+
+class ActiveSession:
+    """
+    One started exercise session, as run by this process
+
+    `lock` serialises frame recording against the end-of-session summary, which may run on
+    another thread.
+    """
+
+    def __init__(self, session_id: int, user_id: int, exercise_type: str, analysis: ExerciseSession,
+                 track: Optional[TrackWriter] = None, started_at: Optional[float] = None):
+        """
+        Args:
+            session_id: Database id of the session
+            user_id: Patient the session belongs to
+            exercise_type: Exercise id
+            analysis: Counter / error detector state of the session
+            track: Writer for the session's landmark track
+            started_at: Wall-clock start time (epoch seconds; now if None)
+        """
+        self.session_id = session_id
+        self.user_id = user_id
+        self.exercise_type = exercise_type
+        self.analysis = analysis
+        self.track = track
+        self.started_at = time.time() if started_at is None else started_at
+        self.connection: Optional[Any] = None
+        self.owner: Optional[str] = None  # Store owner id of the connection
+        self.resumed = False  # Continued from a checkpoint or taken over from another connection
+        self.lock = threading.Lock()
+        self.ended = False
+
+    def log_frame(self, landmarks: np.ndarray, response: Dict[str, Any]):
+        """Record an analysed frame in the session's track"""
+        if self.track is None:
+            return
+        analysis = self.analysis
+        with self.lock:
+            if not self.ended:
+                self.track.write(analysis.last_timestamp, landmarks, response['rep_count'],
+                                 analysis.rep_counter.get_state(), analysis.last_angles, response['errors'])
+
+    def close(self, keep_frames: bool = True):
+        """
+        Stop recording (idempotent); the analysis state stays readable for the summary
+
+        Args:
+            keep_frames: Write the buffered track frames (False once another connection owns the track)
+        """
+        with self.lock:
+            self.ended = True
+            if self.track is not None:
+                if keep_frames:
+                    self.track.close()
+                else:
+                    self.track.abort()
+
+
+# Builds the analysis state (and track) of a session attached on this process
+SessionFactory = Callable[[SessionRecord], Tuple[ExerciseSession, Optional[TrackWriter]]]
+
+
+def _analysis_only(record: SessionRecord) -> Tuple[ExerciseSession, Optional[TrackWriter]]:
+    return ExerciseSession(record.exercise_type), None
+
+
+class SessionRegistry:
+    """Thread-safe view of the started sessions, and of the ones connected to this process"""
+
+    def __init__(self, store: SessionStore, idle_timeout: float = 900.0,
+                 open_session: SessionFactory = _analysis_only):
+        """
+        Args:
+            store: Session records shared by all workers
+            idle_timeout: Seconds a session may go without activity before it is evicted
+            open_session: Creates the analysis state (and track) of a session attached here
+        """
+        self.store = store
+        self.idle_timeout = idle_timeout
+        self.open_session = open_session
+        self.node = f"{socket.gethostname()}:{os.getpid()}"
+        self._sessions: Dict[int, ActiveSession] = {}  # Connected on this process
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def _update_gauge(self):
+        metrics.LIVE_SESSIONS.set(len(self.store))
+
+    def start(self, session_id: int, user_id: int, exercise_type: str, started_at: Optional[float] = None):
+        """Register a started session (replaces a stale entry with the same id)"""
+        started_at = time.time() if started_at is None else started_at
+        self.store.create(SessionRecord(session_id, user_id, exercise_type, started_at))
+        with self._lock:
+            previous = self._sessions.pop(session_id, None)
+        if previous is not None:
+            previous.close()
+        self._update_gauge()
+
+    def get(self, session_id: int, user_id: int) -> SessionRecord:
+        """
+        Raises:
+            SessionNotFound: Unknown id, or the session belongs to another user
+        """
+        record = self.store.get(session_id)
+        if record is None or record.user_id != user_id:
+            raise SessionNotFound(session_id)
+        return record
+
+    def connected(self, session_id: int) -> Optional[ActiveSession]:
+        """The session if a connection of this process runs it"""
+        return self._sessions.get(session_id)
+
+    def attach(self, session_id: int, user_id: int, connection: Any) -> Tuple[ActiveSession, Optional[Any]]:
+        """
+        Bind a connection to the session, taking it over from a previous connection (which may
+        not have noticed yet that its client is gone)
+
+        A session already running on this process keeps its live state; otherwise it resumes
+        from its checkpoint in the store, and a connection running it on another worker stops
+        at its next checkpoint.
+
+        Returns:
+            (session, previous connection on this process or None) - the caller closes the latter
+
+        Raises:
+            SessionNotFound: Unknown id, or the session belongs to another user
+        """
+        owner = f"{self.node}/{uuid.uuid4().hex[:12]}"
+        with self._lock:
+            record = self.get(session_id, user_id)
+            session = self._sessions.get(session_id)
+            previous = None
+            if session is None:
+                analysis, track = self.open_session(record)
+                session = ActiveSession(session_id, user_id, record.exercise_type, analysis, track,
+                                        record.started_at)
+                if record.checkpoint is not None:
+                    analysis.restore(record.checkpoint)
+                self._sessions[session_id] = session
+            elif session.connection is not connection:
+                previous = session.connection
+            if self.store.claim(session_id, owner) is None:  # Ended meanwhile
+                del self._sessions[session_id]
+                session.close()
+                raise SessionNotFound(session_id)
+            session.resumed = record.checkpoint is not None or previous is not None
+            session.connection = connection
+            session.owner = owner
+        return session, previous
+
+    def checkpoint(self, session: ActiveSession, connection: Any, state: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Save the session's state while it runs
+
+        Args:
+            state: session.analysis.checkpoint(), taken by the caller when this runs on another
+                thread than the analysis (taken here if None)
+
+        Returns:
+            False if the connection no longer runs the session (ended, or taken over)
+        """
+        if session.connection is not connection or session.ended:
+            return False
+        if state is None:
+            state = session.analysis.checkpoint()
+        saved = self.store.save_checkpoint(session.session_id, session.owner, state)
+        if saved:
+            metrics.CHECKPOINTS_SAVED.inc()
+        return saved
+
+    def detach(self, session: ActiveSession, connection: Any):
+        """Unbind the connection and save the state to resume from (the session stays started)"""
+        with self._lock:
+            if session.connection is not connection:
+                return  # Taken over on this process, which keeps running it
+            session.connection = None
+            if self._sessions.get(session.session_id) is session:
+                del self._sessions[session.session_id]
+            # Under the lock, so a reconnect attaching here resumes from this checkpoint
+            released = not session.ended and self.store.release(
+                session.session_id, session.owner, session.analysis.checkpoint()
+            )
+        if released:
+            metrics.CHECKPOINTS_SAVED.inc()
+        if not session.ended:
+            session.close(keep_frames=released)
+
+    def heartbeat(self):
+        """Keep the sessions connected here from being evicted while their clients send no frames"""
+        self.store.touch(list(self._sessions))
+
+    def _finished(self, record: SessionRecord) -> ActiveSession:
+        """The removed session: its live state if it runs here, else restored from its checkpoint"""
+        with self._lock:
+            session = self._sessions.pop(record.session_id, None)
+        if session is None:
+            analysis, _ = _analysis_only(record)
+            if record.checkpoint is not None:
+                analysis.restore(record.checkpoint)
+            session = ActiveSession(record.session_id, record.user_id, record.exercise_type, analysis,
+                                    started_at=record.started_at)
+        session.close()
+        return session
+
+    def pop(self, session_id: int, user_id: int) -> ActiveSession:
+        """
+        Remove a session so it can be ended
+
+        Raises:
+            SessionNotFound: Unknown id, or the session belongs to another user
+        """
+        self.get(session_id, user_id)
+        record = self.store.pop(session_id)
+        if record is None:
+            raise SessionNotFound(session_id)  # Ended meanwhile by another worker
+        self._update_gauge()
+        return self._finished(record)
+
+    def evict_idle(self) -> List[ActiveSession]:
+        """Remove and return the sessions that have been idle past the timeout"""
+        idle = [self._finished(record) for record in self.store.pop_idle(self.idle_timeout)]
+        self._update_gauge()
+        if idle:
+            metrics.SESSIONS_EVICTED.inc(len(idle))
+        return idle
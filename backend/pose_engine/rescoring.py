@@ -0,0 +1,276 @@
+"""
+Session Re-scoring
+Re-runs rep counting and error detection over stored session tracks with candidate thresholds,
+so doctors can see how past accuracy would change before tuning a patient's down/up angles
+
+Cycle exercises are re-scored for many sessions at once, without a per-frame Python loop:
+
+- The cycle state machine (RepetitionCounter._count_cycle) is a 4-state hysteresis detector. Each
+  frame's transitions are a lookup table next[state] computed from the metric with array
+  comparisons. Runs of frames with the same table collapse to one table, the run tables are
+  composed with a parallel prefix scan (log2(runs) NumPy steps), and that gives the state after
+  every frame exactly as the per-frame counter would. A session start resets to the initial state.
+- Error persistence (ErrorDetector) is computed per run of frames where a rule holds: a run
+  starts when the rule starts holding or a rep completes (timers reset), and the error is recorded
+  on frames at least ERROR_PERSIST_SECONDS after the run started.
+
+Other counters (hold_sides) replay the stored frames through the per-frame classes.
+"""
+
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Union
+
+import numpy as np
+
+from .counting import ErrorDetector, RepetitionCounter
+from .exercises import get_exercise
+from .tracks import read_track
+
+
+class SessionAngles(NamedTuple):
+    """Analysed frames of one stored session"""
+    session_id: Union[int, str]
+    exercise_type: str
+    times: np.ndarray               # (n,) seconds
+    columns: Dict[str, np.ndarray]  # angle/feature name -> (n,) values
+
+
+def load_session_angles(session_id: Union[int, str], path: Union[str, Path]) -> SessionAngles:
+    """
+    Read the angles of a session track
+
+    Frames before the last in-session reset (rep count going down) are dropped, like the
+    session summary which only counts reps after a reset.
+    """
+    with read_track(path) as track:
+        frames = track.read()
+        names = track.value_names
+        exercise_type = track.exercise_type
+
+    start = 0
+    resets = np.flatnonzero(np.diff(frames.rep_count) < 0)
+    if len(resets):
+        start = int(resets[-1]) + 1
+
+    values = frames.values[start:].astype(np.float64)
+    return SessionAngles(
+        session_id, exercise_type, frames.times[start:],
+        {name: values[:, i] for i, name in enumerate(names)}
+    )
+
+
+def _session_result(session_id, total_reps: int, correct_reps: int, error_summary: Dict[str, int]) -> Dict:
+    accuracy = (correct_reps / total_reps * 100) if total_reps > 0 else 0
+    return {
+        'session_id': session_id,
+        'total_reps': total_reps,
+        'correct_reps': correct_reps,
+        'accuracy': round(accuracy, 2),
+        'errors': error_summary,
+    }
+
+
+# Transition tables over the 4 cycle states, encoded as base-4 ids (table[0]*64 + ... + table[3])
+_TABLES = np.array([[(i >> 6) & 3, (i >> 4) & 3, (i >> 2) & 3, i & 3] for i in range(256)], dtype=np.int8)
+# _POWERS[k, id] = table applied k times (k = 0..3; a cycle table settles after at most 3 steps)
+_POWERS = np.empty((4, 256, 4), dtype=np.int8)
+_POWERS[0] = np.arange(4)
+for _k in range(1, 4):
+    _POWERS[_k] = np.take_along_axis(_TABLES, _POWERS[_k - 1].astype(np.intp), axis=1)
+
+
+def _prefix_compose(tables: np.ndarray) -> np.ndarray:
+    """
+    Inclusive prefix scan of state transition tables
+
+    Args:
+        tables: (n, S) array, tables[t][s] = state after step t when in state s before it
+
+    Returns:
+        (n, S) array, result[t][s] = state after step t when in state s before step 0
+    """
+    composed = tables
+    step = 1
+    while step < len(composed):
+        shifted = composed.copy()
+        # Apply the earlier prefix first, then this step's table
+        shifted[step:] = np.take_along_axis(composed[step:], composed[:-step].astype(np.intp), axis=1)
+        composed = shifted
+        step *= 2
+    return composed
+
+
+def _cycle_states(ids: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """
+    State after every frame, starting each session in state 0
+
+    Consecutive frames with the same table are scanned as one run: only the run tables are
+    composed, then each frame's state is looked up from its run's entry state.
+    """
+    n = len(ids)
+    new_run = starts.copy()
+    new_run[1:] |= ids[1:] != ids[:-1]
+    run_first = np.flatnonzero(new_run)
+    run_length = np.diff(np.append(run_first, n))
+    run_table = ids[run_first]
+    run_starts_session = starts[run_first]
+
+    run_fn = _POWERS[np.minimum(run_length, 3), run_table]
+    run_fn[run_starts_session] = run_fn[run_starts_session, :1]  # Forget earlier sessions
+    after_run = _prefix_compose(run_fn)[:, 0]
+    entry = np.zeros(len(run_first), dtype=np.int8)
+    entry[1:] = after_run[:-1]
+    entry[run_starts_session] = 0
+
+    run_of = np.cumsum(new_run) - 1
+    applied = np.minimum(np.arange(n) - run_first[run_of] + 1, 3)
+    return _POWERS[applied, ids, entry[run_of]]
+
+
+def _score_cycle(sessions: List[SessionAngles], counter: RepetitionCounter,
+                 error_threshold: float) -> List[Dict]:
+    """Vectorized cycle counter + error detector over all sessions"""
+    exercise = counter.exercise
+    config = exercise.counter
+    names = list(sessions[0].columns)
+
+    lengths = np.array([len(s.times) for s in sessions])
+    n = int(lengths.sum())
+    if n == 0:
+        return [_session_result(s.session_id, 0, 0, {}) for s in sessions]
+
+    times = np.concatenate([s.times for s in sessions])
+    columns = {name: np.concatenate([s.columns[name] for s in sessions]) for name in names}
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    starts = np.zeros(n, dtype=bool)
+    starts[offsets[lengths > 0]] = True
+    session_of = np.cumsum(starts) - 1  # Index into the non-empty sessions
+    non_empty = np.flatnonzero(lengths > 0)
+
+    # Rest=0, toward=1, peak=2, back=3 (config['states'] order); decreasing metrics are negated
+    sign = -1.0 if config.get('direction') == 'decreasing' else 1.0
+    value = sign * exercise.array_metrics[config['metric']](columns)
+    down = sign * counter.down_threshold
+    up = sign * counter.up_threshold
+    hysteresis = counter.hysteresis
+    back_to_rest = value <= down if config.get('inclusive_complete', False) else value < down
+
+    # Per-frame transition table of _count_cycle, as a _TABLES id
+    ids = (
+        np.where(value > down + hysteresis, 1, 0) * 64
+        + np.where(value >= up, 2, np.where(value < down, 0, 1)) * 16
+        + np.where(value < up - hysteresis, 3, 2) * 4
+        + np.where(back_to_rest, 0, np.where(value > up, 2, 3))
+    ).astype(np.uint8)
+    states = _cycle_states(ids, starts)
+    before = np.empty_like(states)
+    before[0] = 0
+    before[1:] = states[:-1]
+    before[starts] = 0
+    rep_done = (before == 3) & (states == 0)
+
+    rep_frames = np.flatnonzero(rep_done)
+    rep_session = session_of[rep_frames]
+    reps_before = np.cumsum(rep_done)  # Global index of the rep in progress after each frame
+    rep_has_error = np.zeros(len(rep_frames), dtype=bool)
+
+    state_index = {state: i for i, state in enumerate(config['states'])}
+    frame_index = np.arange(n)
+    error_counts: Dict[str, np.ndarray] = {}
+    for rule in exercise.error_rules:
+        if rule.state not in state_index:
+            continue
+        metric = exercise.array_metrics[rule.metric_name](columns)
+        holds = (states == state_index[rule.state]) & rule.test(metric, rule.threshold)
+
+        held_before = np.empty_like(holds)
+        held_before[0] = False
+        held_before[1:] = holds[:-1]
+        held_before[starts] = False
+        run_start = holds & (~held_before | rep_done)
+        started_at = np.maximum.accumulate(np.where(run_start, frame_index, 0))
+        recorded = holds & (times - times[started_at] >= error_threshold)
+
+        # Errors count for the rep in progress, if it completes within the same session
+        rep = reps_before[recorded]
+        session = session_of[recorded]
+        completes = rep < len(rep_frames)
+        rep, session = rep[completes], session[completes]
+        rep = np.unique(rep[rep_session[rep] == session])
+        if len(rep):
+            rep_has_error[rep] = True
+            error_counts[rule.name] = error_counts.get(rule.name, 0) + np.bincount(
+                rep_session[rep], minlength=len(non_empty))
+
+    total = np.bincount(rep_session, minlength=len(non_empty))
+    correct = np.bincount(rep_session[~rep_has_error], minlength=len(non_empty))
+
+    results = [_session_result(s.session_id, 0, 0, {}) for s in sessions]
+    for i, k in enumerate(non_empty):
+        summary = {name: int(counts[i]) for name, counts in error_counts.items() if counts[i]}
+        results[k] = _session_result(sessions[k].session_id, int(total[i]), int(correct[i]), summary)
+    return results
+
+
+def _score_frames(session: SessionAngles, down_angle: Optional[float], up_angle: Optional[float]) -> Dict:
+    """Replay one session through the per-frame RepetitionCounter / ErrorDetector"""
+    counter = RepetitionCounter(session.exercise_type)
+    counter.set_thresholds(down_angle, up_angle)
+    detector = ErrorDetector(session.exercise_type)
+    names = list(session.columns)
+    values = np.column_stack([session.columns[name] for name in names]) if names else None
+
+    prev_rep_count = 0
+    for i, now in enumerate(session.times.tolist()):
+        angles = dict(zip(names, values[i].tolist()))
+        rep_count = counter.update(angles, now)
+        if rep_count > prev_rep_count:
+            detector.reset_timers()
+            prev_rep_count = rep_count
+        detector.detect_errors(None, angles, counter.get_state(), counter, now)
+
+    correct = sum(1 for rep_errors in counter.all_rep_errors if not rep_errors)
+    return _session_result(session.session_id, counter.rep_count, correct, counter.get_error_summary())
+
+
+def rescore_sessions(sessions: Iterable[SessionAngles], exercise_type: str,
+                     down_angle: Optional[float] = None, up_angle: Optional[float] = None,
+                     vectorized: bool = True) -> Dict:
+    """
+    Recompute reps, correct reps, accuracy and per-rep error counts with candidate thresholds
+
+    Args:
+        sessions: Stored sessions of exercise_type
+        exercise_type: Exercise id
+        down_angle: Candidate down threshold (exercise default if None)
+        up_angle: Candidate up threshold (exercise default if None)
+        vectorized: Use the batched NumPy path for cycle exercises (False replays frame by frame)
+
+    Returns:
+        {'exercise', 'thresholds', 'thresholds_applied', 'sessions': [...], 'summary': {...}}
+    """
+    sessions = [s for s in sessions if s.exercise_type == exercise_type]
+    counter = RepetitionCounter(exercise_type)
+    applied = counter.set_thresholds(down_angle, up_angle)
+
+    if vectorized and get_exercise(exercise_type).counter_kind == 'cycle' and sessions:
+        results = _score_cycle(sessions, counter, ErrorDetector(exercise_type).error_threshold)
+    else:
+        # Thresholds the live counter would ignore are ignored here too
+        results = [_score_frames(s, down_angle if applied else None, up_angle if applied else None)
+                   for s in sessions]
+
+    total = sum(r['total_reps'] for r in results)
+    correct = sum(r['correct_reps'] for r in results)
+    return {
+        'exercise': exercise_type,
+        'thresholds': {'down_angle': counter.down_threshold, 'up_angle': counter.up_threshold},
+        'thresholds_applied': applied,
+        'sessions': results,
+        'summary': {
+            'sessions': len(results),
+            'total_reps': total,
+            'correct_reps': correct,
+            'accuracy': round(correct / total * 100, 2) if total else 0,
+        },
+    }
@@ -0,0 +1,153 @@
+"""
+Exercise Session Analysis
+Per-session pipeline from landmarks to the analysis response: angles -> rep counter -> error detector -> feedback
+"""
+
+import time
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+from logs import SessionLogger
+from metrics import StageTimer
+
+from .angles import AngleCalculator
+from .counting import ErrorDetector, RepetitionCounter
+
+
+class ExerciseSession:
+    """
+    Analysis state of one exercise session
+
+    Shared by the WebSocket handler and the offline benchmarks so both run
+    exactly the same per-frame code.
+    """
+
+    def __init__(self, exercise_type: str, log: Optional[SessionLogger] = None,
+                 clock: Callable[[], float] = time.time):
+        """
+        Args:
+            exercise_type: Exercise id
+            log: Session logger (an unsampled one is created if None)
+            clock: Time source for frames analysed without a timestamp
+        """
+        self.exercise_type = exercise_type
+        self.log = log if log is not None else SessionLogger(exercise_type, sampled=False)
+        self.clock = clock
+        self.angle_calc = AngleCalculator(exercise_type, log=self.log)  # Reuses its buffers for every frame
+        self.rep_counter = RepetitionCounter(exercise_type, log=self.log, clock=clock)
+        self.error_detector = ErrorDetector(exercise_type, clock=clock)
+        self.prev_rep_count = 0  # Track previous rep count to detect new reps
+        self.last_angles: Dict[str, float] = {}
+        self.last_timestamp: Optional[float] = None
+        self._resuming = False  # Set by restore(): the next frame's gap is not elapsed time
+
+    def analyze(self, landmarks: np.ndarray, timer: Optional[StageTimer] = None,
+                timestamp: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Run one frame with a detected pose through the counter and error detector
+
+        Args:
+            landmarks: (33, 4) float32 array of x, y, z, visibility
+            timer: Records the angles / counting / errors stages if given
+            timestamp: Capture time of the frame in seconds (the clock is read if None);
+                never allowed to go backwards within a session
+
+        Returns:
+            The analysis response (without seq/stats/landmarks, which the transport adds)
+        """
+        rep_counter = self.rep_counter
+
+        now = timestamp if timestamp is not None else self.clock()
+        if self._resuming:
+            # Hold / state / error timers continue from where the checkpoint left them, even if
+            # the reconnected client's clock differs from the previous one
+            self._resuming = False
+            if self.last_timestamp is not None:
+                gap = now - self.last_timestamp
+                rep_counter.shift_time(gap)
+                self.error_detector.shift_time(gap)
+        elif self.last_timestamp is not None and now < self.last_timestamp:
+            now = self.last_timestamp
+        self.last_timestamp = now
+
+        angles = self.angle_calc.get_angles(landmarks)
+        self.last_angles = angles
+        if timer:
+            timer.mark('angles')
+
+        rep_count = rep_counter.update(angles, now)
+
+        # Reset error timers when new rep starts
+        if rep_count > self.prev_rep_count:
+            self.error_detector.reset_timers()
+            self.prev_rep_count = rep_count
+
+        current_state = rep_counter.get_state()
+        if timer:
+            timer.mark('counting')
+
+        errors = self.error_detector.detect_errors(landmarks, angles, current_state, rep_counter, now)
+
+        # Errors first, otherwise the exercise's message for the current state
+        feedback_msg = errors[0]['message'] if errors else rep_counter.get_feedback()
+
+        response = {
+            'type': 'analysis',
+            'pose_detected': True,
+            'angles': {k: round(v, 1) if isinstance(v, (int, float)) else v for k, v in angles.items()},
+            'rep_count': rep_count,
+            'errors': errors,
+            'feedback': feedback_msg,
+            'state': current_state.value,
+            **rep_counter.get_extras()
+        }
+        if timer:
+            timer.mark('errors')
+        return response
+
+    def set_thresholds(self, thresholds: Dict[str, Any]) -> bool:
+        """Apply personalized thresholds from a set_thresholds message"""
+        applied = self.rep_counter.set_thresholds(thresholds.get('down_angle'), thresholds.get('up_angle'))
+        self.log.info('thresholds_received', applied=applied,
+                      down=self.rep_counter.down_threshold, up=self.rep_counter.up_threshold)
+        return applied
+
+    def checkpoint(self) -> Dict[str, Any]:
+        """
+        Counter and error detector state, JSON-serialisable, as of the last analysed frame
+
+        Thresholds are included; angles are recomputed from every frame, so nothing else is needed.
+        """
+        return {
+            'exercise_type': self.exercise_type,
+            'prev_rep_count': self.prev_rep_count,
+            'last_timestamp': self.last_timestamp,
+            'counter': self.rep_counter.checkpoint(),
+            'errors': self.error_detector.checkpoint(),
+        }
+
+    def restore(self, checkpoint: Dict[str, Any]):
+        """
+        Continue a session from its checkpoint(); the time until the next frame is skipped
+
+        Raises:
+            ValueError: The checkpoint is of another exercise
+        """
+        if checkpoint['exercise_type'] != self.exercise_type:
+            raise ValueError(f"Checkpoint of {checkpoint['exercise_type']} cannot resume {self.exercise_type}")
+        self.prev_rep_count = checkpoint['prev_rep_count']
+        self.last_timestamp = checkpoint['last_timestamp']
+        self.rep_counter.restore(checkpoint['counter'])
+        self.error_detector.restore(checkpoint['errors'])
+        self._resuming = True
+        self.log.info('session_resumed', rep=self.rep_counter.rep_count, state=self.rep_counter.state.value)
+
+    def reset(self):
+        """Start a new set: counter, error persistence timers and the frame clock start over"""
+        self.rep_counter.reset()
+        self.error_detector.reset_timers()
+        self.prev_rep_count = 0
+        self.last_angles = {}
+        self.last_timestamp = None
+        self._resuming = False
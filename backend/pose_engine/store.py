@@ -0,0 +1,291 @@
+"""
+Session State Store
+Started exercise sessions and their analysis checkpoints, kept outside the worker processes so
+any API / WebSocket worker can attach to, resume or end any session
+
+A session record names its patient and exercise, the connection currently running it (owner)
+and the counter / error detector checkpoint it resumes from (ExerciseSession.checkpoint). The
+owner saves checkpoints while it runs and on disconnect; writes from a connection that has
+been taken over are ignored, which is how it learns to stop.
+
+- MemorySessionStore: in-process dict (single worker, the default)
+- SQLiteSessionStore: a shared SQLite file, for several workers on one machine and for tests
+
+Other backends (e.g. a network key-value store for several machines) implement SessionStore.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Union
+
+
+class SessionRecord(NamedTuple):
+    """A started session as seen by every worker"""
+    session_id: int
+    user_id: int
+    exercise_type: str
+    started_at: float                     # Seconds since epoch
+    owner: Optional[str] = None           # Connection running the session (None = disconnected)
+    checkpoint: Optional[Dict[str, Any]] = None
+    last_active: float = 0.0              # Seconds since epoch
+
+
+class SessionStore(ABC):
+    """
+    Interface of the session state backends
+
+    All methods are atomic with respect to other workers using the same store.
+    """
+
+    @abstractmethod
+    def create(self, record: SessionRecord):
+        """Add a started session (replaces a record with the same id)"""
+
+    @abstractmethod
+    def get(self, session_id: int) -> Optional[SessionRecord]:
+        """The session's record, None if unknown"""
+
+    @abstractmethod
+    def claim(self, session_id: int, owner: str) -> Optional[SessionRecord]:
+        """
+        Make `owner` the connection running the session
+
+        Returns:
+            The record as it was before (its owner is the connection taken over), None if unknown
+        """
+
+    @abstractmethod
+    def save_checkpoint(self, session_id: int, owner: str, checkpoint: Dict[str, Any]) -> bool:
+        """
+        Store the owner's latest checkpoint
+
+        Returns:
+            False if the session is gone or owned by another connection (nothing is written)
+        """
+
+    @abstractmethod
+    def release(self, session_id: int, owner: str, checkpoint: Dict[str, Any]) -> bool:
+        """save_checkpoint() and mark the session disconnected"""
+
+    @abstractmethod
+    def touch(self, session_ids: Iterable[int]):
+        """Mark sessions as active (connected sessions that may not be sending frames)"""
+
+    @abstractmethod
+    def pop(self, session_id: int) -> Optional[SessionRecord]:
+        """Remove and return a session (None if another worker already did)"""
+
+    @abstractmethod
+    def pop_idle(self, idle_seconds: float) -> List[SessionRecord]:
+        """Remove and return the sessions inactive for longer than idle_seconds"""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Number of started sessions"""
+
+    def close(self):
+        """Release the backend's resources (connections, files)"""
+
+
+class MemorySessionStore(SessionStore):
+    """Session records in a dict of this process"""
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self._records: Dict[int, SessionRecord] = {}
+        self._lock = threading.Lock()
+
+    def create(self, record: SessionRecord):
+        with self._lock:
+            self._records[record.session_id] = record._replace(last_active=self.clock())
+
+    def get(self, session_id: int) -> Optional[SessionRecord]:
+        return self._records.get(session_id)
+
+    def claim(self, session_id: int, owner: str) -> Optional[SessionRecord]:
+        with self._lock:
+            record = self._records.get(session_id)
+            if record is not None:
+                self._records[session_id] = record._replace(owner=owner, last_active=self.clock())
+        return record
+
+    def _update_owned(self, session_id: int, expected_owner: str, **fields) -> bool:
+        with self._lock:
+            record = self._records.get(session_id)
+            if record is None or record.owner != expected_owner:
+                return False
+            self._records[session_id] = record._replace(last_active=self.clock(), **fields)
+        return True
+
+    def save_checkpoint(self, session_id: int, owner: str, checkpoint: Dict[str, Any]) -> bool:
+        return self._update_owned(session_id, owner, checkpoint=checkpoint)
+
+    def release(self, session_id: int, owner: str, checkpoint: Dict[str, Any]) -> bool:
+        return self._update_owned(session_id, owner, checkpoint=checkpoint, owner=None)
+
+    def touch(self, session_ids: Iterable[int]):
+        now = self.clock()
+        with self._lock:
+            for session_id in session_ids:
+                record = self._records.get(session_id)
+                if record is not None:
+                    self._records[session_id] = record._replace(last_active=now)
+
+    def pop(self, session_id: int) -> Optional[SessionRecord]:
+        with self._lock:
+            return self._records.pop(session_id, None)
+
+    def pop_idle(self, idle_seconds: float) -> List[SessionRecord]:
+        deadline = self.clock() - idle_seconds
+        with self._lock:
+            idle = [r for r in self._records.values() if r.last_active < deadline]
+            for record in idle:
+                del self._records[record.session_id]
+        return idle
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Session records in a SQLite file shared by the worker processes of one machine
+
+    WAL mode keeps readers from blocking the writer; every worker opens its own connection.
+    """
+
+    def __init__(self, path: Union[str, Path], clock: Callable[[], float] = time.time):
+        self.path = str(path)
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS live_sessions (
+                session_id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                exercise_type TEXT NOT NULL,
+                started_at REAL NOT NULL,
+                owner TEXT,
+                checkpoint TEXT,
+                last_active REAL NOT NULL
+            )
+        """)
+
+    @contextmanager
+    def _transaction(self):
+        """Read-modify-write under SQLite's write lock, so other workers see all of it or none"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    @staticmethod
+    def _record(row) -> SessionRecord:
+        session_id, user_id, exercise_type, started_at, owner, checkpoint, last_active = row
+        return SessionRecord(session_id, user_id, exercise_type, started_at, owner,
+                             json.loads(checkpoint) if checkpoint else None, last_active)
+
+    def _select(self, where: str, params=()) -> List[SessionRecord]:
+        rows = self._conn.execute(
+            "SELECT session_id, user_id, exercise_type, started_at, owner, checkpoint, last_active "
+            f"FROM live_sessions WHERE {where}", params
+        ).fetchall()
+        return [self._record(row) for row in rows]
+
+    def create(self, record: SessionRecord):
+        checkpoint = json.dumps(record.checkpoint) if record.checkpoint is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO live_sessions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (record.session_id, record.user_id, record.exercise_type, record.started_at,
+                 record.owner, checkpoint, self.clock())
+            )
+
+    def get(self, session_id: int) -> Optional[SessionRecord]:
+        with self._lock:
+            records = self._select("session_id = ?", (session_id,))
+        return records[0] if records else None
+
+    def claim(self, session_id: int, owner: str) -> Optional[SessionRecord]:
+        with self._transaction():
+            records = self._select("session_id = ?", (session_id,))
+            if records:
+                self._conn.execute("UPDATE live_sessions SET owner = ?, last_active = ? WHERE session_id = ?",
+                                   (owner, self.clock(), session_id))
+        return records[0] if records else None
+
+    def save_checkpoint(self, session_id: int, owner: str, checkpoint: Dict[str, Any]) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE live_sessions SET checkpoint = ?, last_active = ? WHERE session_id = ? AND owner = ?",
+                (json.dumps(checkpoint), self.clock(), session_id, owner)
+            )
+        return cursor.rowcount == 1
+
+    def release(self, session_id: int, owner: str, checkpoint: Dict[str, Any]) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE live_sessions SET checkpoint = ?, owner = NULL, last_active = ? "
+                "WHERE session_id = ? AND owner = ?",
+                (json.dumps(checkpoint), self.clock(), session_id, owner)
+            )
+        return cursor.rowcount == 1
+
+    def touch(self, session_ids: Iterable[int]):
+        now = self.clock()
+        with self._lock:
+            self._conn.executemany("UPDATE live_sessions SET last_active = ? WHERE session_id = ?",
+                                   [(now, session_id) for session_id in session_ids])
+
+    def _pop_where(self, where: str, params) -> List[SessionRecord]:
+        with self._transaction():
+            records = self._select(where, params)
+            self._conn.executemany("DELETE FROM live_sessions WHERE session_id = ?",
+                                   [(r.session_id,) for r in records])
+        return records
+
+    def pop(self, session_id: int) -> Optional[SessionRecord]:
+        records = self._pop_where("session_id = ?", (session_id,))
+        return records[0] if records else None
+
+    def pop_idle(self, idle_seconds: float) -> List[SessionRecord]:
+        return self._pop_where("last_active < ?", (self.clock() - idle_seconds,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM live_sessions").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_session_store(url: str, directory: Union[str, Path] = '.') -> SessionStore:
+    """
+    Store from a SESSION_STORE setting: 'memory' or 'sqlite:<path>'
+
+    Args:
+        url: The setting; 'sqlite:' alone is <directory>/session_state.db
+        directory: Where a relative SQLite path is resolved
+
+    Raises:
+        ValueError: Unknown store
+    """
+    if url in ('', 'memory'):
+        return MemorySessionStore()
+    if url.startswith('sqlite:'):
+        path = Path(directory) / (url[len('sqlite:'):] or 'session_state.db')
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return SQLiteSessionStore(path)
+    raise ValueError(f"Unknown session store {url!r} (expected 'memory' or 'sqlite:<path>')")
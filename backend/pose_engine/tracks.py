@@ -0,0 +1,448 @@
+"""
+Session Track Recording
+Compact append-only record of what the analysis saw in one exercise session: landmarks, angles,
+rep count, state and errors for every analysed frame
+
+Every frame is a fixed-width record of quantized integers:
+
+    time      int32   milliseconds since the track started
+    rep       int16   rep count
+    state     int16   index into ExerciseState
+    errors    int16   bit i set if error i of the exercise was reported (uint16 bits)
+    landmarks int16   33 x (x, y, z, visibility), scaled by LANDMARK_SCALES
+    values    int16   the exercise's angles (ANGLE_SCALE) then features (FEATURE_SCALE), MISSING if NaN
+
+Records are buffered into chunks of up to `chunk_frames` frames. Each chunk is delta-encoded
+along time (wrapping int16/int32 arithmetic, so it is lossless after quantization), split into
+low/high byte planes stored column-major so the near-constant high bytes sit together, and
+zlib-compressed.
+
+Data file (<name>.track, little-endian):
+
+    header   4    magic b'RHTK'
+             1    version (1)
+             8    track start, seconds since epoch (float64)
+             2    chunk_frames (uint16)
+             then length-prefixed (uint8) utf-8 strings: exercise name, angle count A + A angle
+             names, feature count F + F feature names, error count R + R error names (counts are uint8)
+    chunk    compressed bytes, located through the index
+
+Index file (<name>.track.idx): 8-byte header (magic b'RHTI', version, padding) followed by
+fixed-width INDEX_DTYPE entries, one per chunk, so it can be memory-mapped with numpy. An
+entry is appended only after its chunk is on disk, so a crash loses at most the open chunk.
+
+A track can be reopened for appending (a session resumed by another worker process). Chunks are
+always written at the current end of the data file, so a chunk flushed late by a connection
+that was taken over cannot overwrite the new writer's chunks.
+"""
+
+import mmap
+import os
+import struct
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+
+from .exercises import ExerciseState, get_exercise
+from .landmarks import NUM_LANDMARKS
+
+MAGIC = b'RHTK'
+INDEX_MAGIC = b'RHTI'
+VERSION = 1
+
+# Below the jitter of the pose model: 0.5e-3 of the image is 0.3 px at 640x480
+LANDMARK_SCALES = np.array([2000.0, 2000.0, 1000.0, 100.0], dtype=np.float32)  # x, y, z, visibility
+ANGLE_SCALE = 10.0     # 0.1 degree
+FEATURE_SCALE = 2000.0  # Normalised coordinates, like landmark x/y
+MISSING = -32768       # Quantized NaN
+
+FIXED_COLUMNS = 3  # rep, state, errors
+LANDMARK_COLUMNS = NUM_LANDMARKS * 4
+
+INDEX_DTYPE = np.dtype([
+    ('offset', '<u8'),       # Byte offset of the chunk in the data file
+    ('size', '<u4'),         # Compressed size
+    ('first_frame', '<u4'),
+    ('frames', '<u4'),
+    ('first_ms', '<i4'),
+    ('last_ms', '<i4'),
+])
+
+_HEADER = struct.Struct('<4sBdH')
+_INDEX_HEADER = struct.Struct('<4sB3x')
+
+STATES: List[ExerciseState] = list(ExerciseState)
+_STATE_INDEX = {state: i for i, state in enumerate(STATES)}
+
+
+def track_columns(exercise_type: str):
+    """Angle names, feature names (AngleCalculator order) and error names (bit order) recorded for an exercise"""
+    exercise = get_exercise(exercise_type)
+    angle_names = [t[0] for t in exercise.angle_triplets]
+    feature_names = [f[0] for f in exercise.features]
+    error_names = list(dict.fromkeys(rule.name for rule in exercise.error_rules))[:16]
+    return angle_names, feature_names, error_names
+
+
+def _value_scales(angles: int, features: int) -> np.ndarray:
+    return np.array([ANGLE_SCALE] * angles + [FEATURE_SCALE] * features, dtype=np.float32)
+
+
+def _pack_string(value: str) -> bytes:
+    encoded = value.encode('utf-8')[:255]
+    return bytes([len(encoded)]) + encoded
+
+
+def _pack_names(names: Sequence[str]) -> bytes:
+    return bytes([len(names)]) + b''.join(_pack_string(name) for name in names)
+
+
+def _quantize(values: np.ndarray, scale) -> np.ndarray:
+    scaled = np.rint(np.clip(values * scale, -32767, 32767))
+    scaled[np.isnan(values)] = MISSING
+    return scaled.astype(np.int16)
+
+
+class TrackWriter:
+    """Appends the analysed frames of one session to a track file and its index"""
+
+    def __init__(self, path: Union[str, Path], exercise_type: str, started_at: Optional[float] = None,
+                 chunk_frames: int = 150, append: bool = False):
+        """
+        Args:
+            path: Data file (overwritten unless appending); the index goes to <path>.idx
+            exercise_type: Exercise of the session (defines the value and error columns)
+            started_at: Time origin of the track (now if None)
+            chunk_frames: Frames per compressed chunk (150 = 10 s at 15 fps)
+            append: Continue an existing track of the same exercise (its time origin and chunk
+                size are kept); a missing or unreadable one is started anew
+
+        Raises:
+            ValueError: Appending to a track of another exercise
+        """
+        self.path = Path(path)
+        self.index_path = Path(f"{self.path}.idx")
+        self.exercise_type = exercise_type
+        self.started_at = time.time() if started_at is None else started_at
+        self.chunk_frames = chunk_frames
+        angle_names, feature_names, self.error_names = track_columns(exercise_type)
+        self.value_names = angle_names + feature_names
+        self._value_scales = _value_scales(len(angle_names), len(feature_names))
+        self._landmark_scales = np.tile(LANDMARK_SCALES, NUM_LANDMARKS)
+        self._value_index = {name: i for i, name in enumerate(self.value_names)}
+        self._error_bits = {name: 1 << i for i, name in enumerate(self.error_names)}
+
+        self.frames = 0
+        self.chunks = 0
+        if not (append and self._open_existing()):
+            self._file = open(self.path, 'wb')
+            self._file.write(
+                _HEADER.pack(MAGIC, VERSION, self.started_at, chunk_frames)
+                + _pack_string(exercise_type)
+                + _pack_names(angle_names)
+                + _pack_names(feature_names)
+                + _pack_names(self.error_names)
+            )
+            self._file.flush()
+            self._index = open(self.index_path, 'wb')
+            self._index.write(_INDEX_HEADER.pack(INDEX_MAGIC, VERSION))
+            self._index.flush()
+
+        width = FIXED_COLUMNS + LANDMARK_COLUMNS + len(self.value_names)
+        self._times = np.zeros(self.chunk_frames, dtype=np.int32)
+        self._rows = np.zeros((self.chunk_frames, width), dtype=np.int16)
+        self._values = np.full(len(self.value_names), np.nan, dtype=np.float32)
+        self._buffered = 0
+
+    def _open_existing(self) -> bool:
+        """Open the track at path for appending; False if there is none to continue"""
+        try:
+            existing = Track(self.path)
+        except (OSError, ValueError):
+            return False
+        with existing:
+            if existing.exercise_type != self.exercise_type:
+                raise ValueError(f"Track {self.path} is of {existing.exercise_type}, not {self.exercise_type}")
+            self.started_at = existing.started_at
+            self.chunk_frames = existing.chunk_frames
+            self.frames = len(existing)
+            self.chunks = len(existing.index)
+
+        # Drop a torn index entry (crash mid-write) so new entries stay aligned
+        whole = _INDEX_HEADER.size + self.chunks * INDEX_DTYPE.itemsize
+        if not self.index_path.exists() or self.index_path.stat().st_size < _INDEX_HEADER.size:
+            with open(self.index_path, 'wb') as index:
+                index.write(_INDEX_HEADER.pack(INDEX_MAGIC, VERSION))
+        elif self.index_path.stat().st_size != whole:
+            os.truncate(self.index_path, whole)
+        self._file = open(self.path, 'ab')
+        self._index = open(self.index_path, 'ab')
+        return True
+
+    def write(self, timestamp: float, landmarks: np.ndarray, rep_count: int, state: ExerciseState,
+              angles: Dict[str, float], errors: List[dict]):
+        """
+        Record one analysed frame
+
+        Args:
+            timestamp: Frame time in seconds since epoch
+            landmarks: (33, 4) array of x, y, z, visibility
+            rep_count: Rep count after the frame
+            state: Counter state after the frame
+            angles: Angles/features of the frame (AngleCalculator.get_angles)
+            errors: Errors reported for the frame
+        """
+        if self._file is None:
+            return
+
+        i = self._buffered
+        row = self._rows[i]
+        self._times[i] = int(round((timestamp - self.started_at) * 1000.0))
+        row[0] = rep_count
+        row[1] = _STATE_INDEX.get(state, -1)
+        mask = 0
+        for error in errors:
+            mask |= self._error_bits.get(error.get('name'), 0)
+        row[2] = np.uint16(mask).view(np.int16)
+
+        row[FIXED_COLUMNS:FIXED_COLUMNS + LANDMARK_COLUMNS] = _quantize(
+            np.asarray(landmarks, dtype=np.float32).reshape(-1), self._landmark_scales
+        )
+        values = self._values
+        values.fill(np.nan)
+        for name, value in angles.items():
+            j = self._value_index.get(name)
+            if j is not None and value is not None:
+                values[j] = value
+        row[FIXED_COLUMNS + LANDMARK_COLUMNS:] = _quantize(values, self._value_scales)
+
+        self._buffered += 1
+        self.frames += 1
+        if self._buffered == self.chunk_frames:
+            self.flush()
+
+    def flush(self):
+        """Compress and append the buffered frames as one chunk"""
+        n = self._buffered
+        if self._file is None or n == 0:
+            return
+
+        times = self._times[:n]
+        rows = self._rows[:n]
+        time_deltas = np.diff(times, prepend=np.int32(0)).astype(np.int32)
+        # Wrapping int16 subtraction; np.cumsum in int16 restores the exact values
+        row_deltas = np.empty_like(rows)
+        row_deltas[0] = rows[0]
+        np.subtract(rows[1:], rows[:-1], out=row_deltas[1:])
+        planes = np.ascontiguousarray(row_deltas.T).view(np.uint8).reshape(-1, n, 2).transpose(2, 0, 1)
+        # (low/high byte, column, frame)
+        payload = zlib.compress(time_deltas.tobytes() + np.ascontiguousarray(planes).tobytes(), 6)
+
+        self._file.seek(0, os.SEEK_END)
+        offset = self._file.tell()
+        self._file.write(payload)
+        self._file.flush()
+        entry = np.array(
+            [(offset, len(payload), self.frames - n, n, times[0], times[-1])], dtype=INDEX_DTYPE
+        )
+        self._index.write(entry.tobytes())
+        self._index.flush()
+
+        self._buffered = 0
+        self.chunks += 1
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self.abort()
+
+    def abort(self):
+        """Close without writing the buffered frames"""
+        if self._file is not None:
+            self._file.close()
+            self._index.close()
+            self._file = None
+            self._index = None
+            self._buffered = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_track(directory: Union[str, Path], name: Union[str, int], exercise_type: str,
+               started_at: Optional[float] = None, append: bool = False) -> TrackWriter:
+    """Start (or continue) the track <directory>/<name>.track (name is usually the session id)"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    return TrackWriter(directory / f"{name}.track", exercise_type, started_at, append=append)
+
+
+class TrackFrames(NamedTuple):
+    """Decoded frames of a track (one row per frame)"""
+    times: np.ndarray      # (n,) float64 seconds since epoch
+    rep_count: np.ndarray  # (n,) int16
+    state: np.ndarray      # (n,) int16 index into STATES
+    errors: np.ndarray     # (n,) uint16 error bitmask
+    landmarks: np.ndarray  # (n, 33, 4) float32
+    values: np.ndarray     # (n, V) float32, NaN where missing
+
+
+class Track:
+    """
+    Read access to a track file
+
+    The data file and the index are memory-mapped; chunks are decompressed on demand.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        Raises:
+            ValueError: If the file is not a session track
+        """
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._parse_header()
+            self.index = self._load_index(Path(f"{self.path}.idx"))
+        except Exception:
+            self._data.close()
+            raise
+        self._width = FIXED_COLUMNS + LANDMARK_COLUMNS + len(self.value_names)
+
+    def _parse_header(self):
+        data = self._data
+        if len(data) < _HEADER.size:
+            raise ValueError("Not a session track (file too short)")
+        magic, version, self.started_at, self.chunk_frames = _HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a session track (magic {magic!r}, version {version})")
+
+        offset = _HEADER.size
+
+        def take(size: int):
+            # The file may end inside the header (crash while it was written, damaged file)
+            nonlocal offset
+            if offset + size > len(data):
+                raise ValueError("Not a session track (truncated header)")
+            start = offset
+            offset += size
+            return data[start:offset]
+
+        def string():
+            length = take(1)[0]
+            return take(length).decode('utf-8')
+
+        def names():
+            n = take(1)[0]
+            return [string() for _ in range(n)]
+
+        self.exercise_type = string()
+        angle_names = names()
+        feature_names = names()
+        self.error_names = names()
+        self.value_names = angle_names + feature_names
+        self._value_scales = _value_scales(len(angle_names), len(feature_names))
+
+    def _load_index(self, index_path: Path) -> np.ndarray:
+        size = index_path.stat().st_size if index_path.exists() else 0
+        if size < _INDEX_HEADER.size:
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        with open(index_path, 'rb') as f:
+            magic, version = _INDEX_HEADER.unpack(f.read(_INDEX_HEADER.size))
+        if magic != INDEX_MAGIC or version != VERSION:
+            raise ValueError(f"Not a session track index (magic {magic!r}, version {version})")
+
+        entries = (size - _INDEX_HEADER.size) // INDEX_DTYPE.itemsize
+        if entries == 0:
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        index = np.memmap(index_path, dtype=INDEX_DTYPE, mode='r', offset=_INDEX_HEADER.size, shape=(entries,))
+        # Ignore entries pointing past the data (index written, data truncated)
+        complete = index['offset'] + index['size'] <= len(self._data)
+        return index if complete.all() else index[:int(np.argmin(complete))]
+
+    def __len__(self) -> int:
+        if not len(self.index):
+            return 0
+        last = self.index[-1]
+        return int(last['first_frame'] + last['frames'])
+
+    @property
+    def duration(self) -> float:
+        """Seconds between the first and last recorded frame"""
+        if not len(self.index):
+            return 0.0
+        return (int(self.index[-1]['last_ms']) - int(self.index[0]['first_ms'])) / 1000.0
+
+    def chunk(self, i: int) -> TrackFrames:
+        """Decode chunk i"""
+        entry = self.index[i]
+        start = int(entry['offset'])
+        n = int(entry['frames'])
+        raw = zlib.decompress(self._data[start:start + int(entry['size'])])
+
+        time_deltas = np.frombuffer(raw, dtype=np.int32, count=n)
+        planes = np.frombuffer(raw, dtype=np.uint8, offset=n * 4).reshape(2, self._width, n)
+        row_deltas = np.ascontiguousarray(planes.transpose(1, 2, 0)).view(np.int16)[:, :, 0].T
+        times = np.cumsum(time_deltas, dtype=np.int32)
+        rows = np.cumsum(row_deltas, axis=0, dtype=np.int16)
+
+        landmarks = rows[:, FIXED_COLUMNS:FIXED_COLUMNS + LANDMARK_COLUMNS].reshape(n, NUM_LANDMARKS, 4)
+        landmarks = landmarks / LANDMARK_SCALES
+        values_q = rows[:, FIXED_COLUMNS + LANDMARK_COLUMNS:]
+        values = values_q / self._value_scales
+        values[values_q == MISSING] = np.nan
+        return TrackFrames(
+            times=self.started_at + times / 1000.0,
+            rep_count=rows[:, 0].copy(),
+            state=rows[:, 1].copy(),
+            errors=rows[:, 2].view(np.uint16).copy(),
+            landmarks=landmarks,
+            values=values,
+        )
+
+    def read(self, start: int = 0, stop: Optional[int] = None) -> TrackFrames:
+        """Decode frames [start, stop) (the whole track by default)"""
+        stop = len(self) if stop is None else min(stop, len(self))
+        if start >= stop:
+            return self._empty()
+
+        first = self.index['first_frame']
+        chunks = range(max(0, int(np.searchsorted(first, start, side='right')) - 1),
+                       int(np.searchsorted(first, stop, side='left')))
+        decoded = [self.chunk(i) for i in chunks]
+        skip = start - int(first[chunks[0]])
+        return TrackFrames(*(np.concatenate(column)[skip:skip + stop - start] for column in zip(*decoded)))
+
+    def _empty(self) -> TrackFrames:
+        return TrackFrames(
+            np.zeros(0), np.zeros(0, np.int16), np.zeros(0, np.int16), np.zeros(0, np.uint16),
+            np.zeros((0, NUM_LANDMARKS, 4), np.float32), np.zeros((0, len(self.value_names)), np.float32)
+        )
+
+    def state_names(self, states: np.ndarray) -> List[str]:
+        return [STATES[s].value if 0 <= s < len(STATES) else '' for s in states]
+
+    def error_list(self, mask: int) -> List[str]:
+        return [name for i, name in enumerate(self.error_names) if mask & (1 << i)]
+
+    def close(self):
+        self.index = None
+        self._data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_track(path: Union[str, Path]) -> Track:
+    """Open a track file for reading"""
+    return Track(path)
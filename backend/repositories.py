@@ -0,0 +1,337 @@
+"""
+Data Access Layer
+Repository classes for users, sessions, session errors and exercise limits
+
+Every query method is declared as a plain blocking function of a pooled connection and exposed
+as a coroutine: awaiting it runs the function on a bounded thread pool (DataAccess), so a slow
+query never stalls the event loop that drives the live exercise WebSockets. The thread pool is
+one thread smaller than the connection pool, leaving a connection for the session writer, so a
+query thread only waits for a connection while startup (init_db / check_db) holds one.
+
+    user = await user_repo.profile(user_id)
+"""
+
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from db import ConnectionPool
+from metrics import Histogram
+
+DB_QUERY_SECONDS = Histogram(
+    'db_query_seconds', 'Time from awaiting a repository query to its result', ('query',)
+)
+
+
+class DataAccess:
+    """Runs blocking queries on a bounded thread pool, each with a connection from the pool"""
+
+    def __init__(self, pool: ConnectionPool, threads: Optional[int] = None):
+        """
+        Args:
+            pool: Connection pool the queries use
+            threads: Query threads (default and maximum: the pool size minus the connection
+                reserved for the session writer, at least 1)
+        """
+        self.pool = pool
+        limit = max(1, pool.size - 1)
+        self.threads = min(threads or limit, limit)
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='db')
+
+    def _call(self, fn: Callable, args: Tuple, kwargs: Dict[str, Any]):
+        conn = self.pool.connect()
+        try:
+            return fn(conn, *args, **kwargs)
+        finally:
+            conn.close()
+
+    async def run(self, name: str, fn: Callable, *args, **kwargs):
+        """Await fn(conn, *args, **kwargs) run on a query thread"""
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self._call, fn, args, kwargs)
+        finally:
+            DB_QUERY_SECONDS.labels(name).observe(time.perf_counter() - start)
+
+    def shutdown(self):
+        """Finish the running queries and stop the threads"""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def query(method: Callable) -> Callable:
+    """Expose `method(self, conn, *args)` as a coroutine `method(self, *args)` run by DataAccess"""
+    name = method.__qualname__
+
+    @functools.wraps(method)
+    async def run(self: 'Repository', *args, **kwargs):
+        return await self.data.run(name, functools.partial(method, self), *args, **kwargs)
+
+    return run
+
+
+class Repository:
+    def __init__(self, data: DataAccess):
+        self.data = data
+
+
+class UserRepository(Repository):
+    # Columns a patient may change through the profile form
+    PROFILE_FIELDS = ('age', 'gender', 'height_cm', 'weight_kg', 'bmi', 'medical_conditions',
+                      'mobility_level', 'pain_level')
+
+    @query
+    def authenticate(self, conn, username: str, password_hash: str) -> Optional[Tuple]:
+        """(id, username, role, full_name, age, gender, doctor_id) or None"""
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, username, role, full_name, age, gender, doctor_id
+            FROM users WHERE username = %s AND password_hash = %s
+        """, (username, password_hash))
+        return cursor.fetchone()
+
+    @query
+    def create(self, conn, username: str, password_hash: str, role: str, full_name: str,
+               age: Optional[int], gender: Optional[str], doctor_id: Optional[int]) -> int:
+        """
+        Returns:
+            The new user's id
+
+        Raises:
+            mysql.connector.IntegrityError: Username already exists
+        """
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO users (username, password_hash, role, full_name, age, gender, created_at, doctor_id)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """, (username, password_hash, role, full_name, age, gender, datetime.now().isoformat(), doctor_id))
+        conn.commit()
+        return cursor.lastrowid
+
+    @query
+    def profile(self, conn, user_id: int) -> Optional[Dict[str, Any]]:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT id, username, full_name, age, gender, height_cm, weight_kg, bmi,
+                   medical_conditions, injury_type, mobility_level, pain_level,
+                   doctor_notes, contraindicated_exercises, role
+            FROM users
+            WHERE id = %s
+        """, (user_id,))
+        return cursor.fetchone()
+
+    @query
+    def biometrics(self, conn, user_id: int) -> Optional[Dict[str, Any]]:
+        """The profile fields the personalization engine uses"""
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT age, gender, height_cm, weight_kg, bmi, medical_conditions,
+                   injury_type, mobility_level, pain_level
+            FROM users
+            WHERE id = %s
+        """, (user_id,))
+        return cursor.fetchone()
+
+    @query
+    def update_profile(self, conn, user_id: int, fields: Dict[str, Any]):
+        """
+        Raises:
+            ValueError: A field is not in PROFILE_FIELDS
+        """
+        unknown = set(fields) - set(self.PROFILE_FIELDS)
+        if unknown:
+            raise ValueError(f"Not profile fields: {sorted(unknown)}")
+        if not fields:
+            return
+        cursor = conn.cursor()
+        cursor.execute(
+            f"UPDATE users SET {', '.join(f'{name} = %s' for name in fields)} WHERE id = %s",
+            (*fields.values(), user_id)
+        )
+        conn.commit()
+
+    @query
+    def is_patient_of(self, conn, patient_id: int, doctor_id: int) -> bool:
+        """Whether the patient is assigned to the doctor"""
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT 1 FROM users WHERE id = %s AND role = 'patient' AND doctor_id = %s
+        """, (patient_id, doctor_id))
+        return cursor.fetchone() is not None
+
+    @query
+    def patients_of(self, conn, doctor_id: int) -> List[Dict[str, Any]]:
+        """
+        The doctor's patients, each with its latest session (or None) as 'last_session' and its
+        number of sessions as 'session_count' - one query whatever the number of patients
+
+        The latest session is looked up per patient on the (patient_id, start_time, id) index,
+        so it always reflects the sessions table as it is (also after manage_db deletions).
+        """
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT u.id, u.username, u.full_name, u.age, u.gender, u.created_at,
+                   s.start_time, s.exercise_name, s.accuracy, COALESCE(c.session_count, 0)
+            FROM users u
+            LEFT JOIN sessions s ON s.id = (
+                SELECT id
+                FROM sessions
+                WHERE patient_id = u.id
+                ORDER BY start_time DESC, id DESC
+                LIMIT 1
+            )
+            LEFT JOIN (
+                SELECT patient_id, COUNT(*) AS session_count
+                FROM sessions
+                WHERE patient_id IN (SELECT id FROM users WHERE role = 'patient' AND doctor_id = %s)
+                GROUP BY patient_id
+            ) c ON c.patient_id = u.id
+            WHERE u.role = 'patient' AND u.doctor_id = %s
+            ORDER BY u.full_name
+        """, (doctor_id, doctor_id))
+
+        return [{
+            'id': row[0],
+            'username': row[1],
+            'full_name': row[2],
+            'age': row[3],
+            'gender': row[4],
+            'created_at': row[5],
+            'last_session': {
+                'date': row[6],
+                'exercise': row[7],
+                'accuracy': row[8]
+            } if row[6] is not None else None,
+            'session_count': row[9]
+        } for row in cursor.fetchall()]
+
+
+class SessionRepository(Repository):
+    @query
+    def create(self, conn, patient_id: int, exercise_name: str, start_time: datetime) -> int:
+        """Insert a started session and return its id"""
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO sessions (patient_id, exercise_name, start_time)
+            VALUES (%s, %s, %s)
+        """, (patient_id, exercise_name, start_time.isoformat()))
+        conn.commit()
+        return cursor.lastrowid
+
+    @query
+    def history(self, conn, patient_id: int, limit: int,
+                before: Optional[Tuple[str, int]] = None) -> List[Dict[str, Any]]:
+        """
+        A page of the patient's sessions, latest first, each with its (error_name, count, severity)
+        rows as 'errors' - one query, served by the (patient_id, start_time, id) index
+
+        Args:
+            before: (start_time, id) of the last session of the previous page (keyset cursor)
+        """
+        keyset, params = "", [patient_id]
+        if before is not None:
+            keyset = "AND (start_time < %s OR (start_time = %s AND id < %s))"
+            params += [before[0], before[0], before[1]]
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT s.id, s.exercise_name, s.start_time, s.total_reps, s.correct_reps, s.accuracy,
+                   s.duration_seconds, se.error_name, se.count, se.severity
+            FROM (
+                SELECT id, exercise_name, start_time, total_reps, correct_reps, accuracy, duration_seconds
+                FROM sessions
+                WHERE patient_id = %s {keyset}
+                ORDER BY start_time DESC, id DESC
+                LIMIT %s
+            ) s
+            LEFT JOIN session_errors se ON se.session_id = s.id
+            ORDER BY s.start_time DESC, s.id DESC, se.id
+        """, (*params, limit))
+
+        sessions: Dict[int, Dict[str, Any]] = {}
+        for row in cursor.fetchall():
+            session = sessions.get(row[0])
+            if session is None:
+                session = sessions[row[0]] = {
+                    'id': row[0],
+                    'exercise_name': row[1],
+                    'start_time': row[2],
+                    'total_reps': row[3],
+                    'correct_reps': row[4],
+                    'accuracy': row[5],
+                    'duration_seconds': row[6],
+                    'errors': []
+                }
+            if row[7] is not None:
+                session['errors'].append(row[7:10])
+        return list(sessions.values())
+
+    @query
+    def scores(self, conn, patient_id: int, exercise_name: str, limit: int) -> Dict[int, Dict[str, Any]]:
+        """Recorded scores of the patient's latest ended sessions of one exercise, by session id"""
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, total_reps, correct_reps, accuracy
+            FROM sessions
+            WHERE patient_id = %s AND exercise_name = %s AND end_time IS NOT NULL
+            ORDER BY start_time DESC
+            LIMIT %s
+        """, (patient_id, exercise_name, limit))
+        return {row[0]: {'total_reps': row[1], 'correct_reps': row[2], 'accuracy': row[3]}
+                for row in cursor.fetchall()}
+
+
+class ErrorRepository(Repository):
+    @query
+    def totals(self, conn, patient_id: int) -> List[Tuple[str, str, int, int]]:
+        """(exercise_name, error_name, total count, sessions with the error) rows of a patient"""
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT
+                s.exercise_name,
+                se.error_name,
+                SUM(se.count) as total_count,
+                COUNT(DISTINCT s.id) as session_count
+            FROM session_errors se
+            JOIN sessions s ON se.session_id = s.id
+            WHERE s.patient_id = %s
+            GROUP BY s.exercise_name, se.error_name
+            ORDER BY s.exercise_name, total_count DESC
+        """, (patient_id,))
+        return cursor.fetchall()
+
+
+class LimitsRepository(Repository):
+    @query
+    def save(self, conn, user_id: int, exercise_type: str, params: Dict[str, Any]):
+        """Store the personalized parameters of a user's exercise (replaces earlier ones)"""
+        now = datetime.now().isoformat()
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO user_exercise_limits
+            (user_id, exercise_type, max_depth_angle, min_raise_angle,
+             max_reps_per_set, recommended_rest_seconds, difficulty_score,
+             injury_risk_score, created_at, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+            max_depth_angle = VALUES(max_depth_angle),
+            min_raise_angle = VALUES(min_raise_angle),
+            max_reps_per_set = VALUES(max_reps_per_set),
+            recommended_rest_seconds = VALUES(recommended_rest_seconds),
+            difficulty_score = VALUES(difficulty_score),
+            injury_risk_score = VALUES(injury_risk_score),
+            updated_at = VALUES(updated_at)
+        """, (
+            user_id,
+            exercise_type,
+            params.get('down_angle'),
+            params.get('up_angle'),
+            params.get('max_reps'),
+            params.get('rest_seconds'),
+            params.get('difficulty_score'),
+            0.0,  # injury_risk_score - will implement later
+            now,
+            now
+        ))
+        conn.commit()
@@ -0,0 +1,115 @@
+"""
+Multi-worker Server Launcher
+Runs the API / WebSocket app in several uvicorn worker processes that share session state
+
+    python serve.py --workers 4
+    python serve.py --workers 4 --session-store sqlite:/var/lib/rehab/sessions.db
+    python serve.py --split --workers 2 --inference-workers 2
+
+The database tables are created once here, before the workers start (REHAB_INIT_DB=0 for the
+workers). Any worker can serve any request: started sessions and their counter checkpoints live
+in the shared session store, so a WebSocket may (re)connect to any worker. The CPU cores are
+split between the workers' pose-inference processes unless POSE_WORKERS is set. Session tracks and
+the SQLite session store live in REHAB_DATA_DIR (default ~/.rehab_system), outside the directory
+served under /static.
+
+With --split the REST API (REHAB_SERVICE=api, which never starts the vision stack) and the
+exercise WebSocket (REHAB_SERVICE=inference, on --inference-port) run as two separate uvicorn
+servers, each with its own worker count; the frontend connects its WebSocket to the inference
+port (VITE_WS_URL).
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import uvicorn
+
+
+def _uvicorn_command(host: str, port: int, workers: int):
+    return [sys.executable, '-m', 'uvicorn', 'main:app', '--host', host, '--port', str(port),
+            '--workers', str(workers)]
+
+
+def _run_split(args, api_workers: int, inference_workers: int):
+    """Run the API and inference tiers as two uvicorn servers until either exits"""
+    tiers = [
+        ('api', args.port, api_workers),
+        ('inference', args.inference_port, inference_workers),
+    ]
+    servers = [
+        subprocess.Popen(_uvicorn_command(args.host, port, workers), env={**os.environ, 'REHAB_SERVICE': service})
+        for service, port, workers in tiers
+    ]
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))  # e.g. from a process manager
+    try:
+        os.wait()  # Either tier stopping stops the deployment
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # A second Ctrl+C must not abandon the servers
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        for server in servers:
+            if server.poll() is None:
+                server.terminate()
+        for server in servers:
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_WORKERS', 1)),
+                        help="Web worker processes (default: WEB_WORKERS or 1); with --split, REST API workers")
+    parser.add_argument('--session-store', default=os.environ.get('SESSION_STORE'),
+                        help="'memory' or 'sqlite:<path>', relative to REHAB_DATA_DIR "
+                             "(default with several workers: sqlite:session_state.db)")
+    parser.add_argument('--split', action='store_true',
+                        help="Serve the REST API and the exercise WebSocket from separate processes")
+    parser.add_argument('--inference-port', type=int, default=8001,
+                        help="Port of the exercise WebSocket with --split (default: 8001)")
+    parser.add_argument('--inference-workers', type=int, default=int(os.environ.get('INFERENCE_WORKERS', 1)),
+                        help="WebSocket worker processes with --split (default: INFERENCE_WORKERS or 1)")
+    args = parser.parse_args()
+
+    workers = max(1, args.workers)
+    inference_workers = max(1, args.inference_workers) if args.split else workers
+    shared = args.split or workers > 1
+    store = args.session_store or ('sqlite:session_state.db' if shared else 'memory')
+    if shared and store == 'memory':
+        parser.error("--session-store memory cannot be shared by several processes")
+    os.environ['SESSION_STORE'] = store
+    if 'POSE_WORKERS' not in os.environ:
+        os.environ['POSE_WORKERS'] = str(max(1, ((os.cpu_count() or 2) - 1) // inference_workers))
+
+    # Create the tables and default accounts once, waiting for MySQL like the workers do; the
+    # workers then only check the connection
+    import main as app_module
+    for delay in app_module.database_retry_delays():
+        try:
+            app_module.init_db()
+            break
+        except Exception as e:
+            app_module.log.warning('database_unavailable', error=str(e), retry_in=delay)
+            time.sleep(delay)
+    os.environ['REHAB_INIT_DB'] = '0'
+
+    if args.split:
+        print(f"Rehab System: REST API {workers} worker(s) http://{args.host}:{args.port}, "
+              f"WebSocket {inference_workers} worker(s) ws://{args.host}:{args.inference_port}, "
+              f"session store {store}, {os.environ['POSE_WORKERS']} pose worker(s) each")
+        _run_split(args, workers, inference_workers)
+        return
+
+    print(f"Rehab System: {workers} worker(s), session store {store}, "
+          f"{os.environ['POSE_WORKERS']} pose worker(s) each, http://{args.host}:{args.port}")
+    uvicorn.run('main:app', host=args.host, port=args.port, workers=workers)
+
+
+if __name__ == '__main__':
+    main()
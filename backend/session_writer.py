@@ -0,0 +1,226 @@
+"""
+Session Write-Behind
+Background thread that persists downsampled session_frames rows and end-of-session summaries,
+so database latency never reaches the frame loop or the end-session response
+
+- Frame rows go into a bounded buffer and are inserted in batches with executemany. When the
+  buffer is full (database slow or down) new rows are dropped and counted, never waited for.
+- A summary (sessions UPDATE + session_errors rows) is written in a single transaction, after
+  any frame rows of the session that were queued before it. Failed summaries are retried.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from logs import EventLogger
+from metrics import Counter, Gauge, Histogram
+
+log = EventLogger('session_writer')
+
+DB_WRITE_QUEUE = Gauge('db_write_queue_frames', 'session_frames rows waiting to be written')
+DB_WRITE_SECONDS = Histogram('db_write_seconds', 'Latency of background database writes', ('kind',))
+DB_FRAME_ROWS_WRITTEN = Counter('db_frame_rows_written_total', 'session_frames rows inserted')
+DB_FRAME_ROWS_DROPPED = Counter('db_frame_rows_dropped_total', 'session_frames rows dropped (buffer full or write failed)')
+DB_SUMMARIES_WRITTEN = Counter('db_session_summaries_written_total', 'Session summaries committed')
+DB_WRITE_ERRORS = Counter('db_write_errors_total', 'Background database writes that failed', ('kind',))
+
+
+class SessionSummary(NamedTuple):
+    session_id: int
+    end_time: str
+    total_reps: int
+    correct_reps: int
+    accuracy: float
+    duration_seconds: int
+    errors: Dict[str, Dict[str, Any]]  # error name -> {'count', 'severity'}
+
+
+class SessionWriter:
+    """Batches session_frames inserts and session summaries on one background thread"""
+
+    def __init__(self, connect: Callable[[], Any], frame_interval: float = 1.0, max_pending_frames: int = 20000,
+                 batch_size: int = 500, flush_interval: float = 1.0, max_attempts: int = 5):
+        """
+        Args:
+            connect: Opens a DB-API connection (e.g. db.pool.connect); the writer thread closes it
+                after every flush
+            frame_interval: Store at most one frame row per session every this many seconds
+                (0 stores every analysed frame, negative stores none)
+            max_pending_frames: Frame rows buffered before new ones are dropped
+            batch_size: Frame rows that trigger a flush before flush_interval elapses
+            flush_interval: Longest time a queued row or summary waits, in seconds
+            max_attempts: Times a summary is tried before it is given up
+        """
+        self.connect = connect
+        self.frame_interval = frame_interval
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+
+        self._frames: Deque[Tuple] = deque()
+        self._max_pending = max_pending_frames
+        self._summaries: List[Tuple[SessionSummary, int]] = []
+        self._last_row_at: Dict[int, float] = {}
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._conn = None
+
+    # ----- producers (event loop) -----
+
+    def add_frame(self, session_id: int, timestamp: float, rep_count: int, angles: Dict[str, float],
+                  errors: List[Dict[str, Any]]) -> bool:
+        """
+        Queue a session_frames row, subject to the frame_interval downsampling
+
+        Returns:
+            True if the row was queued
+        """
+        if self.frame_interval < 0:
+            return False
+        last = self._last_row_at.get(session_id)
+        if last is not None and timestamp - last < self.frame_interval:
+            return False
+        if len(self._frames) >= self._max_pending:
+            DB_FRAME_ROWS_DROPPED.inc()
+            return False
+        self._last_row_at[session_id] = timestamp
+        # Serialised on the writer thread; angles/errors are fresh objects every frame
+        self._frames.append((session_id, timestamp, rep_count, angles, errors))
+        DB_WRITE_QUEUE.set(len(self._frames))
+        if len(self._frames) >= self.batch_size:
+            with self._cond:
+                self._cond.notify()
+        return True
+
+    def add_summary(self, summary: SessionSummary):
+        """Queue a session's summary; its queued frame rows are written first"""
+        self._last_row_at.pop(summary.session_id, None)
+        with self._cond:
+            self._summaries.append((summary, 0))
+            self._cond.notify()
+
+    # ----- lifecycle -----
+
+    def start(self):
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='session-writer', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Flush what is queued and stop the thread"""
+        if self._thread is None:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        self._thread = None
+        self._close_connection()
+
+    def pending(self) -> Tuple[int, int]:
+        """(frame rows, summaries) waiting to be written"""
+        return len(self._frames), len(self._summaries)
+
+    # ----- writer thread -----
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._stopping and not self._summaries and len(self._frames) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                stopping = self._stopping
+                summaries, self._summaries = self._summaries, []
+
+            # Frame rows queued before these summaries go first
+            frames = [self._frames.popleft() for _ in range(len(self._frames))]
+            DB_WRITE_QUEUE.set(len(self._frames))
+            if frames:
+                self._write_frames(frames)
+            retry = [(s, attempts) for s, attempts in (self._write_summary(s, a) for s, a in summaries) if s]
+            self._close_connection()  # Back to the pool until the next flush
+
+            with self._cond:
+                self._summaries[:0] = retry
+            if stopping and not retry and not self._frames:
+                return
+            if retry:
+                time.sleep(min(self.flush_interval, 1.0))  # Database down: back off before retrying
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = self.connect()
+        return self._conn
+
+    def _close_connection(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _write_frames(self, frames: List[Tuple]):
+        rows = [
+            (session_id, datetime.fromtimestamp(timestamp).isoformat(), rep_count,
+             json.dumps({k: round(v, 1) if isinstance(v, (int, float)) else v for k, v in angles.items()}),
+             json.dumps([e['name'] for e in errors], ensure_ascii=False))
+            for session_id, timestamp, rep_count, angles, errors in frames
+        ]
+        start = time.perf_counter()
+        try:
+            conn = self._connection()
+            cursor = conn.cursor()
+            cursor.executemany("""
+                INSERT INTO session_frames (session_id, timestamp, rep_count, angles, errors)
+                VALUES (%s, %s, %s, %s, %s)
+            """, rows)
+            conn.commit()
+            DB_FRAME_ROWS_WRITTEN.inc(len(rows))
+        except Exception as e:
+            DB_WRITE_ERRORS.labels('frames').inc()
+            DB_FRAME_ROWS_DROPPED.inc(len(rows))
+            log.error('frame_rows_dropped', rows=len(rows), error=str(e))
+            self._close_connection()
+        DB_WRITE_SECONDS.labels('frames').observe(time.perf_counter() - start)
+
+    def _write_summary(self, summary: SessionSummary, attempts: int):
+        """Returns (summary, attempts) to retry, or (None, 0) once committed or given up"""
+        start = time.perf_counter()
+        try:
+            conn = self._connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE sessions
+                SET end_time = %s, total_reps = %s, correct_reps = %s, accuracy = %s, duration_seconds = %s
+                WHERE id = %s
+            """, (summary.end_time, summary.total_reps, summary.correct_reps, summary.accuracy,
+                  summary.duration_seconds, summary.session_id))
+            if summary.errors:
+                cursor.executemany("""
+                    INSERT INTO session_errors (session_id, error_name, count, severity)
+                    VALUES (%s, %s, %s, %s)
+                """, [(summary.session_id, name, info['count'], info['severity']) for name, info in summary.errors.items()])
+            conn.commit()
+            DB_SUMMARIES_WRITTEN.inc()
+            return None, 0
+        except Exception as e:
+            DB_WRITE_ERRORS.labels('summary').inc()
+            try:
+                if self._conn is not None:
+                    self._conn.rollback()
+            except Exception:
+                pass
+            self._close_connection()
+            attempts += 1
+            if attempts >= self.max_attempts:
+                log.error('summary_not_saved', session=summary.session_id, attempts=attempts, error=str(e))
+                return None, 0
+            return summary, attempts
+        finally:
+            DB_WRITE_SECONDS.labels('summary').observe(time.perf_counter() - start)
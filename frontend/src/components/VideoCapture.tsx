@@ -3,7 +3,7 @@ import type { Landmark } from '../types';
 
 interface VideoCaptureProps {
   isActive: boolean;
-  onFrame: (frameData: string) => void;
+  onFrame: (frame: Blob, captureTs: number) => void;
   landmarks?: Landmark[];
   feedback?: string;
   repCount?: number;
@@ -95,9 +95,11 @@ export const VideoCapture = ({
         // Draw video frame
         ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
 
-        // Send frame for processing
-        const frameData = canvas.toDataURL('image/jpeg', 0.8);
-        onFrame(frameData);
+        // Send frame for processing (raw JPEG bytes, sent as a binary WebSocket message)
+        const captureTs = Date.now();
+        canvas.toBlob((blob) => {
+          if (blob) onFrame(blob, captureTs);
+        }, 'image/jpeg', 0.8);
       }
 
       frameIdRef.current = requestAnimationFrame(captureFrame);
@@ -1,5 +1,8 @@
 import { useState, useEffect, useCallback, useRef } from 'react';
 import type { AnalysisResult } from '../types';
+import { encodeFrameMessage, decodeAnalysisMessage } from '../utils/frameProtocol';
+
+const WS_BASE_URL = import.meta.env.VITE_WS_URL || 'ws://localhost:8000';
 
 interface CustomThresholds {
   down_angle?: number;
@@ -10,11 +13,17 @@ interface CustomThresholds {
 export const useWebSocket = (
   exerciseType: string,
   isActive: boolean,
-  customThresholds?: CustomThresholds
+  customThresholds?: CustomThresholds,
+  sessionId?: number | null
 ) => {
   const [isConnected, setIsConnected] = useState(false);
   const [analysisData, setAnalysisData] = useState<AnalysisResult | null>(null);
   const wsRef = useRef<WebSocket | null>(null);
+  const frameSeqRef = useRef(0);
+  // Reconnects after an unexpected close resume the started session server-side
+  const reconnectTimerRef = useRef<number | null>(null);
+  const reconnectAttemptsRef = useRef(0);
+  const connectRef = useRef<() => void>(() => {});
 
   // Store customThresholds in ref to avoid reconnection
   const customThresholdsRef = useRef(customThresholds);
@@ -26,12 +35,26 @@ export const useWebSocket = (
   const connect = useCallback(() => {
     if (!isActive || wsRef.current) return;
 
-    const wsUrl = `ws://localhost:8000/ws/exercise/${exerciseType}`;
+    // Compact encoding: analysis arrives as binary messages with quantized landmarks
+    // VITE_WS_URL points at the inference service when it runs apart from the API (serve.py --split)
+    let wsUrl = `${WS_BASE_URL}/ws/exercise/${exerciseType}?encoding=compact`;
+    // Bind the connection to the started session so its reps are recorded and summarised
+    const token = localStorage.getItem('token');
+    if (sessionId && token) {
+      wsUrl += `&session_id=${sessionId}`;
+    }
     const ws = new WebSocket(wsUrl);
+    ws.binaryType = 'arraybuffer';
 
     ws.onopen = () => {
       console.log('WebSocket connected');
       setIsConnected(true);
+      reconnectAttemptsRef.current = 0;
+      
+      // The token goes in the first message, not the URL, so it stays out of access logs
+      if (sessionId && token) {
+        ws.send(JSON.stringify({ type: 'auth', token }));
+      }
       
       // Send custom thresholds if available
       if (customThresholdsRef.current) {
@@ -45,9 +68,15 @@ export const useWebSocket = (
 
     ws.onmessage = (event) => {
       try {
-        const data = JSON.parse(event.data);
+        const data = event.data instanceof ArrayBuffer
+          ? decodeAnalysisMessage(event.data)
+          : JSON.parse(event.data);
+        if (!data) return;
         if (data.type === 'analysis') {
           setAnalysisData(data);
+        } else if (data.type === 'resumed') {
+          console.log('Session resumed at rep', data.rep_count);
+          setAnalysisData((prev) => (prev ? { ...prev, rep_count: data.rep_count } : prev));
         }
       } catch (e) {
         console.error('Failed to parse WebSocket message:', e);
@@ -58,32 +87,54 @@ export const useWebSocket = (
       console.error('WebSocket error:', error);
     };
 
-    ws.onclose = () => {
+    ws.onclose = (event) => {
       console.log('WebSocket disconnected');
       setIsConnected(false);
+      if (wsRef.current !== ws) return; // Closed by disconnect()
       wsRef.current = null;
+
+      // Dropped mid-session: reconnect with backoff (1008 = session ended or not ours)
+      if (sessionId && event.code !== 1008 && reconnectAttemptsRef.current < 5) {
+        const delay = 1000 * 2 ** reconnectAttemptsRef.current;
+        reconnectAttemptsRef.current += 1;
+        reconnectTimerRef.current = window.setTimeout(() => {
+          reconnectTimerRef.current = null;
+          connectRef.current();
+        }, delay);
+      }
     };
 
     wsRef.current = ws;
-  }, [exerciseType, isActive]);
+  }, [exerciseType, isActive, sessionId]);
+
+  useEffect(() => {
+    connectRef.current = connect;
+  }, [connect]);
 
   const disconnect = useCallback(() => {
+    if (reconnectTimerRef.current !== null) {
+      window.clearTimeout(reconnectTimerRef.current);
+      reconnectTimerRef.current = null;
+    }
+    reconnectAttemptsRef.current = 0;
     if (wsRef.current) {
-      wsRef.current.close();
+      const ws = wsRef.current;
       wsRef.current = null;
+      ws.close();
       setIsConnected(false);
     }
   }, []);
 
-  const sendFrame = useCallback((frameData: string) => {
-    if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
-      wsRef.current.send(
-        JSON.stringify({
-          type: 'frame',
-          data: frameData,
-        })
-      );
-    }
+  // Frames go out as binary messages: small header + raw JPEG bytes (no base64/JSON)
+  const sendFrame = useCallback(async (frame: Blob, captureTs: number = Date.now()) => {
+    const ws = wsRef.current;
+    if (!ws || ws.readyState !== WebSocket.OPEN) return;
+
+    const image = await frame.arrayBuffer();
+    if (ws.readyState !== WebSocket.OPEN) return;
+
+    frameSeqRef.current = (frameSeqRef.current + 1) >>> 0;
+    ws.send(encodeFrameMessage(frameSeqRef.current, captureTs, image));
   }, []);
 
   const resetCounter = useCallback(() => {
@@ -49,7 +49,8 @@ export const ExercisePage = () => {
   const { isConnected, analysisData, sendFrame, resetCounter } = useWebSocket(
     selectedExercise || 'squat',
     isExercising,
-    customThresholds
+    customThresholds,
+    sessionId
   );
 
   useEffect(() => {
@@ -28,6 +28,13 @@ export interface AnalysisResult {
   feedback?: string;
   hold_time_remaining?: number;
   current_side?: 'left' | 'right';
+  seq?: number;
+  capture_ts?: number;
+  stats?: {
+    received: number;
+    processed: number;
+    dropped: number;
+  };
 }
 
 // ============= USER & AUTH TYPES =============
@@ -38,6 +38,7 @@ export interface Patient extends User {
     exercise: string;
     accuracy: number;
   };
+  session_count?: number;
 }
 
 export interface Exercise {
@@ -0,0 +1,89 @@
+import type { AnalysisResult, Landmark } from '../types';
+
+// Binary frame protocol for /ws/exercise/{exercise_type}
+// Must match backend/pose_engine/protocol.py:
+//   [u8 type=1][u32 seq][f64 capture_ts ms][u8 format][image bytes...]  (little-endian)
+
+export const MSG_FRAME = 1;
+export const FORMAT_JPEG = 1;
+export const FRAME_HEADER_SIZE = 14;
+
+export const encodeFrameMessage = (
+  seq: number,
+  captureTs: number,
+  image: ArrayBuffer,
+  format: number = FORMAT_JPEG
+): ArrayBuffer => {
+  const buffer = new ArrayBuffer(FRAME_HEADER_SIZE + image.byteLength);
+  const view = new DataView(buffer);
+  view.setUint8(0, MSG_FRAME);
+  view.setUint32(1, seq >>> 0, true);
+  view.setFloat64(5, captureTs, true);
+  view.setUint8(13, format);
+  new Uint8Array(buffer, FRAME_HEADER_SIZE).set(new Uint8Array(image));
+  return buffer;
+};
+
+// Compact analysis responses (?encoding=compact), see backend/pose_engine/protocol.py:
+//   [u8 type=2][u8 flags][u32 seq][f64 capture_ts][u16 rep_count][u8 state][u8 N][u16 M]
+//   [M bytes meta JSON][N * 4 int16 landmarks / LANDMARK_SCALE]
+
+export const MSG_ANALYSIS = 2;
+export const ANALYSIS_HEADER_SIZE = 20;
+export const LANDMARK_SCALE = 8192;
+
+const FLAG_POSE_DETECTED = 0x01;
+const FLAG_HAS_SEQ = 0x02;
+
+const STATE_NAMES = [
+  'down', 'raising', 'up', 'lowering',
+  'ready', 'lifting', 'holding', 'switch_side', 'complete',
+] as const;
+
+const textDecoder = new TextDecoder();
+
+export const decodeAnalysisMessage = (buffer: ArrayBuffer): AnalysisResult | null => {
+  const view = new DataView(buffer);
+  if (buffer.byteLength < ANALYSIS_HEADER_SIZE || view.getUint8(0) !== MSG_ANALYSIS) return null;
+
+  const flags = view.getUint8(1);
+  const stateCode = view.getUint8(16);
+  const landmarkCount = view.getUint8(17);
+  const metaLength = view.getUint16(18, true);
+
+  const meta = JSON.parse(
+    textDecoder.decode(new Uint8Array(buffer, ANALYSIS_HEADER_SIZE, metaLength))
+  );
+
+  const result: AnalysisResult = {
+    ...meta,
+    type: 'analysis',
+    pose_detected: (flags & FLAG_POSE_DETECTED) !== 0,
+  };
+
+  if (result.pose_detected) {
+    result.rep_count = view.getUint16(14, true);
+    if (stateCode < STATE_NAMES.length) result.state = STATE_NAMES[stateCode];
+  }
+
+  if (flags & FLAG_HAS_SEQ) {
+    result.seq = view.getUint32(2, true);
+    result.capture_ts = view.getFloat64(6, true);
+  }
+
+  if (landmarkCount > 0) {
+    const packed = new Int16Array(buffer, ANALYSIS_HEADER_SIZE + metaLength, landmarkCount * 4);
+    const landmarks: Landmark[] = new Array(landmarkCount);
+    for (let i = 0; i < landmarkCount; i++) {
+      landmarks[i] = {
+        x: packed[i * 4] / LANDMARK_SCALE,
+        y: packed[i * 4 + 1] / LANDMARK_SCALE,
+        z: packed[i * 4 + 2] / LANDMARK_SCALE,
+        visibility: packed[i * 4 + 3] / LANDMARK_SCALE,
+      };
+    }
+    result.landmarks = landmarks;
+  }
+
+  return result;
+};
@@ -95,6 +95,7 @@ export interface Patient extends User {
     exercise: string;
     accuracy: number;
   } | null;
+  session_count?: number;
 }
 
 // ============= Chart Data Types =============